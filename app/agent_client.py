@@ -2,18 +2,58 @@
 import json
 import websockets
 from websockets.legacy.client import WebSocketClientProtocol
-from .settings import DG_API_KEY, build_deepgram_settings
+from .settings import DG_API_KEY, DG_AGENT_URL, AGENT_CONNECT_TIMEOUT_S, build_deepgram_settings
 from .agent_functions import FUNCTION_DEFS
+from .tenants import Tenant, DEFAULT
 
-async def connect_agent() -> WebSocketClientProtocol:
+RESUME_NOTE = (
+    "\n\nNOTE: The connection dropped and this conversation is resuming mid-call. "
+    "Do not greet the caller again or restart the order. The conversation so far is in your "
+    "context; the current order state (authoritative, from the tools) is:\n{state}\n"
+    "If the last tool results were never acknowledged, continue from them now."
+)
+
+_settings_json: dict[tuple[Tenant, bool], str] = {}
+
+def _agent_settings(tenant: Tenant) -> dict:
+    s = build_deepgram_settings(prompt=tenant.prompt, voice=tenant.voice, greeting=tenant.greeting)
+    # inject tools under think.functions (Deepgram API requires this nesting)
+    s["agent"]["think"]["functions"] = FUNCTION_DEFS
+    return s
+
+def settings_payload(tenant: Tenant = DEFAULT, greeted: bool = False) -> str:
+    """
+    Settings message for a new call (built and serialized once per tenant).
+    greeted=True: we already played the greeting from cache, so the agent
+    doesn't speak it and only gets it as context.
+    """
+    payload = _settings_json.get((tenant, greeted))
+    if payload is None:
+        s = _agent_settings(tenant)
+        if greeted:
+            s["agent"].pop("greeting", None)
+            s["agent"]["context"] = {"messages": [
+                {"type": "History", "role": "assistant", "content": tenant.greeting}]}
+        payload = _settings_json[(tenant, greeted)] = json.dumps(s)
+    return payload
+
+def resume_settings_payload(history: list[dict], state: dict, tenant: Tenant = DEFAULT) -> str:
+    """Settings for a replacement session: no greeting, prior turns as context, order state in the prompt."""
+    s = _agent_settings(tenant)
+    agent = s["agent"]
+    agent.pop("greeting", None)
+    agent["think"]["prompt"] += RESUME_NOTE.format(state=json.dumps(state, ensure_ascii=False))
+    if history:
+        agent["context"] = {"messages": history}
+    return json.dumps(s)
+
+async def connect_agent(url: str | None = None) -> WebSocketClientProtocol:
     return await websockets.connect(
-        "wss://agent.deepgram.com/v1/agent/converse",
+        url or DG_AGENT_URL,
         subprotocols=["token", DG_API_KEY],
         max_size=2**24,
+        open_timeout=AGENT_CONNECT_TIMEOUT_S,
     )
 
-async def send_agent_settings(ws: WebSocketClientProtocol):
-    s = build_deepgram_settings()
-    # inject tools under think.functions (Deepgram API requires this nesting)
-    s["agent"]["think"]["functions"] = FUNCTION_DEFS
-    await ws.send(json.dumps(s))
+async def send_agent_settings(ws: WebSocketClientProtocol, tenant: Tenant = DEFAULT, greeted: bool = False):
+    await ws.send(settings_payload(tenant, greeted))
@@ -1,16 +1,26 @@
 # agent_functions.py
 from typing import Any, Dict, Optional
 from . import business_logic as bl
+from . import call_session
+from . import eta
+from .orders_store import latest_order_for_phone
+from .tool_args import compile_tools
 
-# --- Session state for the call ---
-session_state: Dict[str, Any] = {
-    "phone_number": None,
-    "order_number": None,   # set after checkout (but not finalized)
-    "phone_confirmed": False,  # track if phone was explicitly confirmed
-    "received_sms_sent": False,  # track if SMS was already sent
-    # staged-but-not-confirmed drink
-    "pending_item": None,   # {"flavor":..., "toppings":[...], "sweetness":..., "ice":..., "addons":[...]}
-}
+# --- Session state: per call (call_session.py) ---
+def _state() -> dict:
+    return call_session.current().state
+
+def call_context(session: call_session.CallSession) -> dict:
+    """Order state of the call, re-injected into a new agent session after a reconnect."""
+    state = session.state
+    return {
+        "cart": [dict(it) for it in session.cart],
+        "pending_item": state.get("pending_item"),
+        "pending_summary": _pending_summary(state.get("pending_item")),
+        "phone_number": state.get("phone_number"),
+        "phone_confirmed": bool(state.get("phone_confirmed")),
+        "order_number": state.get("order_number"),
+    }
 
 # ---------- Helpers ----------
 def _coerce_list(x):
@@ -44,6 +54,7 @@ def _pending_summary(it: Optional[dict]) -> str:
 # ---------- Tool wrappers ----------
 def _stage_item(flavor: str, toppings=None, sweetness: str | None = None, ice: str | None = None, addons=None):
     """Stage a drink (NOT added to cart yet)."""
+    state = _state()
     staged = {
         "flavor": flavor,
         "toppings": _coerce_list(toppings),
@@ -51,12 +62,13 @@ def _stage_item(flavor: str, toppings=None, sweetness: str | None = None, ice: s
         "ice": ice,
         "addons": _coerce_list(addons),
     }
-    session_state["pending_item"] = staged
+    state["pending_item"] = staged
     return {"ok": True, "staged": True, "pending_item": staged, "summary": _pending_summary(staged)}
 
 def _update_pending_item(flavor: str | None = None, toppings=None, sweetness: str | None = None, ice: str | None = None, addons=None):
     """Modify the staged drink before confirmation."""
-    current = session_state.get("pending_item") or {}
+    state = _state()
+    current = state.get("pending_item") or {}
     patch = {}
     if flavor is not None: patch["flavor"] = flavor
     if sweetness is not None: patch["sweetness"] = sweetness
@@ -64,16 +76,18 @@ def _update_pending_item(flavor: str | None = None, toppings=None, sweetness: st
     if toppings is not None: patch["toppings"] = _coerce_list(toppings)
     if addons is not None: patch["addons"] = _coerce_list(addons)
     updated = _merge_item(current, patch)
-    session_state["pending_item"] = updated
+    state["pending_item"] = updated
     return {"ok": True, "staged": True, "pending_item": updated, "summary": _pending_summary(updated)}
 
 def _clear_pending_item():
-    session_state["pending_item"] = None
+    state = _state()
+    state["pending_item"] = None
     return {"ok": True, "cleared": True}
 
 def _confirm_pending_to_cart():
     """Confirm the staged drink -> actually adds to cart via business logic."""
-    staged = session_state.get("pending_item")
+    state = _state()
+    staged = state.get("pending_item")
     if not staged or not staged.get("flavor"):
         return {"ok": False, "error": "No pending drink to confirm."}
     res = bl.add_to_cart(
@@ -84,7 +98,7 @@ def _confirm_pending_to_cart():
         addons=staged.get("addons"),
     )
     if isinstance(res, dict) and res.get("ok"):
-        session_state["pending_item"] = None
+        state["pending_item"] = None
     return res
 
 def _wrap_checkout_order(phone: str | None = None):
@@ -93,17 +107,18 @@ def _wrap_checkout_order(phone: str | None = None):
     Order will be finalized on hangup.
     IMPORTANT: Only generate order number ONCE per call session.
     """
+    state = _state()
     # If order number already exists, don't call checkout again - just return existing
-    if session_state.get("order_number"):
+    if state.get("order_number"):
         return {
             "ok": True,
-            "order_number": session_state["order_number"],
+            "order_number": state["order_number"],
             "already_created": True,
             "message": "Order number already generated for this call"
         }
     
     # Auto-commit any pending item
-    if session_state.get("pending_item"):
+    if state.get("pending_item"):
         _ = _confirm_pending_to_cart()
 
     result = bl.checkout_order(phone=phone)
@@ -111,10 +126,10 @@ def _wrap_checkout_order(phone: str | None = None):
     if isinstance(result, dict) and result.get("ok"):
         # Store order number in session but DON'T persist yet
         if result.get("phone"):
-            session_state["phone_number"] = result["phone"]
-            session_state["phone_confirmed"] = True
+            state["phone_number"] = result["phone"]
+            state["phone_confirmed"] = True
         if result.get("order_number"):
-            session_state["order_number"] = result["order_number"]
+            state["order_number"] = result["order_number"]
         
         # NOTE: We do NOT call add_order() or publish() here
         # That happens on hangup in ws_bridge.py
@@ -122,20 +137,56 @@ def _wrap_checkout_order(phone: str | None = None):
     return result
 
 def _save_phone_number(phone: str):
+    state = _state()
     normalized = bl.normalize_phone(phone)
-    session_state["phone_number"] = normalized
-    session_state["phone_confirmed"] = True
+    state["phone_number"] = normalized
+    state["phone_confirmed"] = True
     return {"ok": True, "phone": normalized}
 
 def _order_is_placed():
     """Let the agent know if an order has already been placed in this call session."""
-    placed = bool(session_state.get("order_number"))
-    return {"placed": placed, "order_number": session_state.get("order_number")}
+    state = _state()
+    placed = bool(state.get("order_number"))
+    return {"placed": placed, "order_number": state.get("order_number")}
 
 def _get_cart():
     """Return current cart contents for the agent to read back."""
     return bl.get_cart()
 
+def _order_eta(order_number: str | None = None):
+    """Live pickup ETA for an order; for an order not in the kitchen queue yet, estimate as if placed now."""
+    state = _state()
+    no = order_number or state.get("order_number")
+    if no:
+        est = eta.eta_for_order(no)
+        if est:
+            return {"ok": True, "order_number": no, **est}
+    drinks = len(call_session.current().cart) + (1 if state.get("pending_item") else 0)
+    return {"ok": True, "order_number": no, "if_placed_now": True, **eta.eta_for_new_order(drinks)}
+
+def _reorder_last():
+    """Put the caller's most recent order (by caller ID) back in the cart in one step."""
+    state = _state()
+    phone = state.get("caller_phone")
+    if not phone:
+        return {"ok": False, "error": "No caller ID on this call. Ask what they'd like instead."}
+    last = state.get("last_order")
+    if last is None:   # prefetch hasn't landed yet
+        last = state["last_order"] = latest_order_for_phone(phone) or False
+    if not last:
+        return {"ok": False, "error": "No previous order found for this number."}
+
+    added, skipped = [], []
+    for it in last.get("items") or []:
+        res = bl.add_to_cart(flavor=it.get("flavor"), toppings=it.get("toppings"),
+                             sweetness=it.get("sweetness"), ice=it.get("ice"), addons=it.get("addons"))
+        if res.get("ok"):
+            added.append(_pending_summary(res["item"]))
+        else:
+            skipped.append({"flavor": it.get("flavor"), "reason": res.get("error")})
+    return {"ok": bool(added), "previous_order": last.get("order_number"), "added": added,
+            "skipped": skipped, "cart_count": len(call_session.current().cart), "caller_phone": phone}
+
 # ---------- Tool definitions ----------
 FUNCTION_DEFS: list[Dict[str, Any]] = [
     {
@@ -192,6 +243,11 @@ FUNCTION_DEFS: list[Dict[str, Any]] = [
     },
 
     # Call/session helpers
+    {
+        "name": "reorder_last",
+        "description": "Add the caller's previous order (looked up by caller ID) to the cart in one step. Use when they ask for their usual or the same as last time.",
+        "parameters": {"type": "object", "properties": {}, "required": []},
+    },
     {
         "name": "order_is_placed",
         "description": "Return whether an order has already been placed in this call session.",
@@ -255,6 +311,15 @@ FUNCTION_DEFS: list[Dict[str, Any]] = [
             "required": [],
         },
     },
+    {
+        "name": "order_eta",
+        "description": "Estimated pickup time (minutes) for an order, based on the live kitchen queue. Defaults to this call's order.",
+        "parameters": {
+            "type": "object",
+            "properties": {"order_number": {"type": "string"}},
+            "required": [],
+        },
+    },
     {
         "name": "extract_phone_and_order",
         "description": "Extract phone and 4-digit order number from free text.",
@@ -285,6 +350,7 @@ FUNCTION_MAP: dict[str, Any] = {
     "confirm_pending_to_cart": _confirm_pending_to_cart,
     "clear_pending_item": _clear_pending_item,
     "get_cart": _get_cart,
+    "reorder_last": _reorder_last,
 
     # Session
     "order_is_placed": _order_is_placed,
@@ -297,6 +363,10 @@ FUNCTION_MAP: dict[str, Any] = {
     # Checkout
     "checkout_order": _wrap_checkout_order,
     "order_status": bl.order_status,
+    "order_eta": _order_eta,
     "extract_phone_and_order": bl.extract_phone_and_order,
     "save_phone_number": _save_phone_number,
-}
\ No newline at end of file
+}
+
+# --- Argument validators, compiled once from FUNCTION_DEFS (see tool_args.py) ---
+TOOL_VALIDATORS = compile_tools(FUNCTION_DEFS)
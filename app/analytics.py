@@ -0,0 +1,262 @@
+# app/analytics.py
+"""
+Sales and throughput rollups behind /api/analytics.
+
+Counters are updated from orders_store events (order added, status
+changed), O(drinks) per event, so reports never scan orders.json:
+- drinks per clock hour
+- flavor / topping / add-on counts and drinks with any add-on
+- orders and drinks (average drinks per order)
+- prep time (received → ready) per order, as a PREP_BIN_S histogram
+
+Orders are counted once per order_key() (order numbers repeat), so a
+number drawn twice still counts as two orders.
+
+orders.json is wiped on restart, the rollups are not. They are saved to
+ANALYTICS_PATH every ANALYTICS_SAVE_S (when anything changed) and on
+shutdown, and loaded at startup, so a crash loses at most one interval.
+tools/analytics_backfill.py merges history from exported or archived
+orders into the same file. One rollup per tenant.
+"""
+
+import asyncio, json, os, threading, time
+from collections import Counter
+
+from .settings import ANALYTICS_PATH, ANALYTICS_SAVE_S
+from .log import get_logger
+from .order_keys import order_key
+from . import tenants
+
+log = get_logger(__name__)
+_lock = threading.Lock()
+_dirty = False          # rollups changed since the last save
+
+PREP_BIN_S = 30
+PREP_BINS = 60          # last bin collects everything from 30 min up
+
+def hour_of(ts: float) -> int:
+    """Start of the clock hour containing ts (epoch seconds)."""
+    return int(ts) // 3600 * 3600
+
+def prep_bin(seconds: float) -> int:
+    return min(PREP_BINS - 1, int(seconds // PREP_BIN_S))
+
+class Rollup:
+    def __init__(self):
+        self.orders = 0
+        self.drinks = 0
+        self.drinks_with_addons = 0
+        self.drinks_by_hour: Counter[int] = Counter()
+        self.flavors: Counter[str] = Counter()
+        self.toppings: Counter[str] = Counter()
+        self.addons: Counter[str] = Counter()
+        self.prep_hist: Counter[int] = Counter()
+        self.prep_total_s = 0.0
+        self.prep_samples = 0
+        self._received: dict[str, float] = {}   # order_key -> received_at, until ready
+
+    def on_order_added(self, order: dict):
+        if not order.get("order_number"):
+            return
+        key = order_key(order)
+        if key in self._received:
+            return
+        items = order.get("items") or []
+        times = order.get("status_times") or {}
+        received_at = times.get("received") or order.get("created_at") or time.time()
+        self.orders += 1
+        self.drinks += len(items)
+        self.drinks_by_hour[hour_of(received_at)] += len(items)
+        for it in items:
+            self.flavors[it.get("flavor") or "unknown"] += 1
+            self.toppings.update(it.get("toppings") or ())
+            adds = it.get("addons") or ()
+            self.addons.update(adds)
+            self.drinks_with_addons += bool(adds)
+        if order.get("status") == "ready" and times.get("ready"):
+            self._add_prep(times["ready"] - received_at)
+        else:
+            self._received[key] = received_at
+
+    def on_status_changed(self, order: dict, status: str, at: float):
+        if status != "ready":
+            return
+        received_at = self._received.pop(order_key(order), None)
+        if received_at is not None:
+            self._add_prep(at - received_at)
+
+    def _add_prep(self, seconds: float):
+        if seconds < 0:
+            return
+        self.prep_hist[prep_bin(seconds)] += 1
+        self.prep_total_s += seconds
+        self.prep_samples += 1
+
+    def merge(self, other: "Rollup"):
+        """Add another rollup's counts (backfill); open orders are not carried over."""
+        self.orders += other.orders
+        self.drinks += other.drinks
+        self.drinks_with_addons += other.drinks_with_addons
+        self.drinks_by_hour.update(other.drinks_by_hour)
+        self.flavors.update(other.flavors)
+        self.toppings.update(other.toppings)
+        self.addons.update(other.addons)
+        self.prep_hist.update(other.prep_hist)
+        self.prep_total_s += other.prep_total_s
+        self.prep_samples += other.prep_samples
+
+    def to_dict(self) -> dict:
+        return {
+            "orders": self.orders, "drinks": self.drinks, "drinks_with_addons": self.drinks_with_addons,
+            "drinks_by_hour": {str(k): v for k, v in sorted(self.drinks_by_hour.items())},
+            "flavors": dict(self.flavors), "toppings": dict(self.toppings), "addons": dict(self.addons),
+            "prep_hist": {str(k): v for k, v in sorted(self.prep_hist.items())},
+            "prep_total_s": round(self.prep_total_s, 1), "prep_samples": self.prep_samples,
+            "open_orders": self._received,
+        }
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "Rollup":
+        r = cls()
+        r.orders = d.get("orders", 0)
+        r.drinks = d.get("drinks", 0)
+        r.drinks_with_addons = d.get("drinks_with_addons", 0)
+        r.drinks_by_hour = Counter({int(k): v for k, v in (d.get("drinks_by_hour") or {}).items()})
+        r.flavors = Counter(d.get("flavors") or {})
+        r.toppings = Counter(d.get("toppings") or {})
+        r.addons = Counter(d.get("addons") or {})
+        r.prep_hist = Counter({int(k): v for k, v in (d.get("prep_hist") or {}).items()})
+        r.prep_total_s = d.get("prep_total_s", 0.0)
+        r.prep_samples = d.get("prep_samples", 0)
+        # orders still open at save time; anything older than a day is never coming back
+        cutoff = time.time() - 86400
+        r._received = {k: v for k, v in (d.get("open_orders") or {}).items() if v >= cutoff}
+        return r
+
+    def _prep_percentile(self, p: float) -> int | None:
+        if not self.prep_samples:
+            return None
+        target, seen = p / 100 * self.prep_samples, 0
+        for b in sorted(self.prep_hist):
+            seen += self.prep_hist[b]
+            if seen >= target:
+                return (b + 1) * PREP_BIN_S   # upper edge of the bin
+        return PREP_BINS * PREP_BIN_S
+
+    def report(self, hours: int = 24, now: float | None = None) -> dict:
+        now = time.time() if now is None else now
+        first = hour_of(now) - (hours - 1) * 3600
+        recent = [{"hour": time.strftime("%Y-%m-%dT%H:00", time.localtime(h)), "drinks": self.drinks_by_hour.get(h, 0)}
+                  for h in range(first, hour_of(now) + 1, 3600)]
+        # hour-of-day profile (server local time), averaged over the days that saw any orders
+        by_hod: Counter[int] = Counter()
+        days = set()
+        for h, n in self.drinks_by_hour.items():
+            lt = time.localtime(h)
+            by_hod[lt.tm_hour] += n
+            days.add((lt.tm_year, lt.tm_yday))
+        per_day = max(1, len(days))
+        drinks = self.drinks or 1
+        return {
+            "orders": self.orders,
+            "drinks": self.drinks,
+            "avg_drinks_per_order": round(self.drinks / self.orders, 2) if self.orders else None,
+            "drinks_per_hour": recent,
+            "drinks_by_hour_of_day": {h: round(by_hod[h] / per_day, 2) for h in range(24) if by_hod[h]},
+            "days": len(days),
+            "flavors": dict(self.flavors.most_common()),
+            "toppings": dict(self.toppings.most_common()),
+            "topping_attach_rate": {k: round(v / drinks, 3) for k, v in self.toppings.most_common()},
+            "addon_attach_rate": {k: round(v / drinks, 3) for k, v in self.addons.most_common()},
+            "any_addon_attach_rate": round(self.drinks_with_addons / drinks, 3) if self.drinks else None,
+            "prep_seconds": {
+                "samples": self.prep_samples,
+                "mean": round(self.prep_total_s / self.prep_samples, 1) if self.prep_samples else None,
+                "p50": self._prep_percentile(50),
+                "p90": self._prep_percentile(90),
+                "bin_seconds": PREP_BIN_S,
+                "histogram": {f"{b * PREP_BIN_S}-{(b + 1) * PREP_BIN_S}": n for b, n in sorted(self.prep_hist.items())},
+            },
+        }
+
+_rollups: dict[str, Rollup] = {}
+
+def _rollup() -> Rollup:
+    tid = tenants.current().id
+    r = _rollups.get(tid)
+    if r is None:
+        r = _rollups[tid] = Rollup()
+    return r
+
+def on_order_added(order: dict):
+    global _dirty
+    with _lock:
+        _rollup().on_order_added(order)
+        _dirty = True
+
+def on_status_changed(order: dict, status: str, at: float):
+    global _dirty
+    with _lock:
+        _rollup().on_status_changed(order, status, at)
+        _dirty = True
+
+def report(hours: int = 24) -> dict:
+    with _lock:
+        return _rollup().report(hours)
+
+def rebuild(orders: list[dict]):
+    """Seed the current tenant's rollup from persisted orders, unless ANALYTICS_PATH already had one."""
+    with _lock:
+        tid = tenants.current().id
+        if tid in _rollups:
+            return
+        r = _rollups[tid] = Rollup()
+        for o in orders:
+            r.on_order_added(o)
+
+def load(path: str = ANALYTICS_PATH) -> int:
+    """Load saved rollups (startup); returns how many tenants had one."""
+    if not os.path.exists(path):
+        return 0
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    with _lock:
+        for tid, d in (data.get("tenants") or {}).items():
+            _rollups[tid] = Rollup.from_dict(d)
+    log.info("📈 Loaded analytics rollups for %d tenant(s)", len(data.get("tenants") or {}))
+    return len(data.get("tenants") or {})
+
+def save(path: str = ANALYTICS_PATH):
+    global _dirty
+    with _lock:
+        data = {"saved_at": int(time.time()), "tenants": {tid: r.to_dict() for tid, r in _rollups.items()}}
+        _dirty = False
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)
+    log.info("📈 Saved analytics rollups to %s", os.path.basename(path))
+
+# ---------- Periodic save ----------
+_task: asyncio.Task | None = None
+
+async def _run():
+    while True:
+        await asyncio.sleep(ANALYTICS_SAVE_S)
+        if not _dirty:
+            continue
+        try:
+            await asyncio.to_thread(save)
+        except Exception as e:
+            log.error("❌ Analytics save failed: %s", e)
+
+def start_saver():
+    global _task
+    if ANALYTICS_SAVE_S > 0 and _task is None:
+        _task = asyncio.get_running_loop().create_task(_run(), name="analytics-save")
+
+def stop_saver():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        _task = None
@@ -4,22 +4,53 @@ from fastapi import FastAPI
 
 from .http_routes import http_router
 from .ws_bridge import register_ws_routes
-from .orders_store import init_store, clear_store
+from .orders_store import init_all_stores, clear_store
+from .recording import stop_writer
+from .lifecycle import install_sigterm_drain, snapshot_pending_orders, take_drain_snapshot, is_draining
+from .loopmon import start_monitor, stop_monitor
+from . import finalizer, tenants, warmup, analytics, order_archive, transcripts
+from .settings import RESET_ORDERS_ON_RESTART
+from .log import get_logger
+
+log = get_logger(__name__)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup: fresh orders.json
-    init_store()
-    print("🚀 Server starting, orders.json reset")
+    # Startup: fresh orders.json per tenant (kept across restarts when RESET_ORDERS_ON_RESTART=0,
+    # open orders kept when the last shutdown drained recently); analytics rollups survive either way
+    analytics.load()
+    deploy = take_drain_snapshot() is not None
+    init_all_stores(reset=RESET_ORDERS_ON_RESTART, keep_open=deploy)
+    install_sigterm_drain()
+    start_monitor()
+    warmup.start()                  # greetings, SMS client, Settings; /ready is 503 until done
+    order_archive.start_sweeper()   # finished orders → daily archive after ORDERS_ARCHIVE_AFTER_S
+    analytics.start_saver()         # rollups → ANALYTICS_PATH every ANALYTICS_SAVE_S
+    log.info("🚀 Server starting, orders.json %s",
+             ("reset, open orders kept" if deploy else "reset") if RESET_ORDERS_ON_RESTART else "kept")
     try:
         yield
     finally:
-        # Shutdown: wipe orders.json
-        print("🔌 Server shutting down...")
-        clear_store()
+        # Shutdown: persist unfinished orders, then wipe orders.json (archived first; open orders stay if draining)
+        log.info("🔌 Server shutting down...")
+        stop_monitor()
+        warmup.stop()
+        order_archive.stop_sweeper()
+        analytics.stop_saver()
+        await finalizer.drain()
+        await transcripts.drain()
+        snapshot_pending_orders()
+        analytics.save()
+        stop_writer()
+        if RESET_ORDERS_ON_RESTART:
+            for t in tenants.all_tenants():
+                with tenants.using(t):
+                    clear_store(keep_open=is_draining())
 
 def create_app() -> FastAPI:
     app = FastAPI(title="Twilio ⇄ Deepgram Voice Agent (modular)", lifespan=lifespan)
+    # ?tenant= / X-Tenant / cookie → current shop for dashboards and APIs
+    app.add_middleware(tenants.TenantMiddleware)
     # HTTP routes (TwiML + Orders UI/JSON/SSE)
     app.include_router(http_router)
     # WebSocket route (/twilio)
@@ -0,0 +1,160 @@
+# app/batching.py
+"""
+Kitchen batching: open drinks from all in-progress orders grouped by their
+normalized (flavor, toppings, add-ons, sweetness, ice) signature.
+
+Maintained incrementally from orders_store events (order added, status
+changed), so the batch view never scans orders.json. Batches are listed
+oldest first (by their oldest waiting drink). Drinks are keyed by
+order_key() rather than the order number, which can repeat. One index
+per tenant.
+"""
+
+import hashlib, threading
+from collections import OrderedDict
+
+from .order_keys import order_key
+from . import tenants
+
+_lock = threading.Lock()
+
+def _norm(s) -> str:
+    return str(s or "").strip().lower()
+
+def signature(item: dict) -> tuple:
+    return (
+        _norm(item.get("flavor")),
+        tuple(sorted(_norm(t) for t in item.get("toppings") or [] if t)),
+        tuple(sorted(_norm(a) for a in item.get("addons") or [] if a)),
+        _norm(item.get("sweetness") or "50%"),
+        _norm(item.get("ice") or "regular ice"),
+    )
+
+def batch_id(sig: tuple) -> str:
+    return hashlib.sha1(repr(sig).encode("utf-8")).hexdigest()[:10]
+
+class BatchIndex:
+    def __init__(self):
+        # batch_id -> {"sig": tuple, "drinks": OrderedDict[(order_key, idx)] -> received_at}
+        self.batches: dict[str, dict] = {}
+        # order_key -> set of open (batch_id, idx)
+        self.open_by_order: dict[str, set] = {}
+        # order_key -> order number, while the order has open drinks
+        self.numbers: dict[str, str] = {}
+
+    def on_order_added(self, order: dict):
+        no = order.get("order_number")
+        key = order_key(order)
+        if not no or order.get("status") == "ready" or key in self.open_by_order:
+            return
+        received_at = (order.get("status_times") or {}).get("received") or order.get("created_at") or 0
+        opened = set()
+        for idx, it in enumerate(order.get("items") or []):
+            if it.get("done"):
+                continue
+            sig = signature(it)
+            bid = batch_id(sig)
+            b = self.batches.setdefault(bid, {"sig": sig, "drinks": OrderedDict()})
+            b["drinks"][(key, idx)] = received_at
+            opened.add((bid, idx))
+        if opened:
+            self.open_by_order[key] = opened
+            self.numbers[key] = no
+
+    def _close(self, key: str, bid: str, idx: int):
+        b = self.batches.get(bid)
+        if b:
+            b["drinks"].pop((key, idx), None)
+            if not b["drinks"]:
+                del self.batches[bid]
+        left = self.open_by_order.get(key)
+        if left is not None:
+            left.discard((bid, idx))
+            if not left:
+                del self.open_by_order[key]
+                self.numbers.pop(key, None)
+
+    def on_status_changed(self, order: dict, status: str):
+        if status != "ready":
+            return
+        key = order_key(order)
+        for bid, idx in list(self.open_by_order.get(key, ())):
+            self._close(key, bid, idx)
+
+    def take(self, bid: str, limit: int | None = None) -> dict[str, dict]:
+        """Close up to `limit` drinks of a batch (oldest first); returns {order_key: {"order_number", "items": [idx]}}."""
+        b = self.batches.get(bid)
+        if not b:
+            return {}
+        picked = list(b["drinks"].items())
+        picked.sort(key=lambda kv: kv[1])
+        if limit:
+            picked = picked[:limit]
+        out: dict[str, dict] = {}
+        for (key, idx), _ in picked:
+            entry = out.setdefault(key, {"order_number": self.numbers.get(key), "items": []})
+            self._close(key, bid, idx)
+            entry["items"].append(idx)
+        return out
+
+    def order_open(self, key: str) -> bool:
+        return key in self.open_by_order
+
+    def view(self) -> list[dict]:
+        out = []
+        for bid, b in self.batches.items():
+            flavor, toppings, addons, sweetness, ice = b["sig"]
+            drinks = b["drinks"]
+            orders: dict[str, int] = {}
+            for (key, _idx) in drinks:
+                orders[key] = orders.get(key, 0) + 1
+            out.append({
+                "batch_id": bid,
+                "flavor": flavor,
+                "toppings": list(toppings),
+                "addons": list(addons),
+                "sweetness": sweetness,
+                "ice": ice,
+                "count": len(drinks),
+                "oldest_at": min(drinks.values()),
+                "orders": [{"order_number": self.numbers.get(key), "id": key, "count": n} for key, n in orders.items()],
+            })
+        out.sort(key=lambda b: b["oldest_at"])
+        return out
+
+_indexes: dict[str, BatchIndex] = {}
+
+def _index() -> BatchIndex:
+    tid = tenants.current().id
+    idx = _indexes.get(tid)
+    if idx is None:
+        idx = _indexes[tid] = BatchIndex()
+    return idx
+
+def on_order_added(order: dict):
+    with _lock:
+        _index().on_order_added(order)
+
+def on_status_changed(order: dict, status: str):
+    with _lock:
+        _index().on_status_changed(order, status)
+
+def list_batches() -> list[dict]:
+    with _lock:
+        return _index().view()
+
+def take_batch(bid: str, limit: int | None = None) -> dict[str, dict]:
+    with _lock:
+        return _index().take(bid, limit)
+
+def order_open(key: str) -> bool:
+    """Whether the order (by order_key) still has drinks waiting."""
+    with _lock:
+        return _index().order_open(key)
+
+def rebuild(orders: list[dict]):
+    """Rebuild the current tenant's index from persisted orders (startup only)."""
+    with _lock:
+        index = _indexes[tenants.current().id] = BatchIndex()
+        for o in sorted(orders, key=lambda o: o.get("created_at") or 0):
+            index.on_order_added(o)
@@ -1,6 +1,8 @@
 # business_logic.py
 import re, time, random
 
+from . import call_session
+
 # --- Menu (no pricing, no sizes - one standard size only) ---
 MENU = {
     "flavors": ["taro milk tea", "black milk tea"],
@@ -10,10 +12,15 @@ MENU = {
 MAX_DRINKS = 5
 MAX_ORDERS_PER_PHONE = 5  # Maximum active drinks total per phone number
 
-# In-memory stores
-CART = []
+# In-memory stores. The cart and orders that have a number but aren't
+# finalized yet belong to the call (call_session.py); ORDERS is process-wide.
 ORDERS = {}
-PENDING_ORDERS = {}  # Orders that have number but not yet finalized
+
+def _cart() -> list:
+    return call_session.current().cart
+
+def _pending() -> dict:
+    return call_session.current().pending_orders
 
 # ---- Helpers ----
 def _normalize(s: str | None) -> str:
@@ -55,25 +62,37 @@ def _match_with_aliases(value_norm: str, canonical_list: list[str], aliases: dic
             return c
     return None
 
+def _shop():
+    """Tenant of the current call/request: menu, alias maps (see tenants.py)."""
+    from .tenants import current
+    return current()
+
 def menu_summary():
-    return {
-        "summary": (
+    shop = _shop()
+    if shop.menu == MENU:
+        summary = (
             "We have Taro Milk Tea and Black Milk Tea. "
             "Toppings: boba, egg pudding, crystal agar boba, vanilla cream. "
             "Optional add-on: matcha stencil on top (requires vanilla cream foam)."
-        ),
-        "flavors": MENU["flavors"],
-        "toppings": MENU["toppings"],
-        "addons": MENU["addons"],
+        )
+    else:
+        summary = shop.menu_summary_text()
+    return {
+        "summary": summary,
+        "flavors": shop.menu["flavors"],
+        "toppings": shop.menu["toppings"],
+        "addons": shop.menu["addons"],
     }
 
 def add_to_cart(flavor: str, toppings=None, sweetness: str | None = None, ice: str | None = None, addons=None):
     """Add a drink to cart (no pricing, no size - standard size only)."""
-    if len(CART) >= MAX_DRINKS:
+    cart = _cart()
+    if len(cart) >= MAX_DRINKS:
         return {"ok": False, "error": f"Max {MAX_DRINKS} drinks per order."}
 
+    shop = _shop()
     f = _normalize(flavor)
-    if f not in MENU["flavors"]:
+    if f not in shop.flavor_set:
         return {"ok": False, "error": f"'{flavor}' is not on the menu."}
 
     tops_in = [_normalize(t) for t in _ensure_list(toppings)]
@@ -83,7 +102,7 @@ def add_to_cart(flavor: str, toppings=None, sweetness: str | None = None, ice: s
     for t in tops_in:
         if not t:
             continue
-        m = _match_with_aliases(t, MENU["toppings"], TOPPING_ALIASES)
+        m = _match_with_aliases(t, shop.menu["toppings"], shop.topping_aliases)
         if not m:
             return {"ok": False, "error": f"Topping '{t}' not available."}
         tops_out.append(m)
@@ -92,7 +111,7 @@ def add_to_cart(flavor: str, toppings=None, sweetness: str | None = None, ice: s
     for a in adds_in:
         if not a:
             continue
-        m = _match_with_aliases(a, MENU["addons"], ADDON_ALIASES)
+        m = _match_with_aliases(a, shop.menu["addons"], shop.addon_aliases)
         if not m:
             return {"ok": False, "error": f"Add-on '{a}' not available."}
         adds_out.append(m)
@@ -112,30 +131,33 @@ def add_to_cart(flavor: str, toppings=None, sweetness: str | None = None, ice: s
         "ice": (ice or "regular ice"),
         "addons": adds_out,
     }
-    CART.append(item)
+    cart.append(item)
     return {
         "ok": True,
-        "cart_count": len(CART),
+        "cart_count": len(cart),
         "item": item,
     }
 
 def remove_from_cart(index: int):
-    if not (0 <= index < len(CART)):
-        return {"ok": False, "error": "Index out of range.", "cart_count": len(CART)}
-    removed = CART.pop(index)
-    return {"ok": True, "removed": removed, "cart_count": len(CART)}
+    cart = _cart()
+    if not (0 <= index < len(cart)):
+        return {"ok": False, "error": "Index out of range.", "cart_count": len(cart)}
+    removed = cart.pop(index)
+    return {"ok": True, "removed": removed, "cart_count": len(cart)}
 
 def modify_cart_item(index: int, flavor: str | None = None, toppings=None, sweetness: str | None = None, ice: str | None = None, addons=None):
     """Modify an existing item in the cart by index."""
-    if not (0 <= index < len(CART)):
-        return {"ok": False, "error": "Index out of range.", "cart_count": len(CART)}
+    cart = _cart()
+    if not (0 <= index < len(cart)):
+        return {"ok": False, "error": "Index out of range.", "cart_count": len(cart)}
     
-    item = CART[index]
+    item = cart[index]
+    shop = _shop()
     
     # Update flavor if provided
     if flavor:
         f = _normalize(flavor)
-        if f not in MENU["flavors"]:
+        if f not in shop.flavor_set:
             return {"ok": False, "error": f"'{flavor}' is not on the menu."}
         item["flavor"] = f
     
@@ -146,7 +168,7 @@ def modify_cart_item(index: int, flavor: str | None = None, toppings=None, sweet
         for t in tops_in:
             if not t:
                 continue
-            m = _match_with_aliases(t, MENU["toppings"], TOPPING_ALIASES)
+            m = _match_with_aliases(t, shop.menu["toppings"], shop.topping_aliases)
             if not m:
                 return {"ok": False, "error": f"Topping '{t}' not available."}
             tops_out.append(m)
@@ -159,7 +181,7 @@ def modify_cart_item(index: int, flavor: str | None = None, toppings=None, sweet
         for a in adds_in:
             if not a:
                 continue
-            m = _match_with_aliases(a, MENU["addons"], ADDON_ALIASES)
+            m = _match_with_aliases(a, shop.menu["addons"], shop.addon_aliases)
             if not m:
                 return {"ok": False, "error": f"Add-on '{a}' not available."}
             adds_out.append(m)
@@ -179,24 +201,26 @@ def modify_cart_item(index: int, flavor: str | None = None, toppings=None, sweet
     if ice:
         item["ice"] = ice
     
-    return {"ok": True, "item": item, "cart_count": len(CART)}
+    return {"ok": True, "item": item, "cart_count": len(cart)}
 
 def set_sweetness_ice(index: int | None = None, sweetness: str | None = None, ice: str | None = None):
-    if not CART:
+    cart = _cart()
+    if not cart:
         return {"ok": False, "error": "Cart is empty."}
-    i = index if index is not None else len(CART) - 1
-    if not (0 <= i < len(CART)):
+    i = index if index is not None else len(cart) - 1
+    if not (0 <= i < len(cart)):
         return {"ok": False, "error": "Index out of range."}
-    if sweetness: CART[i]["sweetness"] = sweetness
-    if ice: CART[i]["ice"] = ice
-    return {"ok": True, "item": CART[i]}
+    if sweetness: cart[i]["sweetness"] = sweetness
+    if ice: cart[i]["ice"] = ice
+    return {"ok": True, "item": cart[i]}
 
 def get_cart():
     """Return current cart contents (no pricing)."""
+    cart = _cart()
     return {
         "ok": True,
-        "items": CART.copy(),
-        "count": len(CART),
+        "items": cart.copy(),
+        "count": len(cart),
     }
 
 # --- Phone / orders ---
@@ -219,10 +243,12 @@ def random_order_no() -> str:
 def checkout_order(phone: str | None = None):
     """
     Generate order number and create pending order (no pricing, no names, no sizes).
-    Does NOT finalize - order stays in PENDING_ORDERS until finalize_order() is called.
+    Does NOT finalize - order stays in the call's pending orders until finalize_order() is called.
     Checks 5-active-drink limit here (early validation).
     """
-    if not CART:
+    cart = _cart()
+    pending = _pending()
+    if not cart:
         return {"ok": False, "error": "Cart is empty."}
     
     phone_norm = normalize_phone(phone) if phone else None
@@ -231,7 +257,7 @@ def checkout_order(phone: str | None = None):
     if phone_norm:
         from .orders_store import count_active_drinks_for_phone
         active_drinks = count_active_drinks_for_phone(phone_norm)
-        current_cart_size = len(CART)
+        current_cart_size = len(cart)
         total_drinks = active_drinks + current_cart_size
         
         if total_drinks > MAX_ORDERS_PER_PHONE:
@@ -249,43 +275,50 @@ def checkout_order(phone: str | None = None):
     # Create pending order (not finalized yet, no pricing, no name, no size)
     order = {
         "order_number": order_no,
-        "items": CART.copy(),
+        "items": cart.copy(),
         "phone": phone_norm,
         "status": "received",
         "created_at": int(time.time()),
         "committed": False,
     }
     
-    PENDING_ORDERS[order_no] = order
-    # Note: Do NOT clear CART yet - customer can still modify
+    pending[order_no] = order
+    # Note: Do NOT clear cart yet - customer can still modify
     
     return {"ok": True, **order}
 
-def finalize_order(order_number: str):
+def finalize_order(order_number: str, items: list | None = None):
     """
-    Finalize a pending order - move from PENDING_ORDERS to ORDERS and clear CART.
+    Finalize a pending order - move from the call's pending orders to ORDERS and clear its cart.
+    `items` is a cart snapshot taken at hangup; without it the live cart is used.
     Returns the finalized order data ready for persistence.
     """
-    if order_number not in PENDING_ORDERS:
+    cart = _cart()
+    pending = _pending()
+    if order_number not in pending:
         return {"ok": False, "error": "Pending order not found."}
     
-    order = PENDING_ORDERS.pop(order_number)
+    order = pending.pop(order_number)
     
     # Update with current cart contents (in case customer modified after checkout)
-    if CART:
-        order["items"] = CART.copy()
+    if items is None:
+        items = cart.copy()
+        cart.clear()
+    if items:
+        order["items"] = items
     
     order["committed"] = True
     ORDERS[order_number] = order
-    CART.clear()
     
     return {"ok": True, **order}
 
 def discard_pending_order(order_number: str):
     """Discard a pending order without finalizing."""
-    if order_number in PENDING_ORDERS:
-        PENDING_ORDERS.pop(order_number)
-        CART.clear()
+    cart = _cart()
+    pending = _pending()
+    if order_number in pending:
+        pending.pop(order_number)
+        cart.clear()
         return {"ok": True, "discarded": True}
     return {"ok": False, "error": "Pending order not found."}
 
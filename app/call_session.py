@@ -0,0 +1,69 @@
+# app/call_session.py
+"""
+Per-call order state: the cart, the staged drink, phone/order number, and
+the order that got a number at checkout but isn't finalized yet.
+
+Each /twilio connection opens its own CallSession, so concurrent calls
+(to the same shop or different shops) never see each other's cart. The
+current session is a context variable, like the current tenant: the
+bridge runs every tool call under `using(session)`, and the finalizer
+runs the call's job under it too. Code outside a call (scripts, the
+REPL) gets a process-wide fallback session.
+
+Open sessions are tracked so a drain can snapshot orders still in flight
+(lifecycle.snapshot_pending_orders).
+"""
+
+import contextvars, threading
+from contextlib import contextmanager
+
+def new_state() -> dict:
+    return {
+        "phone_number": None,
+        "order_number": None,       # set after checkout (but not finalized)
+        "phone_confirmed": False,   # track if phone was explicitly confirmed
+        "received_sms_sent": False, # track if SMS was already sent
+        # staged-but-not-confirmed drink
+        "pending_item": None,       # {"flavor":..., "toppings":[...], "sweetness":..., "ice":..., "addons":[...]}
+        # caller ID from /voice and their latest order (prefetched by the bridge; False = none found)
+        "caller_phone": None,
+        "last_order": None,
+    }
+
+class CallSession:
+    def __init__(self, call_id=None):
+        self.call_id = call_id
+        self.state = new_state()
+        self.cart: list[dict] = []
+        self.pending_orders: dict[str, dict] = {}   # order_number -> numbered, not finalized
+
+_fallback = CallSession("process")
+_current: contextvars.ContextVar[CallSession | None] = contextvars.ContextVar("call_session", default=None)
+_open: set[CallSession] = set()
+_open_lock = threading.Lock()
+
+def current() -> CallSession:
+    return _current.get() or _fallback
+
+@contextmanager
+def using(session: CallSession):
+    token = _current.set(session)
+    try:
+        yield session
+    finally:
+        _current.reset(token)
+
+def open_session(call_id=None) -> CallSession:
+    session = CallSession(call_id)
+    with _open_lock:
+        _open.add(session)
+    return session
+
+def close_session(session: CallSession):
+    with _open_lock:
+        _open.discard(session)
+
+def open_sessions() -> list[CallSession]:
+    """Sessions of calls still connected, plus the fallback."""
+    with _open_lock:
+        return [*_open, _fallback]
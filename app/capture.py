@@ -0,0 +1,133 @@
+# app/capture.py
+"""
+Opt-in message capture of /twilio sessions (CAPTURE_CALLS=1), for replay
+with tools/replay.py.
+
+The bridge wraps its Twilio socket and each agent socket in taps. Every
+message in both directions on both sides is logged with a timestamp
+relative to call start. At hangup the log is written to
+CAPTURE_DIR/<streamSid>.jsonl.gz on a worker thread. Lines look like:
+
+    {"capture": 1, "stream_sid": ..., "started_at": <epoch>}        header
+    {"t": 0.512, "d": "tw_in", "text": "<raw Twilio message>"}
+    {"t": 0.530, "d": "ag_in", "s": 0, "text": "..."} / "bin": <base64>
+    {"t": 0.531, "d": "ag_out", "s": 0, "text": "..."} / "bin_len": n
+    {"t": 0.700, "d": "tw_out", "event": "media"}   (other events in full)
+    {"t": 9.100, "d": "ag_closed", "s": 0, "code": 1011}   agent hung up on us
+
+s is the agent session (0, then 1... after reconnects). The replay needs
+the Twilio input and the agent output in full. Outbound audio is only
+noted (its timing is what gets measured), which keeps files small.
+With capture off nothing is wrapped and the bridge pays nothing.
+"""
+
+import asyncio, base64, gzip, json, os, time
+
+from .settings import CAPTURE_CALLS, CAPTURE_DIR
+from .log import get_logger
+
+log = get_logger(__name__)
+
+class CallCapture:
+    def __init__(self):
+        self.started_at = time.time()
+        self._t0 = time.perf_counter()
+        self.events: list[dict] = []
+        self.sessions = 0
+
+    def add(self, d: str, msg, session: int | None = None):
+        e = {"t": round(time.perf_counter() - self._t0, 4), "d": d}
+        if session is not None:
+            e["s"] = session
+        if isinstance(msg, (bytes, bytearray, memoryview)):
+            if d == "ag_in":
+                e["bin"] = base64.b64encode(msg).decode("ascii")
+            else:
+                e["bin_len"] = len(msg)
+        elif d == "tw_out" and msg.startswith('{"event":"media"'):
+            e["event"] = "media"
+        else:
+            e["text"] = msg
+        self.events.append(e)
+
+    def twilio(self, ws) -> "_TwilioTap":
+        return _TwilioTap(ws, self)
+
+    def agent(self, agent) -> "_AgentTap":
+        tap = _AgentTap(agent, self, self.sessions)
+        self.sessions += 1
+        return tap
+
+    def _write(self, path: str, header: dict):
+        os.makedirs(CAPTURE_DIR, exist_ok=True)
+        tmp = path + ".tmp"
+        with gzip.open(tmp, "wt", encoding="utf-8") as f:
+            f.write(json.dumps(header) + "\n")
+            for e in self.events:
+                f.write(json.dumps(e, ensure_ascii=False) + "\n")
+        os.replace(tmp, path)
+
+    async def close(self, stream_sid: str | None):
+        name = stream_sid or f"call-{int(self.started_at)}"
+        path = os.path.join(CAPTURE_DIR, f"{name}.jsonl.gz")
+        header = {"capture": 1, "stream_sid": stream_sid, "started_at": self.started_at,
+                  "events": len(self.events), "agent_sessions": self.sessions}
+        try:
+            await asyncio.to_thread(self._write, path, header)
+            log.info("🎞️ Capture saved: %s (%d messages)", path, len(self.events))
+        except Exception as e:
+            log.error("❌ Capture write failed: %s", e)
+
+class _TwilioTap:
+    """Starlette WebSocket stand-in that logs what the bridge reads and sends."""
+    def __init__(self, ws, cap: CallCapture):
+        self._ws = ws
+        self._cap = cap
+
+    async def iter_text(self):
+        async for raw in self._ws.iter_text():
+            self._cap.add("tw_in", raw)
+            yield raw
+
+    async def send_text(self, text: str):
+        self._cap.add("tw_out", text)
+        await self._ws.send_text(text)
+
+    def __getattr__(self, name):
+        return getattr(self._ws, name)
+
+class _AgentTap:
+    """Agent WebSocket stand-in that logs both directions of one session."""
+    def __init__(self, agent, cap: CallCapture, session: int):
+        self._agent = agent
+        self._cap = cap
+        self._session = session
+        self._closing = False
+
+    def __aiter__(self):
+        return self._iter()
+
+    async def _iter(self):
+        try:
+            async for msg in self._agent:
+                self._cap.add("ag_in", msg, self._session)
+                yield msg
+        finally:
+            if not self._closing:   # the agent side closed (drop), not our hangup
+                self._closing = True
+                self._cap.events.append({"t": round(time.perf_counter() - self._cap._t0, 4), "d": "ag_closed",
+                                         "s": self._session, "code": self._agent.close_code})
+
+    async def send(self, msg):
+        self._cap.add("ag_out", msg, self._session)
+        await self._agent.send(msg)
+
+    async def close(self):
+        self._closing = True
+        await self._agent.close()
+
+    def __getattr__(self, name):
+        return getattr(self._agent, name)
+
+def new_capture() -> CallCapture | None:
+    return CallCapture() if CAPTURE_CALLS else None
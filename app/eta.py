@@ -0,0 +1,159 @@
+# app/eta.py
+"""
+Rolling prep-time estimator and live pickup ETA.
+
+Updated from orders_store on every add/status change, O(1) per event:
+- per-drink prep time: EWMA of service time / drinks. Service starts when
+  the order arrives or a barista frees up, whichever is later (the oldest
+  of the last BARISTAS ready times), so time spent waiting in the queue is
+  not counted; the queue is accounted for by drinks ahead in _eta
+- queue depth: active (not ready) orders and drinks
+- FIFO position: each order remembers how many drinks were enqueued before
+  it; drinks still ahead = that number minus drinks completed since
+
+Orders are tracked by order_key() (numbers repeat); a lookup by number
+gets the newest open order with it.
+
+One estimator per tenant (each shop has its own kitchen queue).
+"""
+
+import threading, time
+from collections import deque
+
+from .settings import PREP_SECONDS_PER_DRINK, PREP_EWMA_ALPHA, BARISTAS
+from .order_keys import order_key
+from . import tenants
+
+_lock = threading.Lock()
+
+class PrepEstimator:
+    def __init__(self, default_s: float = PREP_SECONDS_PER_DRINK, alpha: float = PREP_EWMA_ALPHA,
+                 baristas: int = BARISTAS):
+        self.default_s = default_s
+        self.alpha = alpha
+        self.baristas = max(1, baristas)
+        self.per_drink_s: float | None = None
+        self._ready_times: deque[float] = deque(maxlen=self.baristas)  # last ready time per barista slot
+        self.samples = 0
+        self.active_orders = 0
+        self.active_drinks = 0
+        self.enqueued = 0      # cumulative drinks ever enqueued
+        self.completed = 0     # cumulative drinks completed (ready)
+        self._orders: dict[str, tuple[int, int, float]] = {}  # order_key -> (enqueued_before, drinks, received_at)
+        self._by_number: dict[str, list[str]] = {}   # order_no -> order_keys of open orders with it, oldest first
+
+    def _ewma(self, old: float | None, x: float) -> float:
+        return x if old is None else old + self.alpha * (x - old)
+
+    def seconds_per_drink(self) -> float:
+        return self.per_drink_s if self.per_drink_s is not None else self.default_s
+
+    def on_order_added(self, order: dict):
+        no = order.get("order_number")
+        key = order_key(order)
+        if not no or order.get("status") == "ready" or key in self._orders:
+            return
+        n = len(order.get("items") or [])
+        received_at = order.get("status_times", {}).get("received") or order.get("created_at") or time.time()
+        self._orders[key] = (self.enqueued, n, received_at)
+        self._by_number.setdefault(no, []).append(key)
+        self.enqueued += n
+        self.active_orders += 1
+        self.active_drinks += n
+
+    def on_status_changed(self, order: dict, status: str, at: float):
+        if status != "ready":
+            return
+        key = order_key(order)
+        entry = self._orders.pop(key, None)
+        if entry is None:
+            return
+        keys = self._by_number.get(order.get("order_number"))
+        if keys and key in keys:
+            keys.remove(key)
+            if not keys:
+                del self._by_number[order["order_number"]]
+        _, n, received_at = entry
+        self.completed += n
+        self.active_orders -= 1
+        self.active_drinks -= n
+        if not at:
+            return
+        started = received_at
+        if len(self._ready_times) == self.baristas:
+            started = max(received_at, self._ready_times[0])
+        self._ready_times.append(at)
+        if n and at > started:
+            self.per_drink_s = self._ewma(self.per_drink_s, (at - started) / n)
+            self.samples += 1
+
+    def eta_for_order(self, order_number: str) -> dict | None:
+        keys = self._by_number.get(order_number)
+        entry = self._orders.get(keys[-1]) if keys else None
+        if entry is None:
+            return None
+        before, n, received_at = entry
+        ahead = max(0, before - self.completed)
+        return self._eta(ahead, n)
+
+    def eta_for_new_order(self, drinks: int) -> dict:
+        """ETA for an order that would join the queue now (e.g. a cart at checkout)."""
+        return self._eta(self.active_drinks, max(1, drinks))
+
+    def _eta(self, ahead: int, own: int) -> dict:
+        seconds = (ahead + own) * self.seconds_per_drink() / self.baristas
+        return {
+            "drinks_ahead": ahead,
+            "eta_seconds": round(seconds),
+            "eta_minutes": max(1, round(seconds / 60)),
+            "ready_by": int(time.time() + seconds),
+        }
+
+    def stats(self) -> dict:
+        return {
+            "seconds_per_drink": round(self.seconds_per_drink(), 1),
+            "samples": self.samples,
+            "active_orders": self.active_orders,
+            "active_drinks": self.active_drinks,
+            "baristas": self.baristas,
+        }
+
+_estimators: dict[str, PrepEstimator] = {}
+
+def _est() -> PrepEstimator:
+    tid = tenants.current().id
+    est = _estimators.get(tid)
+    if est is None:
+        est = _estimators[tid] = PrepEstimator()
+    return est
+
+def on_order_added(order: dict):
+    with _lock:
+        _est().on_order_added(order)
+
+def on_status_changed(order: dict, status: str, at: float):
+    with _lock:
+        _est().on_status_changed(order, status, at)
+
+def eta_for_order(order_number: str) -> dict | None:
+    with _lock:
+        return _est().eta_for_order(order_number)
+
+def eta_for_new_order(drinks: int) -> dict:
+    with _lock:
+        return _est().eta_for_new_order(drinks)
+
+def stats() -> dict:
+    with _lock:
+        return _est().stats()
+
+def rebuild(orders: list[dict]):
+    """Warm the current tenant's estimator from persisted orders (startup only)."""
+    with _lock:
+        estimator = _estimators[tenants.current().id] = PrepEstimator()
+        for o in sorted(orders, key=lambda o: o.get("created_at") or 0):
+            estimator.on_order_added({**o, "status": "received"})
+        # completions in the order they happened, so service start times line up
+        done = [o for o in orders if o.get("status") == "ready"]
+        for o in sorted(done, key=lambda o: (o.get("status_times") or {}).get("ready") or 0):
+            estimator.on_status_changed(o, "ready", (o.get("status_times") or {}).get("ready") or 0)
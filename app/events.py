@@ -5,6 +5,9 @@ from typing import Any, List
 _subscribers: List[asyncio.Queue] = []
 
 def publish(event: Any) -> None:
+    if isinstance(event, dict) and "tenant" not in event:
+        from .tenants import current
+        event = {**event, "tenant": current().id}
     for q in list(_subscribers):
         try:
             q.put_nowait(event)
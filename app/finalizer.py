@@ -0,0 +1,155 @@
+# app/finalizer.py
+"""
+Background order finalization, one job per call.
+
+At hangup the bridge snapshots the call's order state and enqueues a job;
+the socket teardown doesn't wait for it. A single worker task runs jobs in
+order: finalize_order → add_order → publish → confirmation SMS, with the
+blocking steps (orders.json write, Twilio API) on a worker thread. Jobs are
+keyed by call, so a call that reports its hangup more than once still
+finalizes once. A job runs under its call's session (the pending order
+lives there) and closes that session when done. Order numbers are random 4-digit numbers and do repeat
+across calls; they are never the key.
+"""
+
+import asyncio, time
+from collections import OrderedDict, deque
+
+from .business_logic import finalize_order, discard_pending_order
+from .orders_store import add_order
+from .events import publish
+from .send_sms import send_received_sms
+from .eta import eta_for_order
+from .log import get_logger, call_logger
+from . import tenants, call_session
+
+log = get_logger(__name__)
+
+_queue: asyncio.Queue | None = None
+_worker: asyncio.Task | None = None
+_seen: OrderedDict[str, None] = OrderedDict()   # job keys already accepted (bounded)
+_SEEN_MAX = 10_000
+_latency_ms: deque[float] = deque(maxlen=500)   # enqueue → done, recent jobs
+
+stats_counters = {"enqueued": 0, "duplicates": 0, "finalized": 0, "discarded": 0,
+                  "skipped": 0, "failed": 0, "sms_sent": 0, "sms_failed": 0}
+
+def _ensure_worker():
+    global _queue, _worker
+    if _queue is None:
+        _queue = asyncio.Queue()
+    if _worker is None or _worker.done():
+        _worker = asyncio.get_running_loop().create_task(_run(), name="finalizer")
+
+def call_key(tenant_id: str, call_id) -> str:
+    """Job key for one call (never the order number)."""
+    return f"{tenant_id}:call-{call_id}"
+
+def enqueue(key: str, *, order_number: str | None, phone: str | None,
+            phone_confirmed: bool, items: list | None, call_id: str | None = None,
+            tenant: str | None = None, session: call_session.CallSession | None = None) -> bool:
+    """Queue finalization for one call; returns False if this key was already queued."""
+    if key in _seen:
+        stats_counters["duplicates"] += 1
+        return False
+    _seen[key] = None
+    if len(_seen) > _SEEN_MAX:
+        _seen.popitem(last=False)
+    _ensure_worker()
+    _queue.put_nowait({
+        "key": key, "order_number": order_number, "phone": phone,
+        "phone_confirmed": phone_confirmed, "items": items,
+        "call_id": call_id, "tenant": tenant, "session": session, "enqueued_at": time.perf_counter(),
+    })
+    stats_counters["enqueued"] += 1
+    return True
+
+async def _run():
+    while True:
+        job = await _queue.get()
+        try:
+            # orders.json, events and SMS sender all follow the current tenant
+            with tenants.using(tenants.get(job["tenant"]) or tenants.DEFAULT), \
+                    call_session.using(job["session"] or call_session.current()):
+                await _process(job)
+        except Exception as e:
+            stats_counters["failed"] += 1
+            call_logger(__name__, job["call_id"]).exception("❌ Error during finalization: %s", e)
+        finally:
+            _latency_ms.append((time.perf_counter() - job["enqueued_at"]) * 1000)
+            if job["session"]:
+                call_session.close_session(job["session"])
+            _queue.task_done()
+
+async def _process(job: dict):
+    order_no, phone = job["order_number"], job["phone"]
+    clog = call_logger(__name__, job["call_id"])
+
+    if not job["phone_confirmed"]:
+        clog.info("ℹ️ Phone not confirmed, discarding order")
+        if order_no:
+            discard_pending_order(order_no)
+            stats_counters["discarded"] += 1
+        return
+    if not phone or not order_no:
+        clog.info("ℹ️ Missing phone or order number, cannot finalize")
+        stats_counters["skipped"] += 1
+        return
+
+    clog.info("📱 Finalizing order on hangup (phone=%s, order=%s)", phone, order_no,
+              extra={"phone": phone, "order_number": order_no})
+    result = finalize_order(order_no, items=job["items"])
+    if not result.get("ok"):
+        clog.error("❌ Failed to finalize order: %s", result.get("error"))
+        stats_counters["failed"] += 1
+        return
+
+    # Persist to orders.json (blocking file write → thread). Barista routes and the
+    # archive sweep write from other threads; orders_store serializes on its lock.
+    await asyncio.to_thread(add_order, {
+        "order_number": result["order_number"],
+        "phone": result.get("phone"),
+        "items": result.get("items") or [],
+        "total": result.get("total", 0.0),
+        "status": result.get("status", "received"),
+        "created_at": result.get("created_at"),
+    })
+    publish({"type": "order_created", "order_number": result["order_number"], "status": "received"})
+    stats_counters["finalized"] += 1
+    clog.info("✅ Order finalized: %s", order_no)
+
+    try:
+        est = eta_for_order(order_no)
+        sent = await asyncio.to_thread(send_received_sms, order_no=order_no, to_phone_no=phone,
+                                       eta_minutes=est["eta_minutes"] if est else None)
+        if sent is None:
+            stats_counters["sms_failed"] += 1
+            return
+        stats_counters["sms_sent"] += 1
+        clog.info("✅ Confirmation SMS sent to %s", phone)
+    except Exception as e:
+        stats_counters["sms_failed"] += 1
+        clog.error("❌ Error sending confirmation SMS: %s", e)
+
+def stats() -> dict:
+    lat = sorted(_latency_ms)
+    return {
+        **stats_counters,
+        "queue_depth": _queue.qsize() if _queue else 0,
+        "latency_ms_p50": round(lat[len(lat) // 2], 1) if lat else None,
+        "latency_ms_max": round(lat[-1], 1) if lat else None,
+    }
+
+async def drain(timeout: float = 10.0) -> int:
+    """Finish queued jobs and stop the worker (shutdown); returns jobs left undone."""
+    global _worker
+    if _queue is None:
+        return 0
+    try:
+        await asyncio.wait_for(_queue.join(), timeout)
+    except asyncio.TimeoutError:
+        log.warning("⏱️ Finalizer drain timeout, %d job(s) pending", _queue.qsize())
+    if _worker is not None:
+        _worker.cancel()
+        _worker = None
+    return _queue.qsize()
@@ -0,0 +1,112 @@
+# app/greeting_cache.py
+"""
+Pre-rendered greeting audio (GREETING_CACHE=1).
+
+Each tenant's greeting is synthesized once with Deepgram TTS as μ-law
+8 kHz and kept in GREETING_CACHE_DIR, named by a hash of voice + text, so
+changing either is just a cache miss (files no tenant uses any more are
+removed at warm-up). On "start" the bridge streams the frames to Twilio
+straight away, and the agent's Settings leave the greeting out: it goes
+into the agent's context instead, so the LLM knows it was said.
+
+Rendering runs in the background at startup; until a tenant's greeting is
+ready (or if TTS fails) its calls get the agent-spoken greeting as before.
+"""
+
+import asyncio, audioop, binascii, hashlib, json, os, urllib.parse, urllib.request
+
+from .audio import SAMPLE_WIDTH, CHANNELS, TWILIO_FRAME_BYTES
+from .settings import (
+    GREETING_CACHE, GREETING_CACHE_DIR, DG_SPEAK_URL, DG_API_KEY, GREETING_RENDER_TIMEOUT_S,
+)
+from .twilio_proto import frames
+from .log import get_logger
+from . import tenants
+
+log = get_logger(__name__)
+
+class Greeting:
+    """One rendered greeting, with everything a call needs precomputed."""
+    def __init__(self, text: str, voice: str, ulaw: bytes):
+        self.text = text
+        self.voice = voice
+        self.ulaw = ulaw
+        self.ms = len(ulaw) // 8
+        # base64 payload per 20ms frame; MediaEncoder only wraps them per stream
+        self.payloads = [binascii.b2a_base64(f, newline=False).decode("ascii")
+                         for f in frames(ulaw, TWILIO_FRAME_BYTES)]
+        self._pcm24k: bytes | None = None
+
+    def pcm24k(self) -> bytes:
+        """linear16@24k, the agent-leg format of call recordings (built on first use)."""
+        if self._pcm24k is None:
+            lin8k = audioop.ulaw2lin(self.ulaw, SAMPLE_WIDTH)
+            self._pcm24k, _ = audioop.ratecv(lin8k, SAMPLE_WIDTH, CHANNELS, 8000, 24000, None)
+        return self._pcm24k
+
+_ready: dict[tuple[str, str], Greeting] = {}   # (voice, text) -> greeting
+
+def _key(tenant: tenants.Tenant) -> tuple[str, str]:
+    return tenant.voice, tenant.greeting
+
+def cache_path(tenant: tenants.Tenant) -> str:
+    digest = hashlib.sha256("\n".join(_key(tenant)).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(GREETING_CACHE_DIR, f"{digest}.ulaw")
+
+def get(tenant: tenants.Tenant) -> Greeting | None:
+    """The tenant's rendered greeting, or None (agent speaks it)."""
+    return _ready.get(_key(tenant)) if GREETING_CACHE else None
+
+def _synthesize(text: str, voice: str) -> bytes:
+    query = urllib.parse.urlencode({"model": voice, "encoding": "mulaw",
+                                    "sample_rate": 8000, "container": "none"})
+    req = urllib.request.Request(
+        f"{DG_SPEAK_URL}?{query}", data=json.dumps({"text": text}).encode("utf-8"), method="POST",
+        headers={"Authorization": f"Token {DG_API_KEY}", "Content-Type": "application/json"},
+    )
+    with urllib.request.urlopen(req, timeout=GREETING_RENDER_TIMEOUT_S) as resp:
+        return resp.read()
+
+def store(tenant: tenants.Tenant, ulaw: bytes) -> Greeting:
+    """Write rendered μ-law audio for the tenant's greeting and make it current."""
+    path = cache_path(tenant)
+    os.makedirs(GREETING_CACHE_DIR, exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(ulaw)
+    os.replace(tmp, path)
+    g = _ready[_key(tenant)] = Greeting(tenant.greeting, tenant.voice, ulaw)
+    return g
+
+def _load_or_render(tenant: tenants.Tenant) -> Greeting | None:
+    path = cache_path(tenant)
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            g = _ready[_key(tenant)] = Greeting(tenant.greeting, tenant.voice, f.read())
+        return g
+    try:
+        ulaw = _synthesize(tenant.greeting, tenant.voice)
+    except Exception as e:
+        log.warning("⚠️ Greeting render failed for %s (%s); agent will speak it", tenant.id, e)
+        return None
+    if not ulaw:
+        return None
+    log.info("🎙️ Rendered greeting for %s (%d ms)", tenant.id, len(ulaw) // 8)
+    return store(tenant, ulaw)
+
+async def warm():
+    """Load or render every tenant's greeting, then drop cache files nobody uses."""
+    if not GREETING_CACHE:
+        return
+    keep = set()
+    for t in tenants.all_tenants():
+        keep.add(os.path.basename(cache_path(t)))
+        if _key(t) not in _ready:
+            await asyncio.to_thread(_load_or_render, t)
+    if os.path.isdir(GREETING_CACHE_DIR):
+        for name in os.listdir(GREETING_CACHE_DIR):
+            if name.endswith(".ulaw") and name not in keep:
+                os.remove(os.path.join(GREETING_CACHE_DIR, name))
+                log.info("🧹 Removed stale greeting %s", name)
+    log.info("🎙️ Greetings ready for %d/%d tenant(s)", sum(get(t) is not None for t in tenants.all_tenants()),
+             len(tenants.all_tenants()))
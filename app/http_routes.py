@@ -2,7 +2,8 @@
 import os
 import json as _json
 import asyncio
-from fastapi import APIRouter, HTTPException, Query
+from xml.sax.saxutils import escape
+from fastapi import APIRouter, HTTPException, Query, Header, Form, Depends
 from fastapi.responses import Response, JSONResponse, HTMLResponse, StreamingResponse
 
 from .orders_store import (
@@ -12,12 +13,23 @@ from .orders_store import (
     set_order_status,
     add_order,
     get_order,  # full order lookup
+    mark_items_done,
 )
 from .events import subscribe, unsubscribe, publish
-from .business_logic import add_to_cart, checkout_order
+from .business_logic import add_to_cart, checkout_order, normalize_phone
+from .transcripts import find_transcripts
+from .log import get_logger
+from .batching import list_batches, take_batch, order_open
+from .eta import eta_for_order, stats as prep_stats
+from .finalizer import stats as finalizer_stats
+from .lifecycle import admit, start_drain, status as lifecycle_status
+from .settings import DRAIN_REDIRECT_URL, ADMIN_TOKEN, OVERFLOW_REDIRECT_URL, OVERFLOW_MAX_RETRIES, PROFILE_MAX_S
 from .send_sms import send_ready_sms
+from . import tenants, loopmon, profiler, analytics, ratelimit, uplink
+from .ratelimit import limit_writes
 
 http_router = APIRouter()
+log = get_logger(__name__)
 
 # --- Landing Page HTML ---
 INDEX_HTML = """<!DOCTYPE html>
@@ -161,6 +173,11 @@ INDEX_HTML = """<!DOCTYPE html>
                 <div class="endpoint-description">Staff interface to view order details and mark drinks as ready (sends SMS)</div>
                 <div class="endpoint-url">https://voice.boba-demo.deepgram.com/barista</div>
             </a>
+            <a href="/barista/batches" class="endpoint">
+                <div class="endpoint-title"><span class="endpoint-icon">🧺</span>Barista Batches (Staff Interface)</div>
+                <div class="endpoint-description">Identical drinks grouped across orders, oldest first; mark a whole batch done</div>
+                <div class="endpoint-url">https://voice.boba-demo.deepgram.com/barista/batches</div>
+            </a>
             <div class="section-title">🔌 API Endpoints</div>
             <a href="/orders.json" class="endpoint api-endpoint">
                 <div class="endpoint-title"><span class="endpoint-icon">📋</span>Orders JSON API</div>
@@ -186,20 +203,109 @@ INDEX_HTML = """<!DOCTYPE html>
 def index():
     return HTMLResponse(INDEX_HTML)
 
+def _require_admin(token: str | None):
+    if not ADMIN_TOKEN:
+        raise HTTPException(403, "Admin endpoints disabled (ADMIN_TOKEN not set)")
+    if token != ADMIN_TOKEN:
+        raise HTTPException(401, "Bad admin token")
+
+def _overflow_twiml(reason: str, retry: int) -> Response:
+    """Call we won't take here: hand it to another instance, hold and retry, or busy."""
+    redirect = DRAIN_REDIRECT_URL if reason == "draining" else (OVERFLOW_REDIRECT_URL or DRAIN_REDIRECT_URL)
+    if redirect:
+        twiml = f"""<?xml version="1.0" encoding="UTF-8"?>
+<Response>
+  <Redirect method="POST">{redirect}</Redirect>
+</Response>"""
+    elif reason != "draining" and retry < OVERFLOW_MAX_RETRIES:
+        # Busy, not going away: keep the caller on the line and ask /voice again
+        twiml = f"""<?xml version="1.0" encoding="UTF-8"?>
+<Response>
+  <Say>All of our baristas are busy right now. Please hold for a moment.</Say>
+  <Pause length="{5 + 5 * retry}" />
+  <Redirect method="POST">/voice?retry={retry + 1}</Redirect>
+</Response>"""
+    elif reason != "draining":
+        twiml = """<?xml version="1.0" encoding="UTF-8"?>
+<Response>
+  <Say>Sorry, we're still busy. Please call back in a few minutes.</Say>
+  <Hangup />
+</Response>"""
+    else:
+        twiml = """<?xml version="1.0" encoding="UTF-8"?>
+<Response>
+  <Reject reason="busy" />
+</Response>"""
+    return Response(content=twiml, media_type="text/xml")
+
+_RATE_LIMITED_TWIML = """<?xml version="1.0" encoding="UTF-8"?>
+<Response>
+  <Reject reason="busy" />
+</Response>"""
+
 @http_router.post("/voice")
-def voice_twiml():
+def voice_twiml(retry: int = Query(0, ge=0), To: str | None = Form(None), From: str | None = Form(None),
+                CallSid: str | None = Form(None)):
+    caller = normalize_phone(From)
+    # per caller ID, before admission; a call we put on hold already passed
+    # (retry alone proves nothing: it's in the URL)
+    if caller and not (retry and ratelimit.was_held(CallSid)):
+        allowed, _ = ratelimit.voice.check(caller)
+        if not allowed:
+            log.warning("🚦 Rate limited call from %s", caller, extra={"phone": caller})
+            return Response(content=_RATE_LIMITED_TWIML, media_type="text/xml")
+    ok, reason = admit()
+    if not ok:
+        ratelimit.hold_call(CallSid)
+        return _overflow_twiml(reason, retry)
+    ratelimit.release_call(CallSid)
+    # dialed number → shop; the stream carries it to /twilio as a custom parameter
+    tenant = tenants.for_number(To)
+    shop = "Deepgram Boba Rista" if tenant is tenants.DEFAULT else escape(tenant.name)
+    # caller ID lets the bridge prefetch the caller's last order ("my usual")
+    caller_param = f'\n      <Parameter name="caller" value="{escape(caller)}" />' if caller else ""
     # Read public host from env; fallback for local testing
     host = os.getenv("VOICE_HOST", "localhost:8000")
     scheme = "wss" if not host.startswith("localhost") else "ws"
     twiml = f"""<?xml version="1.0" encoding="UTF-8"?>
 <Response>
-  <Say>Connecting you to the Deepgram Boba Rista.</Say>
+  <Say>Connecting you to the {shop}.</Say>
   <Connect>
-    <Stream url="{scheme}://{host}/twilio" />
+    <Stream url="{scheme}://{host}/twilio">
+      <Parameter name="tenant" value="{tenant.id}" />{caller_param}
+    </Stream>
   </Connect>
 </Response>"""
     return Response(content=twiml, media_type="text/xml")
 
+# --- Readiness / drain ---
+@http_router.get("/ready")
+def ready():
+    st = {**lifecycle_status(), "rate_limits": ratelimit.stats(), "uplink": uplink.stats()}
+    return JSONResponse(st, status_code=200 if st["ready"] else 503)
+
+@http_router.post("/admin/drain")
+def admin_drain(x_admin_token: str | None = Header(None)):
+    _require_admin(x_admin_token)
+    start_drain("admin")
+    return lifecycle_status()
+
+@http_router.get("/admin/profile")
+async def admin_profile(seconds: float = Query(10, gt=0), interval_ms: float = Query(10, ge=1),
+                        thread: str = Query("all", pattern="^(all|loop)$"),
+                        x_admin_token: str | None = Header(None)):
+    """Sampling profile of the running worker as collapsed stacks (flamegraph.pl / speedscope)."""
+    _require_admin(x_admin_token)
+    seconds = min(seconds, PROFILE_MAX_S)
+    tid = loopmon.loop_thread_id if thread == "loop" else None
+    try:
+        counts, passes = await asyncio.to_thread(profiler.sample, seconds, interval_ms / 1000, tid)
+    except profiler.ProfileBusy as e:
+        raise HTTPException(409, str(e))
+    log.info("🔬 Profile taken: %.1fs, %d passes, %d distinct stacks", seconds, passes, len(counts))
+    return Response(profiler.collapsed(counts), media_type="text/plain",
+                    headers={"X-Profile-Seconds": str(seconds), "X-Profile-Passes": str(passes)})
+
 @http_router.get("/orders.json")
 def orders_json(limit: int = 50):
     return JSONResponse(list_recent_orders(limit=limit))
@@ -298,7 +404,7 @@ BARISTA_HTML = """<!doctype html>
 </head>
 <body>
   <h1>🧋 Barista Console</h1>
-  <p class="muted">Mark orders as done to text the customer that it's ready for pickup.</p>
+  <p class="muted">Mark orders as done to text the customer that it's ready for pickup. <a href="/barista/batches">Batch view →</a></p>
 
   <table id="tbl">
     <thead>
@@ -393,13 +499,116 @@ BARISTA_HTML = """<!doctype html>
 def barista():
     return HTMLResponse(BARISTA_HTML)
 
+# --- Batch view (make identical drinks together, oldest first) ---
+BATCHES_HTML = """<!doctype html>
+<html>
+<head>
+  <meta charset="utf-8" />
+  <title>Barista Batches</title>
+  <style>
+    :root{ color-scheme: light dark; }
+    body { font-family: system-ui, -apple-system, Segoe UI, Roboto, Arial; margin:24px; }
+    h1 { margin: 0 0 12px; }
+    table { width: 100%; border-collapse: collapse; }
+    th, td { border-bottom: 1px solid #ddd; padding: 10px; text-align: left; vertical-align: top; }
+    tr:hover { background: rgba(0,0,0,0.04); }
+    button { padding: 6px 12px; border-radius: 8px; border: 1px solid #999; cursor: pointer; }
+    .muted { color:#777; font-size: 12px; }
+    .count { font-size: 28px; font-weight: 800; }
+    .nowrap { white-space: nowrap; }
+  </style>
+</head>
+<body>
+  <h1>🧋 Batches</h1>
+  <p class="muted">Identical drinks across in-progress orders, oldest first. Marking a batch done advances every order in it; orders with nothing left are marked ready (SMS sent).</p>
+
+  <table id="tbl">
+    <thead>
+      <tr>
+        <th>Qty</th>
+        <th>Drink</th>
+        <th>Orders</th>
+        <th class="nowrap">Waiting</th>
+        <th>Action</th>
+      </tr>
+    </thead>
+    <tbody></tbody>
+  </table>
+
+  <script>
+    const tbody = document.querySelector('#tbl tbody');
+
+    function fmtWait(ts) {
+      const m = Math.max(0, Math.round((Date.now() / 1000 - ts) / 60));
+      return m + ' min';
+    }
+
+    async function load() {
+      const res = await fetch('/api/batches');
+      const list = await res.json();
+      tbody.innerHTML = '';
+      for (const b of list) {
+        const tops = b.toppings.length ? b.toppings.join(', ') : 'no toppings';
+        const adds = b.addons.length ? ' + ' + b.addons.join(', ') : '';
+        const orders = b.orders.map(o => o.order_number + (o.count > 1 ? ' ×' + o.count : '')).join(', ');
+        const tr = document.createElement('tr');
+        tr.innerHTML = `
+          <td class="count">${b.count}</td>
+          <td><strong>${b.flavor}</strong><br/><small class="muted">${tops}${adds} · ${b.sweetness} · ${b.ice}</small></td>
+          <td>${orders}</td>
+          <td class="nowrap">${fmtWait(b.oldest_at)}</td>
+          <td><button data-batch="${b.batch_id}">Batch done</button></td>
+        `;
+        tbody.appendChild(tr);
+      }
+    }
+
+    tbody.addEventListener('click', async (e) => {
+      const btn = e.target.closest('button[data-batch]');
+      if (!btn) return;
+      btn.disabled = true; btn.textContent = 'Sending...';
+      try {
+        const res = await fetch('/api/batches/' + btn.getAttribute('data-batch') + '/done', { method: 'POST' });
+        if (!res.ok) throw new Error('Failed');
+        btn.textContent = 'Done ✅';
+        setTimeout(load, 600);
+      } catch (e) {
+        btn.textContent = 'Error';
+      }
+    });
+
+    function startSSE() {
+      const es = new EventSource('/orders/events');
+      es.onmessage = (ev) => {
+        try {
+          const msg = JSON.parse(ev.data);
+          if (msg.type === 'order_created' || msg.type === 'order_status_changed' || msg.type === 'batch_done') {
+            load();
+          }
+        } catch(e) { /* ignore */ }
+      };
+    }
+
+    load(); startSSE();
+    setInterval(load, 15000);
+  </script>
+</body>
+</html>"""
+
+@http_router.get("/barista/batches")
+def barista_batches():
+    return HTMLResponse(BATCHES_HTML)
+
 @http_router.get("/orders/events")
 async def orders_events():
     q = await subscribe()
+    tid = tenants.current().id
     async def event_gen():
         try:
             while True:
                 msg = await q.get()
+                if isinstance(msg, dict) and msg.get("tenant", tid) != tid:
+                    continue  # another shop's order
                 yield f"data: {_json.dumps(msg)}\n\n"
         except asyncio.CancelledError:
             pass
@@ -420,28 +629,85 @@ def api_get_order(order_no: str):
         raise HTTPException(404, "Order not found")
     return o
 
-@http_router.post("/api/orders/{order_no}/done")
-def api_mark_done(order_no: str):
-    ok = set_order_status(order_no, "ready")
+# live pickup ETA (prep-time estimator)
+@http_router.get("/api/orders/{order_no}/eta")
+def api_order_eta(order_no: str):
+    est = eta_for_order(order_no)
+    if not est:
+        raise HTTPException(404, "Order not in queue")
+    return {"order_number": order_no, **est}
+
+@http_router.get("/api/prep/stats")
+def api_prep_stats():
+    return prep_stats()
+
+# hangup → orders.json/SMS pipeline: queue depth, outcomes, latency
+@http_router.get("/api/finalizer/stats")
+def api_finalizer_stats():
+    return finalizer_stats()
+
+# sales and prep-time rollups (app/analytics.py), kept incrementally
+@http_router.get("/api/analytics")
+def api_analytics(hours: int = Query(24, ge=1, le=24 * 31)):
+    return JSONResponse(analytics.report(hours))
+
+# per-call transcripts, looked up via the index (order number and/or phone)
+@http_router.get("/api/transcripts")
+def api_transcripts(order_number: str | None = None, phone: str | None = None, limit: int = Query(20, ge=1, le=200)):
+    return JSONResponse(find_transcripts(order_number=order_number, phone=normalize_phone(phone), limit=limit))
+
+def _mark_ready(order_no: str, key: str | None = None) -> bool:
+    """Set ready, notify dashboards and text the customer."""
+    ok = set_order_status(order_no, "ready", key)
     if not ok:
-        raise HTTPException(404, "Order not found")
+        return False
     publish({"type": "order_status_changed", "order_number": order_no, "status": "ready"})
-    phone = get_order_phone(order_no)
+    phone = get_order_phone(order_no, key)
     if phone:
         try:
             from .send_sms import send_ready_sms
             send_ready_sms(order_no, phone)
         except Exception as e:
-            print(f"❌ SMS send failed for {order_no}: {e}")
+            log.error("❌ SMS send failed for %s: %s", order_no, e)
+    return True
+
+@http_router.post("/api/orders/{order_no}/done", dependencies=[Depends(limit_writes)])
+def api_mark_done(order_no: str):
+    if not _mark_ready(order_no):
+        raise HTTPException(404, "Order not found")
     return {"ok": True}
 
+# --- Kitchen batches (identical drinks across orders) ---
+@http_router.get("/api/batches")
+def api_batches():
+    return JSONResponse(list_batches())
+
+@http_router.post("/api/batches/{batch_id}/done", dependencies=[Depends(limit_writes)])
+def api_batch_done(batch_id: str, limit: int | None = Query(None, ge=1)):
+    """Mark a batch (or its `limit` oldest drinks) made; orders with nothing left become ready."""
+    taken = take_batch(batch_id, limit)
+    if not taken:
+        raise HTTPException(404, "Batch not found")
+    mark_items_done({key: t["items"] for key, t in taken.items()})
+    ready, partial = [], []
+    for key, t in taken.items():   # by order key: two open orders can share a number
+        order_no = t["order_number"]
+        if order_open(key):
+            set_order_status(order_no, "in_progress", key)
+            publish({"type": "order_status_changed", "order_number": order_no, "status": "in_progress"})
+            partial.append(order_no)
+        elif _mark_ready(order_no, key):
+            ready.append(order_no)
+    publish({"type": "batch_done", "batch_id": batch_id})
+    return {"ok": True, "drinks": sum(len(t["items"]) for t in taken.values()), "ready": ready, "in_progress": partial}
+
 # --- DEV seed (optional)
-@http_router.post("/api/seed")
+@http_router.post("/api/seed", dependencies=[Depends(limit_writes)])
 def api_seed(n: int = Query(2, ge=1, le=10)):
     created = []
     for _ in range(n):
-        add_to_cart(flavor="taro milk tea", toppings=["boba"], addons=["matcha stencil on top"])
-        res = checkout_order(name=None, phone="+16146205644")
+        add_to_cart(flavor="taro milk tea", toppings=["boba", "vanilla cream"], addons=["matcha stencil on top"])
+        res = checkout_order(phone="+16146205644")
         if res.get("ok"):
             # persist and publish so dashboards update immediately
             add_order({
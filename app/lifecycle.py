@@ -0,0 +1,191 @@
+# app/lifecycle.py
+"""
+Active-call tracking, admission control and drain mode.
+
+Admission (`admit`, checked at /voice) refuses a call when the worker is
+draining, already at MAX_CONCURRENT_CALLS (counting calls admitted at
+/voice whose stream hasn't connected yet), or when the event loop is
+already lagging past MAX_LOOP_LAG_MS with calls in progress.
+
+/ready also stays 503 until startup warmup (app/warmup.py) has finished.
+While draining, /voice stops accepting calls (busy or <Redirect>), /ready
+returns 503, and in-flight /twilio sessions are given up to DRAIN_TIMEOUT_S
+to hang up on their own. Drain starts from POST /admin/drain or SIGTERM:
+the SIGTERM handler installed at startup waits for calls before handing the
+signal back to uvicorn, which would otherwise close every WebSocket at once.
+
+At shutdown after a drain, the snapshot at PENDING_SNAPSHOT_PATH is always
+written (`drained: true`). A startup within PENDING_SNAPSHOT_MAX_AGE_S of it
+is treated as a deploy: with RESET_ORDERS_ON_RESTART, open orders stay in
+orders.json (only ready ones are archived), so the barista console keeps
+them. The snapshot's numbered-but-unfinalized orders and carts are not
+turned back into orders (the caller never confirmed them); startup logs
+them and moves the file to PENDING_SNAPSHOT_PATH + ".prev".
+"""
+
+import asyncio, json, os, signal, time
+from collections import deque
+
+from . import call_session
+from .settings import (
+    DRAIN_TIMEOUT_S, DRAIN_ON_SIGTERM, PENDING_SNAPSHOT_PATH, PENDING_SNAPSHOT_MAX_AGE_S,
+    MAX_CONCURRENT_CALLS, MAX_LOOP_LAG_MS, ADMISSION_RESERVE_S,
+)
+from .log import get_logger
+from . import loopmon
+
+log = get_logger(__name__)
+
+_active: set[int] = set()
+_next_id = 0
+_idle = asyncio.Event()
+_idle.set()
+
+_reserved: deque[float] = deque()  # monotonic times of /voice admissions not yet connected
+
+state = {"draining": False, "drain_started_at": None, "rejected": 0, "warm": False, "warmup_ms": None}
+
+def mark_warm(ms: float):
+    state["warm"] = True
+    state["warmup_ms"] = ms
+
+def call_opened() -> int:
+    global _next_id
+    _next_id += 1
+    _active.add(_next_id)
+    _idle.clear()
+    if _reserved:
+        _reserved.popleft()
+    return _next_id
+
+def call_closed(call_id: int):
+    _active.discard(call_id)
+    if not _active:
+        _idle.set()
+
+def active_calls() -> int:
+    return len(_active)
+
+def is_draining() -> bool:
+    return state["draining"]
+
+def _reservations() -> int:
+    cutoff = time.monotonic() - ADMISSION_RESERVE_S
+    while _reserved and _reserved[0] < cutoff:
+        _reserved.popleft()
+    return len(_reserved)
+
+def admit() -> tuple[bool, str | None]:
+    """Decide whether /voice should connect a new call to this worker."""
+    if state["draining"]:
+        return False, "draining"
+    load = active_calls() + _reservations()
+    if MAX_CONCURRENT_CALLS and load >= MAX_CONCURRENT_CALLS:
+        reason = "capacity"
+    elif MAX_LOOP_LAG_MS and load and loopmon.lag_ms() > MAX_LOOP_LAG_MS:
+        reason = "loop_lag"
+    else:
+        _reserved.append(time.monotonic())
+        return True, None
+    state["rejected"] += 1
+    log.warning("🚦 Call refused (%s): active=%d reserved=%d lag=%.1fms",
+                reason, active_calls(), len(_reserved), loopmon.lag_ms())
+    return False, reason
+
+def start_drain(reason: str = "admin"):
+    if state["draining"]:
+        return
+    state["draining"] = True
+    state["drain_started_at"] = time.time()
+    log.warning("🚧 Draining (%s): %d active call(s)", reason, active_calls())
+
+async def wait_for_calls(timeout: float = DRAIN_TIMEOUT_S) -> int:
+    """Wait until no calls are active (or timeout); returns calls still active."""
+    try:
+        await asyncio.wait_for(_idle.wait(), timeout)
+    except asyncio.TimeoutError:
+        log.warning("⏱️ Drain timeout after %ss, %d call(s) still active", timeout, active_calls())
+    return active_calls()
+
+def status() -> dict:
+    return {
+        "ready": state["warm"] and not state["draining"],
+        "warm": state["warm"],
+        "warmup_ms": state["warmup_ms"],
+        "draining": state["draining"],
+        "drain_started_at": state["drain_started_at"],
+        "active_calls": active_calls(),
+        "reserved_calls": _reservations(),
+        "max_calls": MAX_CONCURRENT_CALLS,
+        "loop_lag_ms": round(loopmon.lag_ms(), 2),
+        "loop_lag_max_ms": round(loopmon.max_lag_ms(), 2),
+        "loop_blocks": loopmon.blocks(),
+        "rejected_calls": state["rejected"],
+    }
+
+def install_sigterm_drain():
+    """Wrap uvicorn's SIGTERM handler: drain first, then let uvicorn shut down."""
+    if not DRAIN_ON_SIGTERM:
+        return
+    loop = asyncio.get_running_loop()
+    try:
+        prev = signal.getsignal(signal.SIGTERM)
+    except ValueError:
+        return
+    if not callable(prev):
+        return
+
+    async def drain_then_exit(sig, frame):
+        start_drain("SIGTERM")
+        await wait_for_calls()
+        prev(sig, frame)
+
+    def handler(sig, frame):
+        if state["draining"]:
+            prev(sig, frame)  # second SIGTERM: stop waiting
+            return
+        loop.call_soon_threadsafe(lambda: loop.create_task(drain_then_exit(sig, frame)))
+
+    try:
+        signal.signal(signal.SIGTERM, handler)
+    except ValueError:
+        # not on the main thread (e.g. embedded server); admin drain still works
+        pass
+
+def snapshot_pending_orders() -> int:
+    """Persist orders that got a number but were never finalized, plus carts in progress (all open calls)."""
+    sessions = call_session.open_sessions()
+    pending = [o for s in sessions for o in s.pending_orders.values()]
+    carts = [list(s.cart) for s in sessions if s.cart]
+    if not pending and not carts and not state["draining"]:
+        return 0
+    data = {
+        "snapshot_at": int(time.time()),
+        "drained": state["draining"],
+        "pending_orders": pending,
+        "carts": carts,
+    }
+    tmp = PENDING_SNAPSHOT_PATH + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, PENDING_SNAPSHOT_PATH)
+    log.info("💾 Snapshotted %d pending order(s) to %s", len(pending), PENDING_SNAPSHOT_PATH)
+    return len(pending)
+
+def take_drain_snapshot() -> dict | None:
+    """At startup: the snapshot if the last shutdown drained less than PENDING_SNAPSHOT_MAX_AGE_S ago (a deploy)."""
+    if not os.path.exists(PENDING_SNAPSHOT_PATH):
+        return None
+    try:
+        with open(PENDING_SNAPSHOT_PATH, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except ValueError:
+        data = {}
+    os.replace(PENDING_SNAPSHOT_PATH, PENDING_SNAPSHOT_PATH + ".prev")  # read once
+    age = time.time() - (data.get("snapshot_at") or 0)
+    if not data.get("drained") or age > PENDING_SNAPSHOT_MAX_AGE_S:
+        return None
+    if data.get("pending_orders") or data.get("carts"):
+        log.warning("💾 Last drain left %d unfinalized order(s), %d cart(s); see %s.prev",
+                    len(data.get("pending_orders") or []), len(data.get("carts") or []), PENDING_SNAPSHOT_PATH)
+    return data
@@ -0,0 +1,134 @@
+# app/log.py
+"""
+Queue-backed logging for the bridge hot path.
+
+Calling threads (the event loop) only build a LogRecord and put it on a
+queue; message formatting and stdout I/O happen on a QueueListener thread.
+Per-call loggers carry the stream SID as `call_id`. Records logged with
+extra={"noisy": True} are rate-limited per (call_id, message, event) key, and the
+number of suppressed records is reported on the next one let through.
+"""
+
+import atexit, json, logging, logging.handlers, queue, sys, time
+
+from .settings import LOG_LEVEL, LOG_FORMAT, LOG_NOISY_PER_SEC
+
+_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+_listener: logging.handlers.QueueListener | None = None
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Enqueue the raw record; formatting is left to the listener thread."""
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if not hasattr(record, "call_id"):
+            record.call_id = None
+        return record
+
+class NoisyRateLimit(logging.Filter):
+    """At most `per_sec` records per (call_id, msg, event) per second for records marked noisy."""
+    def __init__(self, per_sec: int):
+        super().__init__()
+        self.per_sec = per_sec
+        self._windows: dict[tuple, list] = {}  # key -> [window_start, count, suppressed]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, "noisy", False) or self.per_sec <= 0:
+            return True
+        key = (getattr(record, "call_id", None), record.msg, getattr(record, "event", None))
+        now = time.monotonic()
+        w = self._windows.get(key)
+        if w is None or now - w[0] >= 1.0:
+            suppressed = w[2] if w else 0
+            if len(self._windows) > 10_000:
+                self._windows.clear()
+            self._windows[key] = [now, 1, 0]
+            if suppressed:
+                record.suppressed = suppressed
+            return True
+        if w[1] < self.per_sec:
+            w[1] += 1
+            return True
+        w[2] += 1
+        return False
+
+class JsonFormatter(logging.Formatter):
+    _skip = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "noisy"}
+
+    def format(self, record: logging.LogRecord) -> str:
+        out = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "call_id": getattr(record, "call_id", None),
+            "msg": record.getMessage(),
+        }
+        for k, v in vars(record).items():
+            if k not in self._skip and k not in out:
+                out[k] = v
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        return json.dumps(out, ensure_ascii=False, default=str)
+
+class TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        cid = getattr(record, "call_id", None)
+        if cid:
+            line = f"[{cid[-8:]}] {line}"
+        if getattr(record, "suppressed", 0):
+            line += f" (+{record.suppressed} suppressed)"
+        return line
+
+def setup_logging():
+    """Install the queue handler on the `app` logger and start the listener thread."""
+    global _listener
+    if _listener is not None:
+        return
+    sink = logging.StreamHandler(sys.stdout)
+    sink.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else TextFormatter("%(message)s"))
+    _listener = logging.handlers.QueueListener(_queue, sink, respect_handler_level=False)
+    _listener.start()
+
+    handler = _DeferredQueueHandler(_queue)
+    handler.addFilter(NoisyRateLimit(LOG_NOISY_PER_SEC))
+    root = logging.getLogger("app")
+    root.setLevel(LOG_LEVEL)
+    root.addHandler(handler)
+    root.propagate = False
+    atexit.register(stop_logging)
+
+def stop_logging():
+    """Drain queued records and stop the listener (used on shutdown)."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+class CallLogger(logging.LoggerAdapter):
+    """Per-call adapter; set `call_id` once the stream SID is known."""
+    def __init__(self, logger: logging.Logger, call_id: str | None = None):
+        super().__init__(logger, {"call_id": call_id})
+
+    @property
+    def call_id(self) -> str | None:
+        return self.extra["call_id"]
+
+    @call_id.setter
+    def call_id(self, value: str | None):
+        self.extra["call_id"] = value
+
+    def process(self, msg, kwargs):
+        kwargs["extra"] = {**self.extra, **(kwargs.get("extra") or {})}
+        return msg, kwargs
+
+    def noisy(self, msg, *args, **kwargs):
+        """INFO record for high-frequency events, rate-limited per call and message."""
+        if self.isEnabledFor(logging.INFO):
+            kwargs["extra"] = {**(kwargs.get("extra") or {}), "noisy": True}
+            self.info(msg, *args, **kwargs)
+
+def get_logger(name: str) -> logging.Logger:
+    setup_logging()
+    return logging.getLogger(name)
+
+def call_logger(name: str, call_id: str | None = None) -> CallLogger:
+    return CallLogger(get_logger(name), call_id)
@@ -0,0 +1,99 @@
+# app/loopmon.py
+"""
+Event-loop lag monitor and blocking-call watchdog.
+
+A background task sleeps LOOP_MONITOR_INTERVAL_S at a time and records how
+late it wakes up. `lag_ms()` is a smoothed value (EWMA) suitable for
+admission decisions; `max_lag_ms()` is the worst lag in the current window.
+
+Each wake-up is also a heartbeat. A watchdog thread checks it, and when the
+loop has not ticked for LOOP_BLOCK_WARN_MS it logs the loop thread's stack
+while the blocking call is still running, once per stall. Another warning
+with the total duration follows when the loop recovers.
+"""
+
+import asyncio, sys, threading, time, traceback
+
+from .settings import LOOP_MONITOR_INTERVAL_S, LOOP_BLOCK_WARN_MS
+from .log import get_logger
+
+log = get_logger(__name__)
+
+_ALPHA = 0.3
+_WINDOW_S = 10.0
+
+state = {"lag_ms": 0.0, "max_lag_ms": 0.0, "window_started": 0.0, "samples": 0,
+         "heartbeat": 0.0, "blocks": 0}
+_task: asyncio.Task | None = None
+_watchdog: threading.Thread | None = None
+_stop = threading.Event()
+loop_thread_id: int | None = None
+
+async def _run(interval: float):
+    loop = asyncio.get_running_loop()
+    state["window_started"] = loop.time()
+    state["heartbeat"] = time.monotonic()
+    while True:
+        t0 = loop.time()
+        await asyncio.sleep(interval)
+        now = loop.time()
+        state["heartbeat"] = time.monotonic()
+        lag = max(0.0, (now - t0 - interval) * 1000)
+        state["lag_ms"] += _ALPHA * (lag - state["lag_ms"])
+        if now - state["window_started"] >= _WINDOW_S:
+            state["window_started"] = now
+            state["max_lag_ms"] = lag
+        else:
+            state["max_lag_ms"] = max(state["max_lag_ms"], lag)
+        state["samples"] += 1
+        if LOOP_BLOCK_WARN_MS and lag >= LOOP_BLOCK_WARN_MS:
+            state["blocks"] += 1
+            log.warning("🐢 Event loop was blocked for %.0fms", lag, extra={"loop_lag_ms": round(lag, 1)})
+
+def _watch(interval: float, threshold_s: float):
+    """Watchdog thread: dump the loop thread's stack while it is stuck."""
+    reported = None
+    poll = max(0.01, threshold_s / 4)
+    while not _stop.wait(poll):
+        beat = state["heartbeat"]
+        stalled = time.monotonic() - beat - interval
+        if stalled < threshold_s or beat == reported:
+            continue
+        reported = beat
+        frame = sys._current_frames().get(loop_thread_id)
+        if frame is None:
+            continue
+        stack = "".join(traceback.format_stack(frame))
+        log.warning("🐢 Event loop blocked for %.0fms so far, in:\n%s", stalled * 1000, stack,
+                    extra={"loop_lag_ms": round(stalled * 1000, 1)})
+
+def start_monitor():
+    global _task, _watchdog, loop_thread_id
+    if _task is None or _task.done():
+        loop_thread_id = threading.get_ident()
+        _task = asyncio.get_running_loop().create_task(_run(LOOP_MONITOR_INTERVAL_S))
+    if LOOP_BLOCK_WARN_MS and (_watchdog is None or not _watchdog.is_alive()):
+        _stop.clear()
+        _watchdog = threading.Thread(target=_watch, args=(LOOP_MONITOR_INTERVAL_S, LOOP_BLOCK_WARN_MS / 1000),
+                                     name="loop-watchdog", daemon=True)
+        _watchdog.start()
+
+def stop_monitor():
+    global _task, _watchdog
+    if _task is not None:
+        _task.cancel()
+        _task = None
+    if _watchdog is not None:
+        _stop.set()
+        _watchdog.join(timeout=1)
+        _watchdog = None
+
+def lag_ms() -> float:
+    return state["lag_ms"]
+
+def max_lag_ms() -> float:
+    return state["max_lag_ms"]
+
+def blocks() -> int:
+    """Stalls of at least LOOP_BLOCK_WARN_MS since startup."""
+    return state["blocks"]
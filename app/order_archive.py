@@ -0,0 +1,215 @@
+# app/order_archive.py
+"""
+Cold tier for order history.
+
+orders.json (the hot set) holds open orders and recently finished ones;
+dashboard queries scan it (per-phone lookups use an index kept by
+orders_store). Orders that have been ready for ORDERS_ARCHIVE_AFTER_S
+are moved here by a periodic sweep. When orders.json is reset (startup
+or shutdown), everything in it is moved here, unfinished orders too,
+with their status. History is kept for good rather than wiped.
+
+    ORDERS_ARCHIVE_DIR/<tenant>/2025-06-01.jsonl.gz   one order per line, by created_at day
+    ORDERS_ARCHIVE_DIR/<tenant>/index.json            order_number → day, phone → latest order
+
+Partitions are only appended to. Each sweep adds one gzip member, so
+nothing is rewritten. The index is loaded (or rebuilt from the
+partitions if missing) on first use, then kept in memory. A lookup opens
+one partition, and the last few decoded partitions are cached.
+tools/analytics_backfill.py reads the partitions directly.
+"""
+
+import asyncio, glob, gzip, json, os, threading, time
+from collections import OrderedDict
+
+from .settings import ORDERS_ARCHIVE, ORDERS_ARCHIVE_DIR, ORDERS_ARCHIVE_AFTER_S, ORDERS_ARCHIVE_SWEEP_S
+from .log import get_logger
+from . import tenants
+
+log = get_logger(__name__)
+_lock = threading.RLock()
+
+PARTITION_CACHE = 8     # decoded day files kept in memory
+
+def day_of(order: dict) -> str:
+    return time.strftime("%Y-%m-%d", time.localtime(order.get("created_at") or time.time()))
+
+class OrderArchive:
+    def __init__(self, root: str):
+        self.root = root
+        self._index: dict | None = None      # loaded on first use
+        self._parts: OrderedDict[str, tuple[int, list[dict]]] = OrderedDict()   # day -> (file size, orders)
+
+    def _part_path(self, day: str) -> str:
+        return os.path.join(self.root, f"{day}.jsonl.gz")
+
+    def days(self) -> list[str]:
+        return sorted(os.path.basename(p)[:-len(".jsonl.gz")]
+                      for p in glob.glob(os.path.join(self.root, "*.jsonl.gz")))
+
+    def _load_part(self, day: str) -> list[dict]:
+        path = self._part_path(day)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return []
+        hit = self._parts.get(day)
+        if hit and hit[0] == size:
+            self._parts.move_to_end(day)
+            return hit[1]
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            orders = [json.loads(line) for line in f if line.strip()]
+        self._parts[day] = (size, orders)
+        if len(self._parts) > PARTITION_CACHE:
+            self._parts.popitem(last=False)
+        return orders
+
+    @staticmethod
+    def _index_order(index: dict, day: str, o: dict):
+        no = o.get("order_number")
+        if no:
+            index["orders"][no] = day
+        phone, created = o.get("phone"), o.get("created_at") or 0
+        if phone:
+            prev = index["phones"].get(phone)
+            if prev is None or created >= prev[2]:
+                index["phones"][phone] = [day, no, created]
+
+    def index(self) -> dict:
+        if self._index is None:
+            path = os.path.join(self.root, "index.json")
+            if os.path.exists(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    self._index = json.load(f)
+            else:
+                # first use, or the index was lost: rebuild from the partitions
+                self._index = {"orders": {}, "phones": {}}
+                for day in self.days():
+                    for o in self._load_part(day):
+                        self._index_order(self._index, day, o)
+                if self._index["orders"]:
+                    self._save_index()
+        return self._index
+
+    def _save_index(self):
+        path = os.path.join(self.root, "index.json")
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._index, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def append(self, orders: list[dict]):
+        """Add finished orders: one gzip member per touched day, then the index."""
+        if not orders:
+            return
+        os.makedirs(self.root, exist_ok=True)
+        index = self.index()
+        by_day: dict[str, list[dict]] = {}
+        for o in orders:
+            by_day.setdefault(day_of(o), []).append(o)
+        for day, batch in sorted(by_day.items()):
+            with gzip.open(self._part_path(day), "at", encoding="utf-8") as f:
+                for o in batch:
+                    f.write(json.dumps(o, ensure_ascii=False) + "\n")
+            for o in batch:
+                self._index_order(index, day, o)
+        self._save_index()
+
+    def find(self, order_number: str) -> dict | None:
+        day = self.index()["orders"].get(order_number)
+        if not day:
+            return None
+        for o in reversed(self._load_part(day)):
+            if o.get("order_number") == order_number:
+                return o
+        return None
+
+    def latest_for_phone(self, phone: str) -> dict | None:
+        hit = self.index()["phones"].get(phone)
+        if not hit:
+            return None
+        day, no, _ = hit
+        for o in reversed(self._load_part(day)):
+            if o.get("order_number") == no and o.get("phone") == phone:
+                return o
+        return None
+
+    def recent(self, limit: int) -> list[dict]:
+        """Newest first, reading day files from the latest back."""
+        out: list[dict] = []
+        for day in reversed(self.days()):
+            if len(out) >= limit:
+                break
+            part = sorted(self._load_part(day), key=lambda o: o.get("created_at") or 0, reverse=True)
+            out.extend(part[:limit - len(out)])
+        return out
+
+_archives: dict[str, OrderArchive] = {}
+
+def _archive() -> OrderArchive:
+    tid = tenants.current().id
+    a = _archives.get(tid)
+    if a is None:
+        a = _archives[tid] = OrderArchive(os.path.join(ORDERS_ARCHIVE_DIR, tid))
+    return a
+
+def is_cold(order: dict, now: float, after_s: float = ORDERS_ARCHIVE_AFTER_S) -> bool:
+    """Finished long enough ago to leave the hot set."""
+    if order.get("status") != "ready":
+        return False
+    ready_at = (order.get("status_times") or {}).get("ready") or order.get("created_at") or 0
+    return now - ready_at >= after_s
+
+def append(orders: list[dict]):
+    if not ORDERS_ARCHIVE or not orders:
+        return
+    with _lock:
+        _archive().append(orders)
+
+def find(order_number: str) -> dict | None:
+    if not ORDERS_ARCHIVE:
+        return None
+    with _lock:
+        return _archive().find(order_number)
+
+def latest_for_phone(phone: str) -> dict | None:
+    if not ORDERS_ARCHIVE:
+        return None
+    with _lock:
+        return _archive().latest_for_phone(phone)
+
+def recent(limit: int) -> list[dict]:
+    if not ORDERS_ARCHIVE or limit <= 0:
+        return []
+    with _lock:
+        return _archive().recent(limit)
+
+# ---------- Sweeper ----------
+_task: asyncio.Task | None = None
+
+def _sweep_all() -> int:
+    from .orders_store import archive_finished
+    moved = 0
+    for t in tenants.all_tenants():
+        with tenants.using(t):
+            moved += archive_finished()
+    return moved
+
+async def _run():
+    while True:
+        await asyncio.sleep(ORDERS_ARCHIVE_SWEEP_S)
+        try:
+            await asyncio.to_thread(_sweep_all)
+        except Exception as e:
+            log.error("❌ Order archive sweep failed: %s", e)
+
+def start_sweeper():
+    global _task
+    if ORDERS_ARCHIVE and _task is None:
+        _task = asyncio.get_running_loop().create_task(_run(), name="order-archive")
+
+def stop_sweeper():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        _task = None
@@ -0,0 +1,20 @@
+# app/order_keys.py
+"""
+Unique keys for orders.
+
+Order numbers are four random digits, so two orders can share one (two
+calls drawing the same number, or the same number again later in the day).
+Per-order state in the analytics, batching and ETA indexes is keyed on
+order_key() instead. add_order gives every new order an `id`; orders
+saved before ids existed fall back to created_at + order number.
+"""
+
+import uuid
+
+def new_id() -> str:
+    return uuid.uuid4().hex[:12]
+
+def order_key(order: dict) -> str:
+    if order.get("id"):
+        return order["id"]
+    return f"{order.get('created_at') or 0}:{order.get('order_number')}"
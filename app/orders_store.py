@@ -1,109 +1,279 @@
 # app/orders_store.py
 
-import os, json, threading
+import os, copy, json, threading, time
 from datetime import datetime
 
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-ORDERS_PATH = os.path.join(BASE_DIR, "orders.json")
-_lock = threading.Lock()
+from .log import get_logger
+from .settings import ORDERS_PATH
+from . import eta, batching, analytics, tenants, order_archive
+from .order_keys import new_id, order_key
 
-def init_store():
-    """Create a fresh orders.json with empty list every time server starts."""
+_lock = threading.RLock()
+log = get_logger(__name__)
+
+def _path() -> str:
+    """orders.json of the current tenant (the default tenant uses ORDERS_PATH)."""
+    return tenants.current().orders_path or ORDERS_PATH
+
+class _PhoneIndex:
+    """
+    Per-phone view of the hot set, kept in step with every write, so the
+    per-phone limit and "my usual" never scan orders.json:
+    - active: phone → {order_number: drinks} for orders not ready yet
+    - latest: phone → copy of the newest order; dropped when that order is
+      archived, so the lookup falls back to the archive index
+    """
+    def __init__(self, orders: list[dict] = ()):
+        self.active: dict[str, dict[str, int]] = {}
+        self.latest: dict[str, dict] = {}
+        for o in orders:
+            self.add(o)
+
+    def add(self, o: dict):
+        phone = o.get("phone")
+        if not phone:
+            return
+        if o.get("status") != "ready":
+            self.active.setdefault(phone, {})[o.get("order_number")] = len(o.get("items") or [])
+        prev = self.latest.get(phone)
+        if prev is None or (o.get("created_at") or 0) >= (prev.get("created_at") or 0):
+            self.latest[phone] = copy.deepcopy(o)
+
+    def update(self, o: dict):
+        """Order changed in place (status, item flags)."""
+        phone, no = o.get("phone"), o.get("order_number")
+        if not phone:
+            return
+        if o.get("status") != "ready":
+            self.active.setdefault(phone, {})[no] = len(o.get("items") or [])
+        elif phone in self.active:
+            self.active[phone].pop(no, None)
+            if not self.active[phone]:
+                del self.active[phone]
+        prev = self.latest.get(phone)
+        if prev is not None and prev.get("order_number") == no:
+            self.latest[phone] = copy.deepcopy(o)
+
+    def archived(self, o: dict):
+        phone = o.get("phone")
+        prev = self.latest.get(phone)
+        if prev is not None and prev.get("order_number") == o.get("order_number"):
+            del self.latest[phone]
+
+_phones: dict[str, _PhoneIndex] = {}
+
+def _phone_index() -> _PhoneIndex:
+    tid = tenants.current().id
+    idx = _phones.get(tid)
+    if idx is None:
+        with _lock:
+            idx = _phones.get(tid)
+            if idx is None:   # store not initialised in this process yet
+                idx = _phones[tid] = _PhoneIndex(_read()["orders"])
+    return idx
+
+def _rebuild(orders: list[dict]):
+    eta.rebuild(orders)
+    batching.rebuild(orders)
+    analytics.rebuild(orders)
+    _phones[tenants.current().id] = _PhoneIndex(orders)
+
+def _archive_on_reset(path: str, keep_open: bool = False) -> list[dict]:
+    """
+    Before orders.json is wiped, move its orders to the archive, with the
+    status they had (history is kept, unfinished orders included). With
+    keep_open, orders not ready yet are returned instead, to stay in the
+    new orders.json (restart after a drain).
+    """
+    if not os.path.exists(path):
+        return []
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            orders = json.load(f).get("orders", [])
+    except ValueError:
+        return []
+    kept = [o for o in orders if o.get("status") != "ready"] if keep_open else []
+    done = [o for o in orders if o not in kept]
+    if done and order_archive.ORDERS_ARCHIVE:
+        order_archive.append(done)
+        open_n = sum(1 for o in done if o.get("status") != "ready")
+        log.info("🗄️ Archived %d order(s) (%d unfinished) from %s", len(done), open_n, os.path.basename(path))
+    if kept:
+        log.info("📌 Kept %d open order(s) in %s", len(kept), os.path.basename(path))
+    return kept
+
+def init_store(reset: bool = True, keep_open: bool = False):
+    """Create a fresh orders.json with empty list every time server starts (unless reset=False; keep_open keeps open orders)."""
+    path = _path()
     with _lock:
-        data = {"orders": []}
-        with open(ORDERS_PATH, "w", encoding="utf-8") as f:
+        kept = _archive_on_reset(path, keep_open) if reset else []
+        if not reset and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                orders = json.load(f).get("orders", [])
+            _rebuild(orders)
+            return path
+        _rebuild(kept)
+        data = {"orders": kept}
+        with open(path, "w", encoding="utf-8") as f:
             json.dump(data, f, ensure_ascii=False, indent=2)
-    return ORDERS_PATH
+    return path
+
+def init_all_stores(reset: bool = True, keep_open: bool = False):
+    """init_store for every tenant (startup)."""
+    for t in tenants.all_tenants():
+        with tenants.using(t):
+            init_store(reset, keep_open)
 
-def clear_store():
-    """Wipe all orders (used on graceful shutdown)."""
+def clear_store(keep_open: bool = False):
+    """Wipe orders on graceful shutdown (keep_open: all but open ones, when draining for a deploy)."""
+    path = _path()
+    with _lock:
+        kept = _archive_on_reset(path, keep_open)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"orders": kept}, f, ensure_ascii=False, indent=2)
+        _phones[tenants.current().id] = _PhoneIndex(kept)
+    log.info("🧹 Cleared %s on shutdown", os.path.basename(path))
+
+def archive_finished(now: float | None = None) -> int:
+    """Move orders ready for ORDERS_ARCHIVE_AFTER_S to the archive; keeps the hot set small."""
+    if not order_archive.ORDERS_ARCHIVE:
+        return 0
+    now = time.time() if now is None else now
     with _lock:
-        with open(ORDERS_PATH, "w", encoding="utf-8") as f:
-            json.dump({"orders": []}, f, ensure_ascii=False, indent=2)
-    print("🧹 Cleared orders.json on shutdown")
+        data = _read()
+        cold = [o for o in data["orders"] if order_archive.is_cold(o, now)]
+        if not cold:
+            return 0
+        order_archive.append(cold)
+        data["orders"] = [o for o in data["orders"] if not order_archive.is_cold(o, now)]
+        _write(data)
+        idx = _phone_index()
+        for o in cold:
+            idx.archived(o)
+    log.info("🗄️ Archived %d finished order(s), %d left in %s", len(cold), len(data["orders"]),
+             os.path.basename(_path()))
+    return len(cold)
 
 def _read():
+    path = _path()
     with _lock:
-        if not os.path.exists(ORDERS_PATH):
+        if not os.path.exists(path):
             init_store()
-        with open(ORDERS_PATH, "r", encoding="utf-8") as f:
+        with open(path, "r", encoding="utf-8") as f:
             return json.load(f)
 
 def _write(data):
+    # whole file via rename, so a lock-free reader never sees it half-written
+    path = _path()
     with _lock:
-        with open(ORDERS_PATH, "w", encoding="utf-8") as f:
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
             json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(path + ".tmp", path)
 
 def add_order(order: dict):
     """Append a new order. Must include: order_number, phone, items, total, status, created_at."""
-    data = _read()
-    data["orders"].append(order)
-    _write(data)
+    order.setdefault("status_times", {order.get("status", "received"): time.time()})
+    order.setdefault("id", new_id())   # order numbers repeat; indexes key on order_key()
+    with _lock:
+        data = _read()
+        data["orders"].append(order)
+        _write(data)
+        _phone_index().add(order)
+    eta.on_order_added(order)
+    batching.on_order_added(order)
+    analytics.on_order_added(order)
 
 def list_recent_orders(limit: int = 50):
     data = _read()
     items = list(reversed(data["orders"]))  # newest first
+    if len(items) < limit:
+        items += order_archive.recent(limit - len(items))
     return items[:limit]
 
 def list_in_progress_orders(limit: int = 100):
     data = _read()
     items = [o for o in reversed(data["orders"]) if o.get("status") != "ready"]
-    return [{"order_number": o["order_number"], "status": o.get("status", "received")} for o in items[:limit]]
+    out = []
+    for o in items[:limit]:
+        est = eta.eta_for_order(o["order_number"])
+        out.append({"order_number": o["order_number"], "status": o.get("status", "received"),
+                    "eta_minutes": est["eta_minutes"] if est else None})
+    return out
 
-def get_order_phone(order_number: str) -> str | None:
-    data = _read()
-    for o in data["orders"]:
-        if o.get("order_number") == order_number:
-            return o.get("phone")
-    return None
+def get_order_phone(order_number: str, key: str | None = None) -> str | None:
+    o = get_order(order_number, key)
+    return o.get("phone") if o else None
 
-def set_order_status(order_number: str, status: str) -> bool:
-    data = _read()
-    for o in data["orders"]:
-        if o.get("order_number") == order_number:
-            o["status"] = status
+def set_order_status(order_number: str, status: str, key: str | None = None) -> bool:
+    """Set the status of the order with this order_key, or else the newest one with this number."""
+    # read-modify-write under the lock: the finalizer, the archive sweep and
+    # the barista routes all write from different threads
+    with _lock:
+        data = _read()
+        for o in reversed(data["orders"]):   # numbers repeat: the newest order with it
+            if (order_key(o) == key) if key else (o.get("order_number") == order_number):
+                now = time.time()
+                o["status"] = status
+                o.setdefault("status_times", {})[status] = now
+                _write(data)
+                _phone_index().update(o)
+                break
+        else:
+            return False
+    eta.on_status_changed(o, status, now)
+    batching.on_status_changed(o, status)
+    analytics.on_status_changed(o, status, now)
+    return True
+
+def mark_items_done(done: dict[str, list[int]]) -> int:
+    """Flag items as made ({order_key: [item index]}); one read/write for the whole batch."""
+    with _lock:
+        data = _read()
+        n = 0
+        touched = []
+        for o in data["orders"]:
+            for idx in done.get(order_key(o), ()):
+                items = o.get("items") or []
+                if 0 <= idx < len(items):
+                    items[idx]["done"] = True
+                    n += 1
+                    touched.append(o)
+        if n:
             _write(data)
-            return True
-    return False
+            phones = _phone_index()
+            for o in touched:
+                phones.update(o)
+    return n
 
-def get_order(order_number: str) -> dict | None:
-    """Return full order dict by order_number."""
+def get_order(order_number: str, key: str | None = None) -> dict | None:
+    """Return full order dict by order_key when given, else the newest with order_number."""
     data = _read()
-    for o in data["orders"]:
-        if o.get("order_number") == order_number:
+    for o in reversed(data["orders"]):   # newest first, numbers repeat
+        if (order_key(o) == key) if key else (o.get("order_number") == order_number):
             return o
-    return None
+    return order_archive.find(order_number)
 
 def latest_order_for_phone(phone_e164: str) -> dict | None:
-    """Return the most recent order for a phone (by created_at)."""
-    data = _read()
-    matches = [o for o in data["orders"] if o.get("phone") == phone_e164]
-    if not matches:
-        return None
-    return sorted(matches, key=lambda o: o.get("created_at") or 0, reverse=True)[0]
+    """Return the most recent order for a phone (by created_at): phone index, then archive index."""
+    with _lock:
+        hit = _phone_index().latest.get(phone_e164)
+        if hit is not None:
+            return copy.deepcopy(hit)
+    return order_archive.latest_for_phone(phone_e164)
 
 def count_active_orders_for_phone(phone_e164: str) -> int:
     """Count orders for a phone that are NOT ready (active orders only)."""
     if not phone_e164:
         return 0
-    data = _read()
-    count = 0
-    for o in data["orders"]:
-        if o.get("phone") == phone_e164 and o.get("status") != "ready":
-            count += 1
-    return count
+    with _lock:
+        return len(_phone_index().active.get(phone_e164, ()))
 
 def count_active_drinks_for_phone(phone_e164: str) -> int:
     """Count total number of drinks across all active orders (status != ready) for a phone."""
     if not phone_e164:
         return 0
-    data = _read()
-    total_drinks = 0
-    for o in data["orders"]:
-        if o.get("phone") == phone_e164 and o.get("status") != "ready":
-            items = o.get("items", [])
-            total_drinks += len(items)
-    return total_drinks
+    with _lock:
+        return sum(_phone_index().active.get(phone_e164, {}).values())
 
 def now_iso():
     return datetime.utcnow().isoformat()
\ No newline at end of file
@@ -0,0 +1,146 @@
+# app/playback.py
+"""
+Twilio mark-based playback tracking.
+
+Outbound agent audio is tagged with Twilio `mark` messages: right after the
+first frame of each utterance, every MARK_EVERY_MS of audio, and at the end
+of the utterance (AgentAudioDone). Twilio echoes a mark back once the audio
+before it has actually been played to the caller, which gives us:
+
+- response latency: caller's last voiced frame → first agent audio *played*
+  (mouth-to-ear, minus the caller's network leg). The last voiced frame comes
+  from the VAD gate; with VAD_ENABLED=0 there is none, and the clock starts at
+  the caller's final ConversationText instead, which is later by the STT
+  endpointing delay (`latency_from` in the summary says which was used).
+- barge-in cut-off: agent audio sent but not yet played when we `clear`
+- playback backlog: audio sent to Twilio but not yet played
+
+Marks pending at a `clear` are returned by Twilio immediately; they are
+discarded rather than counted as played.
+"""
+
+import time
+
+MARK_EVERY_MS = 200
+ULAW_BYTES_PER_MS = 8  # μ-law @ 8k
+
+class PlaybackTracker:
+    def __init__(self):
+        self.utt = 0
+        self.in_utterance = False
+        self.sent_ms = 0.0           # total agent audio handed to Twilio
+        self.played_ms = 0.0         # audio confirmed played (from marks)
+        self._last_mark_sent_ms = 0.0
+        self._last_played_at: float | None = None
+        self._utt_first_mark: str | None = None
+        self._utt_played = False
+        self._pending: dict[str, tuple[int, float]] = {}  # name -> (utt, sent_ms at mark)
+        self._seq = 0
+        self._user_turn_end: float | None = None
+        self._prev_turn_end = 0.0
+        self.latency_from: str | None = None   # "voice" | "transcript" | "mixed"
+
+        self.response_latency_ms: list[float] = []
+        self.barge_ins = 0
+        self.cut_off_ms = 0.0
+        self.max_backlog_ms = 0.0
+
+    # ---- outbound side ----
+    def _mark(self) -> str:
+        self._seq += 1
+        name = f"u{self.utt}-{self._seq}"
+        self._pending[name] = (self.utt, self.sent_ms)
+        self._last_mark_sent_ms = self.sent_ms
+        return name
+
+    def on_audio_sent(self, ulaw_len: int) -> str | None:
+        """Call after sending a batch of frames; returns a mark name to send, if any."""
+        if not ulaw_len:
+            return None
+        first = not self.in_utterance
+        if first:
+            self.utt += 1
+            self.in_utterance = True
+            self._utt_played = False
+            if not self._pending:
+                self._last_played_at = None  # idle line: nothing to extrapolate from
+        self.sent_ms += ulaw_len / ULAW_BYTES_PER_MS
+        self.max_backlog_ms = max(self.max_backlog_ms, self.backlog_ms())
+        if first:
+            self._utt_first_mark = self._mark()
+            return self._utt_first_mark
+        if self.sent_ms - self._last_mark_sent_ms >= MARK_EVERY_MS:
+            return self._mark()
+        return None
+
+    def on_utterance_end(self) -> str | None:
+        """AgentAudioDone: close the utterance with a final mark."""
+        if not self.in_utterance:
+            return None
+        self.in_utterance = False
+        return self._mark()
+
+    def on_clear(self):
+        """Barge-in: everything sent but not yet played is cut off."""
+        if self._pending:
+            self.barge_ins += 1
+            self.cut_off_ms += max(0.0, self.sent_ms - self._estimated_played_ms())
+        self._pending.clear()
+        self.played_ms = self.sent_ms
+        self._last_played_at = None
+        self.in_utterance = False
+
+    # ---- inbound side ----
+    def on_user_turn(self, voiced_at: float | None = None):
+        """Caller's final ConversationText; voiced_at is their last loud frame (VAD), if known."""
+        now = time.monotonic()
+        if voiced_at is not None and self._prev_turn_end < voiced_at <= now:
+            self._user_turn_end, basis = voiced_at, "voice"
+        else:
+            # no VAD, or no voice since the last turn: all we have is the transcript
+            self._user_turn_end, basis = now, "transcript"
+        self.latency_from = basis if self.latency_from in (None, basis) else "mixed"
+        self._prev_turn_end = now
+
+    def on_mark(self, name: str | None) -> dict | None:
+        """Twilio echoed a mark; returns an event dict when an utterance starts playing."""
+        entry = self._pending.pop(name or "", None)
+        if entry is None:
+            return None
+        utt, sent_ms = entry
+        now = time.monotonic()
+        self.played_ms = max(self.played_ms, sent_ms)
+        self._last_played_at = now
+        if name == self._utt_first_mark and not self._utt_played:
+            self._utt_played = True
+            latency = None
+            if self._user_turn_end is not None:
+                latency = round((now - self._user_turn_end) * 1000, 1)
+                self.response_latency_ms.append(latency)
+                self._user_turn_end = None
+            return {"utterance": utt, "response_latency_ms": latency}
+        return None
+
+    # ---- metrics ----
+    def _estimated_played_ms(self) -> float:
+        # Between marks, assume real-time playback since the last confirmed mark
+        if self._last_played_at is None:
+            return self.played_ms
+        elapsed = (time.monotonic() - self._last_played_at) * 1000
+        return min(self.sent_ms, self.played_ms + elapsed)
+
+    def backlog_ms(self) -> float:
+        return max(0.0, self.sent_ms - self._estimated_played_ms())
+
+    def summary(self) -> dict:
+        lat = sorted(self.response_latency_ms)
+        return {
+            "utterances": self.utt,
+            "agent_audio_sent_ms": round(self.sent_ms),
+            "response_latency_ms_p50": lat[len(lat) // 2] if lat else None,
+            "response_latency_ms_max": lat[-1] if lat else None,
+            "latency_from": self.latency_from,
+            "barge_ins": self.barge_ins,
+            "cut_off_ms": round(self.cut_off_ms),
+            "max_backlog_ms": round(self.max_backlog_ms),
+        }
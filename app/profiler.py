@@ -0,0 +1,51 @@
+# app/profiler.py
+"""
+On-demand sampling profiler (GET /admin/profile).
+
+A sampler thread snapshots every thread's Python stack with
+sys._current_frames() at a fixed interval for a bounded time. The stacks
+are returned in the collapsed ("folded") format: one line per distinct
+stack, `thread;outer;...;inner count`. flamegraph.pl, speedscope and
+inferno all read it directly. Nothing is instrumented, and the running
+process pays only for the sampling thread while a profile is being taken.
+"""
+
+import os, sys, threading, time
+from collections import Counter
+
+_busy = threading.Lock()   # one profile at a time
+
+class ProfileBusy(Exception):
+    pass
+
+def _label(code) -> str:
+    return f"{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+def sample(seconds: float, interval_s: float, thread_id: int | None = None) -> tuple[Counter, int]:
+    """Blocking: sample stacks for `seconds`; returns (stack counts, number of sampling passes)."""
+    if not _busy.acquire(blocking=False):
+        raise ProfileBusy("A profile is already running")
+    try:
+        me = threading.get_ident()
+        counts: Counter[str] = Counter()
+        passes = 0
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for tid, frame in sys._current_frames().items():
+                if tid == me or (thread_id is not None and tid != thread_id):
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(tid, f"thread-{tid}").replace(";", ":"))
+                counts[";".join(reversed(stack))] += 1
+            passes += 1
+            time.sleep(interval_s)
+        return counts, passes
+    finally:
+        _busy.release()
+
+def collapsed(counts: Counter) -> str:
+    return "".join(f"{stack} {n}\n" for stack, n in counts.most_common())
@@ -0,0 +1,125 @@
+# app/ratelimit.py
+"""
+Token-bucket rate limits: per caller ID at /voice, per client address on
+the write APIs.
+
+Each key has a bucket of `burst` tokens refilled at `per_min` tokens a
+minute; a request takes one token or is refused. Buckets live in an LRU
+dict capped at RATE_LIMIT_MAX_KEYS: a check is O(1) (lookup, refill
+arithmetic, move-to-end) and the idlest key is evicted when full, so an
+evicted key simply starts again with a full bucket. A per_min of 0 (or
+less) means no refill: each key gets `burst` requests until evicted.
+
+/voice hold-and-retry redirects (?retry=N) skip the caller-ID check, but
+only for a CallSid this instance put on hold; the query string alone is
+caller-controlled.
+"""
+
+import math, threading, time
+from collections import OrderedDict
+
+from fastapi import HTTPException, Request
+
+from .settings import (
+    VOICE_RATE_BURST, VOICE_RATE_PER_MIN, API_RATE_BURST, API_RATE_PER_MIN,
+    RATE_LIMIT_MAX_KEYS, RATE_LIMIT_TRUST_XFF, RATE_LIMIT_PROXY_HOPS,
+)
+from .log import get_logger
+
+log = get_logger(__name__)
+
+class TokenBucketLimiter:
+    def __init__(self, name: str, burst: float, per_min: float, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.name = name
+        self.burst = burst
+        self.rate = max(0.0, per_min) / 60.0   # tokens per second; 0 = no refill
+        self.max_keys = max(1, max_keys)
+        self._buckets: OrderedDict[str, list[float]] = OrderedDict()   # key -> [tokens, last refill]
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.limited = 0
+        self.evicted = 0
+        if self.enabled and not self.rate:
+            log.warning("⚠️ %s rate limit has no refill (per_min=%s): %s requests per key", name, per_min, burst)
+
+    @property
+    def enabled(self) -> bool:
+        return self.burst > 0
+
+    def check(self, key: str, now: float | None = None) -> tuple[bool, float]:
+        """Take one token for key. Returns (allowed, seconds until the next token if refused; inf = never)."""
+        if not self.enabled:
+            return True, 0.0
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            b = self._buckets.get(key)
+            if b is None:
+                b = self._buckets[key] = [self.burst, now]
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+                    self.evicted += 1
+            else:
+                self._buckets.move_to_end(key)
+                b[0] = min(self.burst, b[0] + (now - b[1]) * self.rate)
+                b[1] = now
+            if b[0] >= 1:
+                b[0] -= 1
+                self.allowed += 1
+                return True, 0.0
+            self.limited += 1
+            wait = (1 - b[0]) / self.rate if self.rate else math.inf
+            return False, wait
+
+    def stats(self) -> dict:
+        return {"burst": self.burst, "per_min": round(self.rate * 60, 2), "keys": len(self._buckets),
+                "allowed": self.allowed, "limited": self.limited, "evicted": self.evicted}
+
+voice = TokenBucketLimiter("voice", VOICE_RATE_BURST, VOICE_RATE_PER_MIN)
+api_writes = TokenBucketLimiter("api_writes", API_RATE_BURST, API_RATE_PER_MIN)
+
+_held: OrderedDict[str, None] = OrderedDict()   # CallSids sent to the hold-and-retry loop (LRU)
+_held_lock = threading.Lock()
+
+def hold_call(call_sid: str | None):
+    """Remember a call we answered with hold-and-retry TwiML."""
+    if not call_sid:
+        return
+    with _held_lock:
+        _held[call_sid] = None
+        _held.move_to_end(call_sid)
+        if len(_held) > RATE_LIMIT_MAX_KEYS:
+            _held.popitem(last=False)
+
+def was_held(call_sid: str | None) -> bool:
+    with _held_lock:
+        return bool(call_sid) and call_sid in _held
+
+def release_call(call_sid: str | None):
+    with _held_lock:
+        _held.pop(call_sid, None)
+
+def client_address(request: Request) -> str:
+    """
+    Rate-limit key for a request. Behind proxies (RATE_LIMIT_TRUST_XFF), the
+    client is the X-Forwarded-For entry appended by the outermost trusted
+    proxy: RATE_LIMIT_PROXY_HOPS from the right. Entries left of it are
+    whatever the client sent, so they're never used.
+    """
+    if RATE_LIMIT_TRUST_XFF:
+        fwd = [a.strip() for a in request.headers.get("x-forwarded-for", "").split(",") if a.strip()]
+        if len(fwd) >= RATE_LIMIT_PROXY_HOPS:
+            return fwd[-RATE_LIMIT_PROXY_HOPS]
+    return request.client.host if request.client else "unknown"
+
+def limit_writes(request: Request):
+    """FastAPI dependency for write endpoints: 429 with Retry-After once a client's bucket is empty."""
+    addr = client_address(request)
+    ok, wait = api_writes.check(addr)
+    if not ok:
+        log.warning("🚦 Rate limited %s %s from %s", request.method, request.url.path, addr)
+        # no refill (per_min <= 0): no point in a Retry-After
+        headers = {"Retry-After": str(max(1, math.ceil(wait)))} if math.isfinite(wait) else None
+        raise HTTPException(429, "Too many requests", headers=headers)
+
+def stats() -> dict:
+    return {"voice": voice.stats(), "api_writes": api_writes.stats(), "held_calls": len(_held)}
@@ -0,0 +1,132 @@
+# app/recording.py
+"""
+Opt-in call recording (RECORD_CALLS=1).
+
+The bridge hands frames to a CallRecorder, which only enqueues them; a
+single background thread does the μ-law decode and the WAV writes. The
+queue is bounded: when the writer falls behind, new frames are dropped
+(and counted) instead of blocking the event loop. Control messages
+(open/close) are never dropped.
+"""
+
+import os, queue, threading, time, wave, audioop
+
+from .settings import RECORD_CALLS, RECORDINGS_DIR, RECORDING_QUEUE_FRAMES
+from .audio import SAMPLE_WIDTH, CHANNELS
+from .log import get_logger
+
+log = get_logger(__name__)
+
+_q: "queue.Queue[tuple]" = queue.Queue()
+_writer: threading.Thread | None = None
+_writer_lock = threading.Lock()
+_STOP = ("stop",)
+
+def _ensure_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None or not _writer.is_alive():
+            _writer = threading.Thread(target=_run, name="call-recorder", daemon=True)
+            _writer.start()
+
+def _open_wav(path: str, rate: int) -> wave.Wave_write:
+    w = wave.open(path, "wb")
+    w.setnchannels(CHANNELS)
+    w.setsampwidth(SAMPLE_WIDTH)
+    w.setframerate(rate)
+    return w
+
+def _run():
+    files: dict[int, dict[str, wave.Wave_write]] = {}
+    while True:
+        msg = _q.get()
+        kind = msg[0]
+        try:
+            if kind == "frame":
+                _, rid, leg, data = msg
+                w = files.get(rid, {}).get(leg)
+                if w is None:
+                    continue
+                if leg == "caller":
+                    data = audioop.ulaw2lin(data, SAMPLE_WIDTH)
+                w.writeframesraw(data)
+            elif kind == "open":
+                _, rid, paths = msg
+                os.makedirs(RECORDINGS_DIR, exist_ok=True)
+                files[rid] = {
+                    "caller": _open_wav(paths["caller"], 8000),
+                    "agent": _open_wav(paths["agent"], 24000),
+                }
+            elif kind == "close":
+                _, rid, paths, final_paths = msg
+                for leg, w in files.pop(rid, {}).items():
+                    w.close()
+                    if final_paths[leg] != paths[leg]:
+                        os.replace(paths[leg], final_paths[leg])
+            elif kind == "stop":
+                for legs in files.values():
+                    for w in legs.values():
+                        w.close()
+                return
+        except Exception as e:
+            log.error("❌ Recording writer error: %s", e)
+
+class CallRecorder:
+    """Per-call handle; every method is non-blocking."""
+    _next_id = 0
+
+    def __init__(self, stream_sid: str):
+        CallRecorder._next_id += 1
+        self.id = CallRecorder._next_id
+        self.stream_sid = stream_sid
+        self.frames = 0
+        self.dropped = 0
+        self.closed = False
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        self.prefix = f"{stamp}_{stream_sid}"
+        self.paths = {leg: os.path.join(RECORDINGS_DIR, f"{self.prefix}_{leg}.wav")
+                      for leg in ("caller", "agent")}
+        _ensure_writer()
+        _q.put_nowait(("open", self.id, self.paths))
+
+    def _frame(self, leg: str, data: bytes):
+        if self.closed or not data:
+            return
+        if _q.qsize() >= RECORDING_QUEUE_FRAMES:
+            self.dropped += 1
+            return
+        self.frames += 1
+        _q.put_nowait(("frame", self.id, leg, bytes(data)))
+
+    def caller(self, ulaw8k: bytes):
+        """Caller leg: Twilio μ-law @ 8k."""
+        self._frame("caller", ulaw8k)
+
+    def agent(self, lin24k: bytes):
+        """Agent leg: linear16 @ 24k."""
+        self._frame("agent", lin24k)
+
+    def close(self, order_number: str | None = None):
+        """Finalize the WAVs; files are renamed with the order number if there is one."""
+        if self.closed:
+            return
+        self.closed = True
+        tag = f"order-{order_number}_" if order_number else ""
+        final = {leg: os.path.join(RECORDINGS_DIR, f"{tag}{self.prefix}_{leg}.wav")
+                 for leg in self.paths}
+        _q.put_nowait(("close", self.id, self.paths, final))
+        log.info("🎙️ Recording closed: %s%s (%d frames, %d dropped)", tag, self.prefix, self.frames, self.dropped,
+                 extra={"call_id": self.stream_sid})
+
+def start_recording(stream_sid: str) -> CallRecorder | None:
+    """Return a recorder for this call, or None when recording is disabled."""
+    if not RECORD_CALLS:
+        return None
+    return CallRecorder(stream_sid)
+
+def stop_writer(timeout: float = 5.0):
+    """Flush pending frames and stop the writer thread (used on shutdown)."""
+    if _writer is None or not _writer.is_alive():
+        return
+    _q.put_nowait(_STOP)
+    _writer.join(timeout)
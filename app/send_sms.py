@@ -1,27 +1,46 @@
 # app/send_sms.py
 
-import os
-from dotenv import load_dotenv
-from twilio.rest import Client
+import os, threading
 
-load_dotenv()
+from .log import get_logger   # also loads .env (settings.py)
+from . import tenants
 
 SID  = os.environ.get("MSG_TWILIO_ACCOUNT_SID")
 TOK  = os.environ.get("MSG_TWILIO_AUTH_TOKEN")
 FROM = os.environ.get("MSG_TWILIO_FROM_E164")
 
-_client = Client(SID, TOK) if SID and TOK else None
+_client = None
+_client_lock = threading.Lock()
+log = get_logger(__name__)
 
-def send_received_sms(order_no: str, to_phone_no: str):
+def _twilio():
+    """Twilio REST client, built on first use: importing twilio.rest takes ~100ms of cold start."""
+    global _client
+    if _client is None and SID and TOK:
+        with _client_lock:
+            if _client is None:
+                from twilio.rest import Client
+                _client = Client(SID, TOK)
+    return _client
+
+def warm():
+    """Startup warmup (off the event loop), so the first SMS doesn't pay for the import."""
+    _twilio()
+
+def send_received_sms(order_no: str, to_phone_no: str, eta_minutes: int | None = None):
     """Confirmation SMS (sent right after order is placed)."""
-    if not _client:
-        print("❌ Twilio client not configured"); return None
-    print(f"📱 SMS (received) to {to_phone_no}: order {order_no}")
-    return _client.messages.create(
-        from_=FROM, to=to_phone_no,
+    client = _twilio()
+    if not client:
+        log.error("❌ Twilio client not configured"); return None
+    shop = tenants.current()
+    log.info("📱 SMS (received) to %s: order %s", to_phone_no, order_no)
+    eta_line = f"Estimated pickup in about {eta_minutes} min. " if eta_minutes else ""
+    return client.messages.create(
+        from_=shop.sms_from or FROM, to=to_phone_no,
         body=(
-            f"Thanks for your order with Deepgram BobaRista! 🍹 "
+            f"Thanks for your order with {shop.name}! 🍹 "
             f"Your order number is {order_no}. "
+            f"{eta_line}"
             "We’ll text you again when it’s ready for pickup.\n"
             "Reply STOP to opt out."
         )
@@ -29,13 +48,15 @@ def send_received_sms(order_no: str, to_phone_no: str):
 
 def send_ready_sms(order_no: str, to_phone_no: str):
     """Notify order is ready (triggered by /barista Done)."""
-    if not _client:
-        print("❌ Twilio client not configured"); return None
-    print(f"📱 SMS (ready) to {to_phone_no}: order {order_no}")
-    return _client.messages.create(
-        from_=FROM, to=to_phone_no,
+    client = _twilio()
+    if not client:
+        log.error("❌ Twilio client not configured"); return None
+    shop = tenants.current()
+    log.info("📱 SMS (ready) to %s: order %s", to_phone_no, order_no)
+    return client.messages.create(
+        from_=shop.sms_from or FROM, to=to_phone_no,
         body=(
-            f"Hi! Your boba order #{order_no} is now ready for pickup at Deepgram BobaRista. 🧋 "
+            f"Hi! Your boba order #{order_no} is now ready for pickup at {shop.name}. 🧋 "
             "See you soon!\n"
             "Reply STOP to opt out."
         )
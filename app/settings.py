@@ -1,17 +1,119 @@
 # settings.py
 import os
-from dotenv import load_dotenv
 
-load_dotenv()
+def _load_dotenv():
+    """Local runs: load .env from the working dir or the repo root. Containers get their env
+    from the runtime and have no .env, so python-dotenv isn't even imported."""
+    for d in (os.getcwd(), os.path.dirname(os.path.dirname(os.path.abspath(__file__)))):
+        path = os.path.join(d, ".env")
+        if os.path.isfile(path):
+            from dotenv import load_dotenv
+            load_dotenv(path)
+            return
+
+_load_dotenv()
 
 VOICE_HOST = os.getenv("VOICE_HOST", "localhost:8000")
 DG_API_KEY = os.environ["DEEPGRAM_API_KEY"]
 
+# Logging (queue-backed; see log.py)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")                   # text | json
+LOG_NOISY_PER_SEC = int(os.getenv("LOG_NOISY_PER_SEC", "5"))   # per call + message; 0 = unlimited
+# Agent endpoint; point at a local fake (tools/fake_agent.py) for load tests
+DG_AGENT_URL = os.getenv("DG_AGENT_URL", "wss://agent.deepgram.com/v1/agent/converse")
+# Mid-call reconnect when the agent socket drops
+AGENT_CONNECT_TIMEOUT_S = float(os.getenv("AGENT_CONNECT_TIMEOUT_S", "2"))
+AGENT_RECONNECT_ATTEMPTS = int(os.getenv("AGENT_RECONNECT_ATTEMPTS", "3"))   # 0 = end the call instead
+AGENT_CONTEXT_MESSAGES = int(os.getenv("AGENT_CONTEXT_MESSAGES", "30"))     # history re-injected on reconnect
+
 AGENT_LANGUAGE = os.getenv("AGENT_LANGUAGE", "en")
 SPEAK_PROVIDER = {"type": "deepgram", "model": os.getenv("AGENT_TTS_MODEL", "aura-2-odysseus-en")}
 LISTEN_PROVIDER = {"type": "deepgram", "model": os.getenv("AGENT_STT_MODEL", "nova-3")}
 THINK_PROVIDER  = {"type": "google",   "model": os.getenv("AGENT_THINK_MODEL", "gemini-2.5-flash")}
 
+# Greeting pre-rendered once per (voice, text) and played from disk on stream start (see greeting_cache.py)
+GREETING_CACHE = os.getenv("GREETING_CACHE", "1").lower() in ("1", "true", "yes")
+GREETING_CACHE_DIR = os.getenv("GREETING_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "greetings"))
+DG_SPEAK_URL = os.getenv("DG_SPEAK_URL", "https://api.deepgram.com/v1/speak")
+GREETING_RENDER_TIMEOUT_S = float(os.getenv("GREETING_RENDER_TIMEOUT_S", "10"))
+WARMUP_TIMEOUT_S = float(os.getenv("WARMUP_TIMEOUT_S", "20"))   # /ready turns 200 after warmup, or after this
+
+# Multi-location: tenants selected by dialed number (see tenants.py); unset = single shop
+TENANTS_FILE = os.getenv("TENANTS_FILE")
+
+# Call recording (opt-in): both legs written to WAV off the event loop
+RECORD_CALLS = os.getenv("RECORD_CALLS", "0").lower() in ("1", "true", "yes")
+RECORDINGS_DIR = os.getenv("RECORDINGS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "recordings"))
+RECORDING_QUEUE_FRAMES = int(os.getenv("RECORDING_QUEUE_FRAMES", "5000"))  # ~50s of both legs
+
+# Message capture of /twilio sessions for offline replay (see capture.py, tools/replay.py)
+CAPTURE_CALLS = os.getenv("CAPTURE_CALLS", "0").lower() in ("1", "true", "yes")
+CAPTURE_DIR = os.getenv("CAPTURE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "captures"))
+
+# Drain mode / restarts (see lifecycle.py)
+DRAIN_TIMEOUT_S = float(os.getenv("DRAIN_TIMEOUT_S", "300"))
+DRAIN_ON_SIGTERM = os.getenv("DRAIN_ON_SIGTERM", "1").lower() in ("1", "true", "yes")
+DRAIN_REDIRECT_URL = os.getenv("DRAIN_REDIRECT_URL")  # e.g. https://other-host/voice; else busy
+PENDING_SNAPSHOT_PATH = os.getenv("PENDING_SNAPSHOT_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "pending_orders.snapshot.json"))
+RESET_ORDERS_ON_RESTART = os.getenv("RESET_ORDERS_ON_RESTART", "1").lower() in ("1", "true", "yes")
+PENDING_SNAPSHOT_MAX_AGE_S = float(os.getenv("PENDING_SNAPSHOT_MAX_AGE_S", "900"))  # drained this recently = a deploy, open orders kept
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")  # required (X-Admin-Token) for /admin/* endpoints
+
+# Voice-activity gate on caller audio (see app/vad.py)
+VAD_ENABLED = os.getenv("VAD_ENABLED", "0").lower() in ("1", "true", "yes")
+VAD_MIN_RMS = int(os.getenv("VAD_MIN_RMS", "300"))             # 16-bit RMS; below this is never speech
+VAD_SNR = float(os.getenv("VAD_SNR", "3.0"))                    # speech = RMS above noise floor x this
+VAD_HANGOVER_MS = int(os.getenv("VAD_HANGOVER_MS", "1200"))     # keep sending after speech (end-of-turn silence)
+VAD_PREROLL_MS = int(os.getenv("VAD_PREROLL_MS", "300"))        # buffered audio sent ahead of an onset
+VAD_KEEPALIVE_S = float(os.getenv("VAD_KEEPALIVE_S", "5"))
+
+# Caller audio → agent through a bounded per-call queue (see app/uplink.py)
+INBOUND_QUEUE_FRAMES = int(os.getenv("INBOUND_QUEUE_FRAMES", "50"))        # 20ms frames, ~1s of backlog
+INBOUND_QUEUE_POLICY = os.getenv("INBOUND_QUEUE_POLICY", "drop_oldest").lower()  # drop_oldest | drop_newest | coalesce
+INBOUND_COALESCE_FRAMES = int(os.getenv("INBOUND_COALESCE_FRAMES", "10"))  # max frames merged into one send
+
+# Admission control at /voice (see lifecycle.admit)
+MAX_CONCURRENT_CALLS = int(os.getenv("MAX_CONCURRENT_CALLS", "20"))        # per worker; 0 = no limit
+MAX_LOOP_LAG_MS = float(os.getenv("MAX_LOOP_LAG_MS", "50"))               # smoothed lag; 0 = ignore
+ADMISSION_RESERVE_S = float(os.getenv("ADMISSION_RESERVE_S", "15"))       # /voice → /twilio connect window
+OVERFLOW_REDIRECT_URL = os.getenv("OVERFLOW_REDIRECT_URL")                # e.g. https://other-host/voice
+OVERFLOW_MAX_RETRIES = int(os.getenv("OVERFLOW_MAX_RETRIES", "3"))        # hold-and-retry loops before giving up
+# Token-bucket rate limits (see ratelimit.py); burst 0 = off
+VOICE_RATE_BURST = float(os.getenv("VOICE_RATE_BURST", "3"))              # calls in a row per caller ID
+VOICE_RATE_PER_MIN = float(os.getenv("VOICE_RATE_PER_MIN", "1"))          # sustained calls/min per caller ID
+API_RATE_BURST = float(os.getenv("API_RATE_BURST", "30"))                 # write API requests per client address
+API_RATE_PER_MIN = float(os.getenv("API_RATE_PER_MIN", "120"))
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "10000"))      # buckets kept per limiter (LRU)
+RATE_LIMIT_TRUST_XFF = os.getenv("RATE_LIMIT_TRUST_XFF", "0").lower() in ("1", "true", "yes")  # behind a proxy
+RATE_LIMIT_PROXY_HOPS = max(1, int(os.getenv("RATE_LIMIT_PROXY_HOPS", "1")))  # trusted proxies appending to X-Forwarded-For
+LOOP_MONITOR_INTERVAL_S = float(os.getenv("LOOP_MONITOR_INTERVAL_S", "0.1"))
+LOOP_BLOCK_WARN_MS = float(os.getenv("LOOP_BLOCK_WARN_MS", "250"))        # log the loop's stack past this; 0 = off
+PROFILE_MAX_S = float(os.getenv("PROFILE_MAX_S", "60"))                   # cap for /admin/profile?seconds=
+
+# Prep-time estimator / pickup ETA (see eta.py)
+PREP_SECONDS_PER_DRINK = float(os.getenv("PREP_SECONDS_PER_DRINK", "90"))  # prior until real data
+PREP_EWMA_ALPHA = float(os.getenv("PREP_EWMA_ALPHA", "0.2"))
+BARISTAS = int(os.getenv("BARISTAS", "1"))
+
+# Hot order store; other shops' orders.<tenant>.json sit next to it
+ORDERS_PATH = os.getenv("ORDERS_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "orders.json"))
+
+# Order history tiering (see order_archive.py): finished orders leave orders.json for a daily gzip archive
+ORDERS_ARCHIVE = os.getenv("ORDERS_ARCHIVE", "1").lower() in ("1", "true", "yes")
+ORDERS_ARCHIVE_DIR = os.getenv("ORDERS_ARCHIVE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "archive"))
+ORDERS_ARCHIVE_AFTER_S = float(os.getenv("ORDERS_ARCHIVE_AFTER_S", "900"))   # ready this long → archived
+ORDERS_ARCHIVE_SWEEP_S = float(os.getenv("ORDERS_ARCHIVE_SWEEP_S", "60"))
+
+# Sales/throughput rollups, kept across restarts (see analytics.py)
+ANALYTICS_PATH = os.getenv("ANALYTICS_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "analytics.json"))
+ANALYTICS_SAVE_S = float(os.getenv("ANALYTICS_SAVE_S", "300"))   # also saved on shutdown; 0 = shutdown only
+
+# Per-call transcripts (ConversationText, tool calls, timing markers) → JSONL at hangup
+TRANSCRIPTS_ENABLED = os.getenv("TRANSCRIPTS", "1").lower() in ("1", "true", "yes")
+TRANSCRIPTS_DIR = os.getenv("TRANSCRIPTS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "transcripts"))
+TRANSCRIPTS_RETENTION_DAYS = int(os.getenv("TRANSCRIPTS_RETENTION_DAYS", "30"))   # 0 = keep forever
+
 BOBA_PROMPT = """#Role
 You are a virtual boba ordering assistant.
 
@@ -98,6 +200,8 @@ Matcha Stencil on Top (requires Vanilla Cream foam)
 - Use `save_phone_number` ONLY after the user has provided their phone number. Never call this before asking.
 - Use `checkout_order` to generate the order number (do NOT ask for name, only phone). CALL ONLY ONCE.
 - Use `order_is_placed` to check if order already placed in this session.
+- Use `order_eta` when the caller asks how long their order will take; say "about N minutes".
+- Use `reorder_last` when the caller asks for "my usual" or "the same as last time": it puts their previous order in the cart in one step. Read back the drinks it added (and any it skipped). If it returns `caller_phone`, you may offer to use the number they're calling from, but call `save_phone_number` only after they confirm it.
 - Business rule: The add-on "matcha stencil on top" is only available when "vanilla cream" topping (foam) is selected.
 
 #Order Modification Flow (AFTER CHECKOUT)
@@ -122,7 +226,10 @@ Matcha Stencil on Top (requires Vanilla Cream foam)
    "Goodbye!"
 """
 
-def build_deepgram_settings() -> dict:
+DEFAULT_GREETING = "Hey! I am your Deepgram BobaRista. What would you like to order?"
+
+def build_deepgram_settings(prompt: str = BOBA_PROMPT, voice: str | None = None,
+                            greeting: str = DEFAULT_GREETING) -> dict:
     return {
         "type": "Settings",
         "audio": {
@@ -134,9 +241,9 @@ def build_deepgram_settings() -> dict:
             "listen": {"provider": LISTEN_PROVIDER},
             "think": {
                 "provider": THINK_PROVIDER,
-                "prompt": BOBA_PROMPT,
+                "prompt": prompt,
             },
-            "speak": {"provider": SPEAK_PROVIDER},
-            "greeting": "Hey! I am your Deepgram BobaRista. What would you like to order?",
+            "speak": {"provider": {**SPEAK_PROVIDER, "model": voice or SPEAK_PROVIDER["model"]}},
+            "greeting": greeting,
         },
     }
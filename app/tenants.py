@@ -0,0 +1,162 @@
+# app/tenants.py
+"""
+Multi-location tenancy: one deployment, several shops.
+
+Tenants come from TENANTS_FILE (JSON); without it there is just the
+"default" tenant built from settings.py, so single-shop setups don't
+change. A tenant is picked by the dialed number (Twilio `To`) at /voice and
+handed to /twilio as a <Stream> <Parameter>; dashboards and APIs pick it
+with ?tenant=<id> (remembered in a cookie), X-Tenant, or get the default.
+
+    {"tenants": [{
+        "id": "downtown", "name": "BobaRista Downtown",
+        "numbers": ["+15555550101"],
+        "menu": {"flavors": [...], "toppings": [...], "addons": [...]},
+        "voice": "aura-2-thalia-en",
+        "greeting": "Hi, this is BobaRista Downtown! What can I get you?",
+        "prompt": null,                  # full prompt override (else BOBA_PROMPT, menu swapped in)
+        "sms_from": "+15555550199"
+    }]}
+
+Everything derived from a tenant (menu index, prompt, Settings payload) is
+built once at load; per-call code only reads it. The active tenant is a
+context variable: set per HTTP request by TenantMiddleware, per call by
+the bridge, per job by the finalizer.
+"""
+
+import contextvars, json, os, re
+from contextlib import contextmanager
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qs
+
+from .settings import TENANTS_FILE, BOBA_PROMPT, SPEAK_PROVIDER, DEFAULT_GREETING, ORDERS_PATH
+from .business_logic import MENU, TOPPING_ALIASES, ADDON_ALIASES, normalize_phone
+from .log import get_logger
+
+log = get_logger(__name__)
+
+DEFAULT_ID = "default"
+_ID_RE = re.compile(r"^[a-z0-9][a-z0-9_-]{0,31}$")
+_MENU_SECTION = re.compile(r"#Menu\n.*?(?=\n#)", re.S)
+
+class Tenant:
+    def __init__(self, tid: str, name: str, numbers=(), menu: dict | None = None,
+                 voice: str | None = None, greeting: str | None = None, prompt: str | None = None,
+                 sms_from: str | None = None):
+        self.id = tid
+        self.name = name
+        self.numbers = [n for n in (normalize_phone(x) for x in numbers) if n]
+        self.menu = {k: [str(v).strip().lower() for v in (menu or MENU).get(k) or []]
+                     for k in ("flavors", "toppings", "addons")}
+        self.voice = voice or SPEAK_PROVIDER["model"]
+        self.greeting = greeting or (DEFAULT_GREETING if tid == DEFAULT_ID
+                                     else f"Hey! I am your {name} barista. What would you like to order?")
+        self.prompt = prompt or self._menu_prompt(menu)
+        self.sms_from = sms_from  # None → MSG_TWILIO_FROM_E164
+        # default tenant keeps orders.json (and orders_store.ORDERS_PATH overrides)
+        self.orders_path = None if tid == DEFAULT_ID else os.path.join(os.path.dirname(ORDERS_PATH), f"orders.{tid}.json")
+        # alias maps restricted to what this shop sells, so "foam" can't match an item it doesn't have
+        self.topping_aliases = {k: v for k, v in TOPPING_ALIASES.items() if k in self.menu["toppings"]}
+        self.addon_aliases = {k: v for k, v in ADDON_ALIASES.items() if k in self.menu["addons"]}
+        self.flavor_set = frozenset(self.menu["flavors"])
+
+    def _menu_prompt(self, menu: dict | None) -> str:
+        if not menu:
+            return BOBA_PROMPT
+        m = self.menu
+        section = (
+            "#Menu\nSTEP 1: CHOOSE A MILK TEA FLAVOR\n" + ", ".join(f.title() for f in m["flavors"]) +
+            "\n\nSTEP 2: CHOOSE YOUR TOPPINGS\n" + "\n".join(t.title() for t in m["toppings"]) + "\n"
+        )
+        if m["addons"]:
+            section += "\nSTEP 3: Optional Add-On\n" + "\n".join(a.title() for a in m["addons"]) + "\n"
+        return _MENU_SECTION.sub(lambda _: section, BOBA_PROMPT, count=1)
+
+    def menu_summary_text(self) -> str:
+        m = self.menu
+        text = f"We have {', '.join(f.title() for f in m['flavors'])}. Toppings: {', '.join(m['toppings'])}."
+        if m["addons"]:
+            text += f" Optional add-ons: {', '.join(m['addons'])}."
+        return text
+
+DEFAULT = Tenant(DEFAULT_ID, "Deepgram BobaRista")
+_tenants: dict[str, Tenant] = {DEFAULT_ID: DEFAULT}
+_by_number: dict[str, Tenant] = {}
+_current: contextvars.ContextVar[Tenant] = contextvars.ContextVar("tenant", default=DEFAULT)
+
+def load(path: str | None = TENANTS_FILE):
+    """(Re)load tenants from JSON; the default tenant always exists."""
+    global _tenants, _by_number
+    tenants = {DEFAULT_ID: DEFAULT}
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            for cfg in json.load(f).get("tenants", []):
+                tid = str(cfg.get("id") or "").lower()
+                if not _ID_RE.match(tid):
+                    raise ValueError(f"Invalid tenant id {cfg.get('id')!r} in {path}")
+                tenants[tid] = Tenant(tid, cfg.get("name") or tid, cfg.get("numbers") or (),
+                                      cfg.get("menu"), cfg.get("voice"), cfg.get("greeting"),
+                                      cfg.get("prompt"), cfg.get("sms_from"))
+    _tenants = tenants
+    _by_number = {n: t for t in tenants.values() for n in t.numbers}
+    if path:
+        log.info("🏪 Loaded %d tenant(s) from %s", len(tenants), path)
+
+def get(tid: str | None) -> Tenant | None:
+    return _tenants.get((tid or DEFAULT_ID).lower())
+
+def all_tenants() -> list[Tenant]:
+    return list(_tenants.values())
+
+def for_number(to: str | None) -> Tenant:
+    """Tenant for a dialed number; unknown numbers go to the default shop."""
+    return _by_number.get(normalize_phone(to) or "", DEFAULT)
+
+def current() -> Tenant:
+    return _current.get()
+
+def activate(tenant: Tenant):
+    """Make `tenant` current for the rest of this task (and tasks/threads it starts)."""
+    return _current.set(tenant)
+
+@contextmanager
+def using(tenant: Tenant):
+    token = _current.set(tenant)
+    try:
+        yield tenant
+    finally:
+        _current.reset(token)
+
+class TenantMiddleware:
+    """Pure ASGI: picks the tenant for HTTP requests from ?tenant=, X-Tenant or the tenant cookie."""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1")).get("tenant", [None])[0]
+        headers = dict(scope.get("headers") or [])
+        tid = query or headers.get(b"x-tenant", b"").decode("latin-1")
+        tenant = get(tid) if tid else None
+        if not tid and b"cookie" in headers:
+            morsel = SimpleCookie(headers[b"cookie"].decode("latin-1")).get("tenant")
+            tenant = get(morsel.value) if morsel else None   # stale cookie → default
+        if tid and tenant is None:
+            body = json.dumps({"detail": f"Unknown tenant '{tid}'"}).encode()
+            await send({"type": "http.response.start", "status": 404,
+                        "headers": [(b"content-type", b"application/json")]})
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        async def send_with_cookie(message):
+            if query and message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [
+                    (b"set-cookie", f"tenant={tenant.id}; Path=/; SameSite=Lax".encode())]
+            await send(message)
+
+        with using(tenant or DEFAULT):
+            await self.app(scope, receive, send_with_cookie if query else send)
+
+load()
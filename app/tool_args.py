@@ -0,0 +1,167 @@
+# app/tool_args.py
+"""
+Tool argument validation, compiled from the JSON schemas in FUNCTION_DEFS.
+
+Each tool's "parameters" schema is compiled once (at import) into a list
+of per-field converters, so a call is one dict pass with no schema walk.
+A validator:
+- coerces what the LLM commonly gets almost right: "1" / 1.0 → 1 for
+  integers, numbers → strings, "boba, pudding" → ["boba", "pudding"]
+  for string arrays, "true"/"false" → booleans
+- treats null as "not given" and drops fields the schema doesn't have
+- checks required fields and integer minimum/maximum, and enum if present
+
+It returns the cleaned kwargs, or raises ArgumentError listing every bad
+field, so the agent gets one precise error back instead of a TypeError
+from deep inside a handler.
+"""
+
+import re
+from typing import Any, Callable
+
+class ArgumentError(ValueError):
+    def __init__(self, errors: list[str]):
+        self.errors = errors
+        super().__init__("; ".join(errors))
+
+_INT_RE = re.compile(r"[+-]?\d+")
+_TRUE = {"true", "yes", "1"}
+_FALSE = {"false", "no", "0"}
+
+def _describe(v) -> str:
+    if v is None:
+        return "null"
+    if isinstance(v, bool):
+        return "boolean"
+    if isinstance(v, str):
+        return f"string {v[:40]!r}"
+    if isinstance(v, (int, float)):
+        return f"number {v!r}"
+    if isinstance(v, dict):
+        return "object"
+    if isinstance(v, (list, tuple)):
+        return "array"
+    return type(v).__name__
+
+def _string(spec: dict) -> Callable[[Any], str]:
+    enum = spec.get("enum")
+    def conv(v):
+        if isinstance(v, str):
+            s = v
+        elif isinstance(v, (int, float)) and not isinstance(v, bool):
+            s = str(v)
+        else:
+            raise ValueError(f"expected string, got {_describe(v)}")
+        if enum and s not in enum:
+            raise ValueError(f"must be one of {', '.join(enum)}, got {s!r}")
+        return s
+    return conv
+
+def _integer(spec: dict) -> Callable[[Any], int]:
+    lo, hi = spec.get("minimum"), spec.get("maximum")
+    def conv(v):
+        if isinstance(v, int) and not isinstance(v, bool):
+            n = v
+        elif isinstance(v, float) and v.is_integer():
+            n = int(v)
+        elif isinstance(v, str) and _INT_RE.fullmatch(v.strip()):
+            n = int(v.strip())
+        else:
+            raise ValueError(f"expected integer, got {_describe(v)}")
+        if lo is not None and n < lo:
+            raise ValueError(f"must be >= {lo}, got {n}")
+        if hi is not None and n > hi:
+            raise ValueError(f"must be <= {hi}, got {n}")
+        return n
+    return conv
+
+def _number(spec: dict) -> Callable[[Any], float]:
+    def conv(v):
+        if isinstance(v, (int, float)) and not isinstance(v, bool):
+            return v
+        if isinstance(v, str):
+            try:
+                return float(v.strip())
+            except ValueError:
+                pass
+        raise ValueError(f"expected number, got {_describe(v)}")
+    return conv
+
+def _boolean(spec: dict) -> Callable[[Any], bool]:
+    def conv(v):
+        if isinstance(v, bool):
+            return v
+        s = str(v).strip().lower() if isinstance(v, (str, int)) else None
+        if s in _TRUE:
+            return True
+        if s in _FALSE:
+            return False
+        raise ValueError(f"expected boolean, got {_describe(v)}")
+    return conv
+
+def _array(spec: dict) -> Callable[[Any], list]:
+    items = spec.get("items") or {}
+    item = _compile(items)
+    split = items.get("type") == "string"
+    def conv(v):
+        if isinstance(v, str) and split:
+            v = [s.strip() for s in v.split(",")]
+            v = [s for s in v if s]
+        elif not isinstance(v, (list, tuple)):
+            if split and isinstance(v, (int, float)) and not isinstance(v, bool):
+                v = [v]
+            else:
+                raise ValueError(f"expected array, got {_describe(v)}")
+        out = []
+        for i, x in enumerate(v):
+            if x is None:
+                continue
+            try:
+                out.append(item(x))
+            except ValueError as e:
+                raise ValueError(f"[{i}]: {e}") from None
+        return out
+    return conv
+
+def _any(spec: dict) -> Callable[[Any], Any]:
+    return lambda v: v
+
+_TYPES = {"string": _string, "integer": _integer, "number": _number,
+          "boolean": _boolean, "array": _array}
+
+def _compile(spec: dict) -> Callable[[Any], Any]:
+    return _TYPES.get(spec.get("type"), _any)(spec)
+
+def compile_schema(params: dict) -> Callable[[Any], tuple[dict, list[str]]]:
+    """Validator for one tool's "parameters" schema: args → (clean kwargs, dropped field names)."""
+    fields = [(name, _compile(spec)) for name, spec in (params.get("properties") or {}).items()]
+    known = {name for name, _ in fields}
+    required = list(params.get("required") or [])
+
+    def validate(args) -> tuple[dict, list[str]]:
+        if args is None:
+            args = {}
+        elif not isinstance(args, dict):
+            raise ArgumentError([f"arguments must be an object, got {_describe(args)}"])
+        clean, errors = {}, []
+        for name, conv in fields:
+            v = args.get(name)
+            if v is None:
+                continue
+            try:
+                clean[name] = conv(v)
+            except ValueError as e:
+                sep = "" if str(e).startswith("[") else ": "
+                errors.append(f"{name}{sep}{e}")
+        for name in required:
+            if args.get(name) is None:
+                errors.append(f"{name}: required")
+        if errors:
+            raise ArgumentError(errors)
+        dropped = [k for k in args if k not in known] if len(args) > len(clean) else []
+        return clean, dropped
+
+    return validate
+
+def compile_tools(defs: list[dict]) -> dict[str, Callable[[Any], tuple[dict, list[str]]]]:
+    return {d["name"]: compile_schema(d.get("parameters") or {}) for d in defs}
@@ -0,0 +1,153 @@
+# app/transcripts.py
+"""
+Per-call structured transcripts.
+
+During the call, entries (ConversationText, function calls/results and
+timing markers) are appended to an in-memory list only. At hangup the
+whole call is serialized on a worker thread and appended to the shop's
+daily file, TRANSCRIPTS_DIR/<tenant>/<YYYY-MM-DD>.jsonl. Each call also
+gets one index line (order number, phone, byte offset) in
+<YYYY-MM-DD>.idx.jsonl, so lookups don't scan the transcripts.
+
+Lookups only see the current tenant's files. They read day indexes newest
+first and stop at `limit`. Days older than TRANSCRIPTS_RETENTION_DAYS are
+deleted when a new day starts, so neither the files nor a lookup grows
+without bound. Flushes still running at shutdown are awaited (drain).
+"""
+
+import os, glob, json, time, asyncio, threading
+
+from .settings import TRANSCRIPTS_ENABLED, TRANSCRIPTS_DIR, TRANSCRIPTS_RETENTION_DAYS
+from .log import get_logger
+from . import tenants
+
+_lock = threading.Lock()
+_pending: set[asyncio.Task] = set()
+_pruned_day: str | None = None      # last day retention ran
+log = get_logger(__name__)
+
+def _dir(tid: str) -> str:
+    return os.path.join(TRANSCRIPTS_DIR, tid)
+
+def _day(ts: float) -> str:
+    return time.strftime("%Y-%m-%d", time.localtime(ts))
+
+def _days(tid: str) -> list[str]:
+    return sorted(os.path.basename(p)[:-len(".idx.jsonl")]
+                  for p in glob.glob(os.path.join(_dir(tid), "*.idx.jsonl")))
+
+class CallTranscript:
+    def __init__(self):
+        self.t0 = time.monotonic()
+        self.started_at = time.time()
+        self.stream_sid: str | None = None
+        self.entries: list[dict] = []
+        self._fn_started: dict[str, float] = {}
+        self.closed = False
+
+    def _ms(self) -> int:
+        return int((time.monotonic() - self.t0) * 1000)
+
+    def mark(self, name: str, **extra):
+        """Timing marker (e.g. agent_connected, first_agent_audio, UserStartedSpeaking)."""
+        self.entries.append({"t_ms": self._ms(), "kind": "mark", "name": name, **extra})
+
+    def text(self, role: str | None, content: str | None):
+        self.entries.append({"t_ms": self._ms(), "kind": "text", "role": role, "content": content})
+
+    def function_call(self, fn_id: str | None, name: str | None, args: dict):
+        self._fn_started[fn_id or ""] = time.monotonic()
+        self.entries.append({"t_ms": self._ms(), "kind": "function_call", "id": fn_id,
+                             "name": name, "args": args})
+
+    def function_result(self, fn_id: str | None, name: str | None, content: str):
+        t = self._fn_started.pop(fn_id or "", None)
+        try:
+            result = json.loads(content)
+        except (TypeError, ValueError):
+            result = content
+        self.entries.append({
+            "t_ms": self._ms(), "kind": "function_result", "id": fn_id, "name": name,
+            "result": result,
+            "duration_ms": round((time.monotonic() - t) * 1000, 2) if t is not None else None,
+        })
+
+    def close(self, order_number: str | None = None, phone: str | None = None):
+        """Schedule the async flush; safe to call more than once."""
+        if self.closed or not TRANSCRIPTS_ENABLED:
+            return
+        self.closed = True
+        record = {
+            "tenant": tenants.current().id,
+            "stream_sid": self.stream_sid,
+            "order_number": order_number,
+            "phone": phone,
+            "started_at": int(self.started_at),
+            "duration_ms": self._ms(),
+            "turns": sum(1 for e in self.entries if e["kind"] == "text"),
+            "function_calls": sum(1 for e in self.entries if e["kind"] == "function_call"),
+            "entries": self.entries,
+        }
+        task = asyncio.get_running_loop().create_task(asyncio.to_thread(_append, record))
+        _pending.add(task)
+        task.add_done_callback(_pending.discard)
+
+async def drain():
+    """Wait for transcript flushes still running (shutdown)."""
+    if _pending:
+        await asyncio.gather(*list(_pending), return_exceptions=True)
+
+def _prune(today: str):
+    """Delete days older than TRANSCRIPTS_RETENTION_DAYS, for every tenant; runs once per day."""
+    global _pruned_day
+    if _pruned_day == today or TRANSCRIPTS_RETENTION_DAYS <= 0:
+        return
+    _pruned_day = today
+    cutoff = _day(time.time() - TRANSCRIPTS_RETENTION_DAYS * 86400)
+    for path in glob.glob(os.path.join(TRANSCRIPTS_DIR, "*", "*.jsonl")):
+        if os.path.basename(path)[:10] < cutoff:
+            os.remove(path)
+
+def _append(record: dict):
+    line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+    day = _day(record["started_at"])
+    root = _dir(record["tenant"])
+    try:
+        with _lock:
+            _prune(_day(time.time()))
+            os.makedirs(root, exist_ok=True)
+            with open(os.path.join(root, f"{day}.jsonl"), "ab") as f:
+                offset = f.tell()
+                f.write(line)
+            idx = {
+                "order_number": record["order_number"],
+                "phone": record["phone"],
+                "stream_sid": record["stream_sid"],
+                "started_at": record["started_at"],
+                "offset": offset,
+                "length": len(line),
+            }
+            with open(os.path.join(root, f"{day}.idx.jsonl"), "a", encoding="utf-8") as f:
+                f.write(json.dumps(idx) + "\n")
+    except Exception as e:
+        log.error("❌ Failed to write transcript: %s", e)
+
+def find_transcripts(order_number: str | None = None, phone: str | None = None, limit: int = 20) -> list[dict]:
+    """Look up the current tenant's transcripts by order number and/or phone (newest first)."""
+    tid = tenants.current().id
+    out = []
+    with _lock:
+        for day in reversed(_days(tid)):
+            if len(out) >= limit:
+                break
+            with open(os.path.join(_dir(tid), f"{day}.idx.jsonl"), "r", encoding="utf-8") as f:
+                hits = [e for e in map(json.loads, f)
+                        if (order_number is None or e.get("order_number") == order_number)
+                        and (phone is None or e.get("phone") == phone)]
+            if not hits:
+                continue
+            with open(os.path.join(_dir(tid), f"{day}.jsonl"), "rb") as f:
+                for e in hits[::-1][:limit - len(out)]:
+                    f.seek(e["offset"])
+                    out.append(json.loads(f.read(e["length"])))
+    return out
@@ -0,0 +1,68 @@
+# app/twilio_proto.py
+"""
+Twilio Media Streams message codec, tuned for the 20ms media path.
+
+Inbound: `parse` recognizes `media` events by their leading bytes and
+slices the base64 payload straight out of the text, without building the
+event dict; everything else (start, mark, stop, odd layouts) falls back to
+json.loads.
+
+Outbound: `MediaEncoder` pre-renders the per-stream JSON around the
+payload, and `frames` slices agent audio with memoryview instead of
+copying each 160-byte frame.
+"""
+
+import binascii, json
+
+# Twilio sends compact JSON; the spaced form is what json.dumps produces (test clients)
+MEDIA_PREFIXES = ('{"event":"media"', '{"event": "media"')
+_PAYLOAD_KEY = '"payload":'
+
+def parse(raw: str) -> tuple[str | None, bytes | None, dict | None]:
+    """Returns (event, media payload, full event dict). For media the dict is None on the fast path."""
+    if raw.startswith(MEDIA_PREFIXES):
+        i = raw.find(_PAYLOAD_KEY)
+        if i != -1:
+            i += len(_PAYLOAD_KEY)
+            i += raw.startswith(" ", i)
+            j = raw.find('"', i + 1)
+            if raw.startswith('"', i) and j != -1 and raw.find("\\", i, j) == -1:
+                try:
+                    return "media", binascii.a2b_base64(raw[i + 1:j]), None
+                except (binascii.Error, ValueError):
+                    pass
+    try:
+        evt = json.loads(raw)
+    except ValueError:
+        return None, None, None
+    etype = evt.get("event")
+    if etype == "media":
+        try:
+            return etype, binascii.a2b_base64((evt.get("media") or {}).get("payload") or ""), evt
+        except (binascii.Error, ValueError):
+            return None, None, evt
+    return etype, None, evt
+
+class MediaEncoder:
+    """Outbound messages for one stream, with everything but the payload pre-rendered."""
+    def __init__(self, stream_sid: str):
+        sid = json.dumps(stream_sid)
+        self._media_head = '{"event":"media","streamSid":%s,"media":{"payload":"' % sid
+        self._mark_head = '{"event":"mark","streamSid":%s,"mark":{"name":' % sid
+        self.clear_msg = '{"event":"clear","streamSid":%s}' % sid
+
+    def media(self, frame) -> str:
+        return self._media_head + binascii.b2a_base64(frame, newline=False).decode("ascii") + '"}}'
+
+    def media_b64(self, payload: str) -> str:
+        """Media message for an already base64-encoded frame (cached audio)."""
+        return self._media_head + payload + '"}}'
+
+    def mark(self, name: str) -> str:
+        return self._mark_head + json.dumps(name) + "}}"
+
+def frames(buf: bytes, size: int):
+    """Zero-copy fixed-size slices of buf (the last one may be short)."""
+    mv = memoryview(buf)
+    for i in range(0, len(mv), size):
+        yield mv[i:i + size]
@@ -0,0 +1,140 @@
+# app/uplink.py
+"""
+Caller audio → agent, decoupled from the Twilio receive loop.
+
+The bridge resamples each caller frame and puts it on a bounded per-call
+InboundQueue. A sender task drains the queue into the agent socket. When
+the agent side stalls, only that task waits: the receive loop keeps
+reading, so start/stop/mark and hangup are handled immediately.
+
+The queue holds up to INBOUND_QUEUE_FRAMES messages (20ms frames, or
+KeepAlives). When it is full, INBOUND_QUEUE_POLICY decides:
+- drop_oldest: discard the oldest message (the agent hears the most
+  recent audio, and added latency stays bounded)
+- drop_newest: discard the incoming frame
+- coalesce:    merge the oldest adjacent frames into one message of up to
+  INBOUND_COALESCE_FRAMES, so a short stall loses no audio and the
+  backlog goes out in fewer, larger sends. Drops the oldest once nothing
+  is left to merge.
+
+Per-call counters go into the call summary; totals over ended calls are
+in /ready ("uplink").
+"""
+
+import asyncio, time
+from collections import deque
+
+from .settings import INBOUND_QUEUE_FRAMES, INBOUND_QUEUE_POLICY, INBOUND_COALESCE_FRAMES
+from .log import get_logger
+
+log = get_logger(__name__)
+
+POLICIES = ("drop_oldest", "drop_newest", "coalesce")
+if INBOUND_QUEUE_POLICY not in POLICIES:
+    log.warning("⚠️ Unknown INBOUND_QUEUE_POLICY %r; using drop_oldest", INBOUND_QUEUE_POLICY)
+
+_totals = {"calls": 0, "frames_in": 0, "frames_sent": 0, "frames_dropped": 0, "coalesced": 0, "overflows": 0}
+_max_wait_ms = 0.0
+
+class InboundQueue:
+    def __init__(self, max_items: int = INBOUND_QUEUE_FRAMES, policy: str = INBOUND_QUEUE_POLICY,
+                 coalesce_max: int = INBOUND_COALESCE_FRAMES, logger=None):
+        self.max_items = max(1, max_items)
+        self.policy = policy if policy in POLICIES else "drop_oldest"
+        self.coalesce_max = max(1, coalesce_max)
+        self._q: deque[list] = deque()   # [enqueued_at, payload (list of frames | str), frames]
+        self._ready = asyncio.Event()
+        self._log = logger or log
+        self.frames_in = 0
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.messages_sent = 0
+        self.coalesced = 0
+        self.overflows = 0
+        self.max_depth = 0
+        self.max_wait_ms = 0.0
+        self.max_send_ms = 0.0
+
+    def __len__(self) -> int:
+        return len(self._q)
+
+    def put(self, msg: bytes | str):
+        """Non-blocking. Audio is bytes (one frame); text (KeepAlive) is queued as is."""
+        audio = isinstance(msg, (bytes, bytearray))
+        if audio:
+            self.frames_in += 1
+        if len(self._q) >= self.max_items and not self._make_room(audio):
+            self.frames_dropped += audio
+            return
+        self._q.append([time.perf_counter(), [msg] if audio else msg, 1 if audio else 0])
+        self.max_depth = max(self.max_depth, len(self._q))
+        self._ready.set()
+
+    def _make_room(self, incoming_audio: bool) -> bool:
+        """Queue is full: apply the policy. False = drop the incoming message."""
+        if not self.overflows:
+            self._log.warning("🐢 Agent uplink backlog full (%d messages); policy %s", len(self._q), self.policy)
+        self.overflows += 1
+        if self.policy == "drop_newest" or not incoming_audio:
+            return False
+        if self.policy == "coalesce":
+            q, cap = self._q, self.coalesce_max
+            for i in range(len(q) - 1):
+                a, b = q[i], q[i + 1]
+                if isinstance(a[1], list) and isinstance(b[1], list) and a[2] + b[2] <= cap:
+                    a[1].extend(b[1])
+                    a[2] += b[2]
+                    del q[i + 1]
+                    self.coalesced += 1
+                    return True
+        _, _, frames = self._q.popleft()
+        self.frames_dropped += frames
+        return True
+
+    async def get(self) -> tuple[bytes | str, int]:
+        """Next message for the agent and how many caller frames it carries."""
+        while not self._q:
+            self._ready.clear()
+            await self._ready.wait()
+        t, payload, frames = self._q.popleft()
+        self.max_wait_ms = max(self.max_wait_ms, (time.perf_counter() - t) * 1000)
+        if isinstance(payload, list):
+            payload = payload[0] if frames == 1 else b"".join(payload)
+        return payload, frames
+
+    def sent(self, frames: int, seconds: float):
+        self.messages_sent += 1
+        self.frames_sent += frames
+        self.max_send_ms = max(self.max_send_ms, seconds * 1000)
+
+    def lost(self, frames: int):
+        """Taken off the queue but the send failed (agent socket dropped)."""
+        self.frames_dropped += frames
+
+    def summary(self) -> dict:
+        return {
+            "policy": self.policy,
+            "frames_in": self.frames_in,
+            "frames_sent": self.frames_sent,
+            "frames_dropped": self.frames_dropped,
+            "messages_sent": self.messages_sent,
+            "coalesced": self.coalesced,
+            "overflows": self.overflows,
+            "max_depth": self.max_depth,
+            "max_wait_ms": round(self.max_wait_ms, 1),
+            "max_send_ms": round(self.max_send_ms, 1),
+        }
+
+    def finish(self) -> dict:
+        """End of call: fold this call's counters into the process totals."""
+        global _max_wait_ms
+        s = self.summary()
+        _totals["calls"] += 1
+        for k in ("frames_in", "frames_sent", "frames_dropped", "coalesced", "overflows"):
+            _totals[k] += s[k]
+        _max_wait_ms = max(_max_wait_ms, self.max_wait_ms)
+        return s
+
+def stats() -> dict:
+    return {**_totals, "max_wait_ms": round(_max_wait_ms, 1), "max_frames": INBOUND_QUEUE_FRAMES,
+            "policy": INBOUND_QUEUE_POLICY if INBOUND_QUEUE_POLICY in POLICIES else "drop_oldest"}
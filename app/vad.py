@@ -0,0 +1,107 @@
+# app/vad.py
+"""
+Energy-based voice-activity gate for caller audio (VAD_ENABLED=1).
+
+Each inbound μ-law frame is scored by RMS energy against an adaptive
+threshold: max(VAD_MIN_RMS, noise floor * VAD_SNR), where the noise floor
+tracks quiet frames. The gate opens on the first loud frame and stays open
+for VAD_HANGOVER_MS after the last one, so the agent still hears the
+trailing silence it uses to detect end of turn. While closed, frames are
+held in a VAD_PREROLL_MS ring buffer that is flushed ahead of the onset
+frame, so speech starts are never clipped. The time of the last loud
+frame (`last_voiced_at`) is where playback starts its response-latency clock.
+
+Frames the gate drops are never resampled or sent; the bridge sends the
+agent a KeepAlive every VAD_KEEPALIVE_S instead.
+"""
+
+import audioop, time
+from collections import deque
+
+from .audio import SAMPLE_WIDTH
+from .settings import (
+    VAD_ENABLED, VAD_MIN_RMS, VAD_SNR, VAD_HANGOVER_MS, VAD_PREROLL_MS, VAD_KEEPALIVE_S,
+)
+
+FRAME_MS = 20
+KEEPALIVE_MSG = '{"type": "KeepAlive"}'
+
+class VadGate:
+    def __init__(self, min_rms: int = VAD_MIN_RMS, snr: float = VAD_SNR,
+                 hangover_ms: int = VAD_HANGOVER_MS, preroll_ms: int = VAD_PREROLL_MS,
+                 keepalive_s: float = VAD_KEEPALIVE_S):
+        self.min_rms = min_rms
+        self.snr = snr
+        self.hangover_frames = max(0, hangover_ms // FRAME_MS)
+        self.preroll: deque[bytes] = deque(maxlen=max(0, preroll_ms // FRAME_MS))
+        self.keepalive_s = keepalive_s
+        self.noise_floor: float | None = None
+        self.open = False
+        self._quiet = 0                   # consecutive quiet frames while open
+        self._last_keepalive = 0.0
+        self.last_voiced_at: float | None = None   # monotonic time of the last loud frame
+        self.frames_in = 0
+        self.frames_sent = 0
+        self.onsets = 0
+        self.keepalives = 0
+
+    def threshold(self) -> float:
+        floor = self.noise_floor if self.noise_floor is not None else 0.0
+        return max(self.min_rms, floor * self.snr)
+
+    def push(self, ulaw: bytes) -> list[bytes]:
+        """Feed one caller frame; returns the frames to forward (pre-roll + frame on onset)."""
+        self.frames_in += 1
+        rms = audioop.rms(audioop.ulaw2lin(ulaw, SAMPLE_WIDTH), SAMPLE_WIDTH)
+        loud = rms > self.threshold()
+        if not loud:
+            # only quiet frames move the floor, so long speech doesn't raise it
+            self.noise_floor = rms if self.noise_floor is None else self.noise_floor + 0.05 * (rms - self.noise_floor)
+
+        if loud:
+            self._quiet = 0
+            self.last_voiced_at = time.monotonic()
+            if not self.open:
+                self.open = True
+                self.onsets += 1
+                out = list(self.preroll)
+                self.preroll.clear()
+                out.append(ulaw)
+                self.frames_sent += len(out)
+                return out
+        elif self.open:
+            self._quiet += 1
+            if self._quiet > self.hangover_frames:
+                self.open = False
+                self._last_keepalive = 0.0
+
+        if self.open:
+            self.frames_sent += 1
+            return [ulaw]
+        if self.preroll.maxlen:
+            self.preroll.append(ulaw)
+        return []
+
+    def keepalive_due(self, now: float | None = None) -> bool:
+        """True when the gate is closed and the agent hasn't had a KeepAlive for keepalive_s."""
+        if self.open:
+            return False
+        now = time.monotonic() if now is None else now
+        if now - self._last_keepalive < self.keepalive_s:
+            return False
+        self._last_keepalive = now
+        self.keepalives += 1
+        return True
+
+    def summary(self) -> dict:
+        return {
+            "frames_in": self.frames_in,
+            "frames_sent": self.frames_sent,
+            "sent_ratio": round(self.frames_sent / self.frames_in, 3) if self.frames_in else None,
+            "onsets": self.onsets,
+            "keepalives": self.keepalives,
+            "noise_floor_rms": round(self.noise_floor or 0.0, 1),
+        }
+
+def new_gate() -> VadGate | None:
+    return VadGate() if VAD_ENABLED else None
@@ -0,0 +1,66 @@
+# app/warmup.py
+"""
+Startup warmup, and the readiness gate behind /ready.
+
+A new container imports only what serving needs. Everything else is
+prepared in the background right after startup:
+- greeting audio for every tenant (greeting_cache.warm: disk or TTS)
+- the Twilio REST client (send_sms.warm, off the loop; the import is the
+  slow part)
+- each tenant's serialized agent Settings
+
+/ready answers 503 ("warm": false) until this finishes, so an autoscaler
+or load balancer only sends calls to a warm worker. A warmup that runs
+past WARMUP_TIMEOUT_S marks the worker warm anyway and logs what is still
+pending; those jobs keep running, and calls before they finish just take
+the slow path (agent-spoken greeting, SMS client built on first use).
+"""
+
+import asyncio, time
+
+from .settings import WARMUP_TIMEOUT_S
+from .log import get_logger
+from . import greeting_cache, send_sms, tenants, lifecycle
+from .agent_client import settings_payload
+
+log = get_logger(__name__)
+
+_task: asyncio.Task | None = None
+_jobs: list[asyncio.Task] = []
+
+def _settings_payloads():
+    for t in tenants.all_tenants():
+        settings_payload(t, greeted=False)
+        settings_payload(t, greeted=True)
+
+async def _run():
+    t0 = time.perf_counter()
+    jobs = {
+        asyncio.create_task(greeting_cache.warm(), name="warm-greetings"): "greetings",
+        asyncio.create_task(asyncio.to_thread(send_sms.warm), name="warm-sms"): "sms client",
+        asyncio.create_task(asyncio.to_thread(_settings_payloads), name="warm-settings"): "agent settings",
+    }
+    _jobs.extend(jobs)
+    done, pending = await asyncio.wait(jobs, timeout=WARMUP_TIMEOUT_S)
+    for task in done:
+        if task.exception():
+            log.warning("⚠️ Warmup of %s failed: %s", jobs[task], task.exception())
+    ms = round((time.perf_counter() - t0) * 1000, 1)
+    if pending:
+        log.warning("⏱️ Warmup past %ss, ready anyway; still running: %s",
+                    WARMUP_TIMEOUT_S, ", ".join(jobs[t] for t in pending))
+    lifecycle.mark_warm(ms)
+    log.info("🔥 Warm in %sms", ms)
+
+def start():
+    global _task
+    if _task is None:
+        _task = asyncio.get_running_loop().create_task(_run(), name="warmup")
+
+def stop():
+    global _task
+    for t in [_task, *_jobs]:
+        if t is not None:
+            t.cancel()
+    _task = None
+    _jobs.clear()
@@ -1,121 +1,190 @@
 # app/ws_bridge.py
 
-import os, json, base64, asyncio
+import os, json, asyncio, time
+from collections import deque
+import websockets
 from fastapi import FastAPI, WebSocket
 from starlette.websockets import WebSocketDisconnect
 
-from .agent_client import connect_agent, send_agent_settings
-from .agent_functions import FUNCTION_MAP, session_state
-from .business_logic import finalize_order, discard_pending_order
-from .send_sms import send_received_sms
+from .agent_client import connect_agent, send_agent_settings, resume_settings_payload
+from .agent_functions import FUNCTION_MAP, TOOL_VALIDATORS, call_context
+from .tool_args import ArgumentError
+from .orders_store import latest_order_for_phone
+from . import tenants
+from . import business_logic as bl
+from . import call_session
+from . import finalizer
 from .audio import (
     ulaw8k_to_lin16_48k,
     lin16_24k_to_ulaw8k,
-    chunk_bytes,
     TWILIO_FRAME_BYTES,
 )
-from .orders_store import add_order
-from .events import publish
+from . import twilio_proto
+from . import greeting_cache
+from .recording import start_recording
+from .transcripts import CallTranscript
+from .log import call_logger
+from .playback import PlaybackTracker
+from .lifecycle import call_opened, call_closed
+from .vad import new_gate, KEEPALIVE_MSG
+from .capture import new_capture
+from .uplink import InboundQueue
+from .settings import AGENT_RECONNECT_ATTEMPTS, AGENT_CONTEXT_MESSAGES
+
+# Agent events that show it has taken in our last FunctionCallResponse
+_ACK_EVENTS = ("AgentThinking", "AgentStartedSpeaking", "FunctionCallRequest")
 
 def register_ws_routes(app: FastAPI):
 
     @app.websocket("/twilio")
     async def twilio_agent(ws: WebSocket):
         await ws.accept()
-        print("✅ Twilio WebSocket connected")
+        capture = new_capture()   # CAPTURE_CALLS=1: log both sockets for tools/replay.py
+        if capture:
+            ws = capture.twilio(ws)
+        call_id = call_opened()
+        session = call_session.open_session(call_id)   # this call's cart and order state
+        state = session.state
+        log = call_logger(__name__)
+        log.info("✅ Twilio WebSocket connected")
+        transcript = CallTranscript()
 
-        agent = await connect_agent()
-        await send_agent_settings(agent)
+        # Connect now, but send Settings on "start": the tenant arrives as a stream parameter
+        try:
+            agent = await connect_agent()
+            if capture:
+                agent = capture.agent(agent)
+            transcript.mark("agent_connected")
+        except Exception:
+            call_closed(call_id)
+            call_session.close_session(session)
+            raise
 
+        tenant = tenants.DEFAULT
+        settings_sent = False
         stream_sid = None
+        twilio_out: twilio_proto.MediaEncoder | None = None  # set on "start"
+        recorder = None
+        playback = PlaybackTracker()
+        vad = new_gate()
+        uplink = InboundQueue(logger=log)   # caller audio waits here, not in the receive loop
 
         # resampler states
         twilio_to_agent_state = None
         agent_to_twilio_state = None
 
-        async def finalize_and_send_sms():
-            """
-            Finalize order on hangup:
-            - Only finalize if phone was explicitly confirmed AND order number exists
-            - Finalize the order (persist to orders.json)
-            - Send SMS confirmation
-            - Publish event to dashboards
-            """
-            if session_state.get("received_sms_sent"):
-                print("ℹ️ SMS already sent, skipping finalization")
-                return
-            
-            if not session_state.get("phone_confirmed"):
-                print("ℹ️ Phone not confirmed, discarding order")
-                # Discard any pending order
-                order_no = session_state.get("order_number")
-                if order_no:
-                    discard_pending_order(order_no)
-                return
+        # For resuming on a new agent session if the socket drops mid-call
+        history: deque[dict] = deque(maxlen=AGENT_CONTEXT_MESSAGES)
+        unacked: dict[str, dict] = {}   # fn_id -> history entry the agent may not have seen
+        closing = False
+
+        finalize_queued = False
+        prefetch: asyncio.Task | None = None
 
-            phone = session_state.get("phone_number")
-            order_no = session_state.get("order_number")
-            
-            if not phone or not order_no:
-                print("ℹ️ Missing phone or order number, cannot finalize")
+        async def prefetch_last_order(phone: str):
+            """Load the caller's latest order off the loop while the agent greets them."""
+            try:
+                last = await asyncio.to_thread(latest_order_for_phone, phone)
+            except Exception as e:
+                log.warning("⚠️ Caller history prefetch failed: %s", e)
                 return
+            if state.get("caller_phone") == phone and state.get("last_order") is None:
+                state["last_order"] = last or False
+            transcript.mark("caller_history", found=bool(last))
 
-            print(f"📱 Finalizing order on hangup...")
-            print(f"   Phone: {phone}")
-            print(f"   Order: {order_no}")
+        def finalize_on_hangup():
+            """
+            Hand the call's order to the background finalizer (app/finalizer.py):
+            - Only finalized if phone was explicitly confirmed AND order number exists
+            - Otherwise the pending order is discarded
+            Snapshot only; persistence, SMS and dashboard events happen off this path.
+            """
+            nonlocal finalize_queued
+            if finalize_queued:
+                return
+            finalize_queued = True
+            order_no = state.get("order_number")
+            confirmed = bool(state.get("phone_confirmed"))
+            items = None
+            if confirmed and order_no:
+                items = session.cart.copy()
+                session.cart.clear()
+            finalizer.enqueue(finalizer.call_key(tenant.id, call_id), order_number=order_no,
+                              phone=state.get("phone_number"), phone_confirmed=confirmed,
+                              items=items, call_id=log.call_id, tenant=tenant.id, session=session)
 
-            try:
-                # Finalize the order (commit from pending)
-                result = finalize_order(order_no)
-                
-                if not result.get("ok"):
-                    print(f"❌ Failed to finalize order: {result.get('error')}")
-                    return
-                
-                # Persist to orders.json
-                add_order({
-                    "order_number": result["order_number"],
-                    "phone": result.get("phone"),
-                    "items": result.get("items") or [],
-                    "total": result.get("total", 0.0),
-                    "status": result.get("status", "received"),
-                    "created_at": result.get("created_at"),
-                })
-                
-                # Publish to dashboards
-                publish({
-                    "type": "order_created",
-                    "order_number": result["order_number"],
-                    "status": "received"
-                })
-                
-                print(f"✅ Order finalized: {order_no}")
-                
-                # Send confirmation SMS
+        async def reconnect_agent() -> bool:
+            """
+            Replace a dropped agent socket; the new session gets history, order state and unacked calls.
+            Before "start" nothing was said yet: the new socket gets no Settings here, "start" sends them
+            (one Settings per agent connection, with the call's tenant).
+            """
+            nonlocal agent
+            t0 = time.perf_counter()
+            for attempt in range(1, AGENT_RECONNECT_ATTEMPTS + 1):
+                if closing:
+                    return False
                 try:
-                    send_received_sms(order_no=order_no, to_phone_no=phone)
-                    session_state["received_sms_sent"] = True
-                    print(f"✅ Confirmation SMS sent to {phone}")
+                    new = await connect_agent()
+                    if capture:
+                        new = capture.agent(new)
+                    if settings_sent:
+                        await new.send(resume_settings_payload(list(history), call_context(session), tenant))
                 except Exception as e:
-                    print(f"❌ Error sending confirmation SMS: {e}")
-                    
-            except Exception as e:
-                print(f"❌ Error during finalization: {e}")
+                    log.warning("⚠️ Agent reconnect attempt %d failed: %s", attempt, e)
+                    if attempt < AGENT_RECONNECT_ATTEMPTS:   # no backoff when no retry follows
+                        await asyncio.sleep(0.1 * 2 ** (attempt - 1))
+                    continue
+                agent = new
+                ms = round((time.perf_counter() - t0) * 1000, 1)
+                log.warning("🔁 Agent reconnected in %sms (attempt %d, %d unacked call(s) replayed)",
+                            ms, attempt, len(unacked))
+                transcript.mark("agent_reconnected", ms=ms, attempt=attempt, replayed=list(unacked))
+                unacked.clear()
+                return True
+            log.error("❌ Agent reconnect failed after %d attempt(s)", AGENT_RECONNECT_ATTEMPTS)
+            transcript.mark("agent_lost")
+            return False
 
         async def agent_to_twilio_task():
-            nonlocal agent_to_twilio_state
+            while True:
+                try:
+                    await pump_agent()
+                except websockets.ConnectionClosed:
+                    pass
+                if closing:
+                    return
+                log.warning("⚠️ Agent WebSocket dropped (code=%s)", agent.close_code)
+                transcript.mark("agent_dropped", code=agent.close_code)
+                if not await reconnect_agent():
+                    # nothing left to talk to: hang up so the order still finalizes
+                    try: await ws.close()
+                    except Exception: pass
+                    return
+
+        first_audio_seen = False
+
+        async def pump_agent():
+            nonlocal agent_to_twilio_state, first_audio_seen
             async for message in agent:
                 # Agent audio: linear16@24k → Twilio μ-law/8k
                 if isinstance(message, (bytes, bytearray)):
                     if not stream_sid: continue
+                    if not first_audio_seen:
+                        first_audio_seen = True
+                        transcript.mark("first_agent_audio")
+                    if recorder: recorder.agent(message)
                     ulaw8k, agent_to_twilio_state = lin16_24k_to_ulaw8k(message, agent_to_twilio_state)
-                    for frame in chunk_bytes(ulaw8k, TWILIO_FRAME_BYTES):
-                        if not frame: continue
-                        await ws.send_text(json.dumps({
-                            "event": "media",
-                            "streamSid": stream_sid,
-                            "media": {"payload": base64.b64encode(frame).decode("ascii")}
-                        }))
+                    marked = 0
+                    for frame in twilio_proto.frames(ulaw8k, TWILIO_FRAME_BYTES):
+                        await ws.send_text(twilio_out.media(frame))
+                        if not playback.in_utterance:
+                            # first frame of an utterance: mark it before the rest of the chunk
+                            marked = len(frame)
+                            await ws.send_text(twilio_out.mark(playback.on_audio_sent(marked)))
+                    mark = playback.on_audio_sent(len(ulaw8k) - marked)
+                    if mark:
+                        await ws.send_text(twilio_out.mark(mark))
                     continue
 
                 # Text events (incl. function calls)
@@ -126,10 +195,26 @@ def register_ws_routes(app: FastAPI):
 
                 etype = evt.get("type")
 
+                if etype == "ConversationText":
+                    transcript.text(evt.get("role"), evt.get("content"))
+                    history.append({"type": "History", "role": evt.get("role"), "content": evt.get("content")})
+                    if evt.get("role") == "user":
+                        playback.on_user_turn(vad.last_voiced_at if vad else None)
+                if etype in _ACK_EVENTS or (etype == "ConversationText" and evt.get("role") == "assistant"):
+                    unacked.clear()
+                elif etype != "FunctionCallRequest":
+                    transcript.mark(etype or "unknown")
+
                 if etype == "UserStartedSpeaking" and stream_sid:
-                    await ws.send_text(json.dumps({"event": "clear", "streamSid": stream_sid}))
+                    playback.on_clear()
+                    await ws.send_text(twilio_out.clear_msg)
                     continue
 
+                if etype == "AgentAudioDone" and stream_sid:
+                    mark = playback.on_utterance_end()
+                    if mark:
+                        await ws.send_text(twilio_out.mark(mark))
+
                 if etype == "FunctionCallRequest":
                     for fc in evt.get("functions", []):
                         if fc.get("client_side") is False:
@@ -141,73 +226,177 @@ def register_ws_routes(app: FastAPI):
                             args = json.loads(raw_args) if isinstance(raw_args, str) else (raw_args or {})
                         except Exception:
                             args = {}
-                        print(f"🛠️  FunctionCallRequest → {fn_name}({args})")
+                        log.info("🛠️  FunctionCallRequest → %s(%s)", fn_name, args, extra={"fn": fn_name})
+                        transcript.function_call(fn_id, fn_name, args)
                         try:
                             if fn_name in FUNCTION_MAP:
-                                result = FUNCTION_MAP[fn_name](**args)
+                                try:
+                                    args, dropped = TOOL_VALIDATORS[fn_name](args)
+                                except ArgumentError as e:
+                                    log.warning("⚠️ Bad arguments for %s: %s", fn_name, e, extra={"fn": fn_name})
+                                    result = {"ok": False, "error": f"Invalid arguments for {fn_name}: {e}",
+                                              "errors": e.errors}
+                                else:
+                                    if dropped:
+                                        log.info("🧹 Dropped unknown %s argument(s): %s", fn_name, dropped, extra={"fn": fn_name})
+                                    with tenants.using(tenant), call_session.using(session):
+                                        result = FUNCTION_MAP[fn_name](**args)
                                 resp = {"type":"FunctionCallResponse","id":fn_id,"name":fn_name,
                                         "content": json.dumps(result) if not isinstance(result,str) else result}
                             else:
                                 resp = {"type":"FunctionCallResponse","id":fn_id,"name":fn_name or "unknown",
                                         "content": json.dumps({"ok":False,"error":f"Unknown function '{fn_name}'"})}
-                            await agent.send(json.dumps(resp))
-                            print(f"✅ FunctionCallResponse ← {fn_name}: {resp['content']}")
                         except Exception as e:
-                            err = {"type":"FunctionCallResponse","id":fn_id,"name":fn_name or "unknown",
-                                   "content": json.dumps({"ok":False,"error":str(e)})}
-                            await agent.send(json.dumps(err))
-                            print(f"❌ Function handler error: {e}")
+                            resp = {"type":"FunctionCallResponse","id":fn_id,"name":fn_name or "unknown",
+                                    "content": json.dumps({"ok":False,"error":str(e)})}
+                            log.exception("❌ Function handler error: %s", e, extra={"fn": fn_name})
+                        # Recorded once, before sending: if the agent socket drops here, ConnectionClosed
+                        # goes up to agent_to_twilio_task and the resumed session replays this result
+                        transcript.function_result(fn_id, fn_name, resp["content"])
+                        _remember_call(fn_id, fn_name, raw_args, resp["content"])
+                        await agent.send(json.dumps(resp))
+                        log.info("✅ FunctionCallResponse ← %s: %s", fn_name, resp["content"], extra={"fn": fn_name})
                     continue
 
-                print("[agent]", evt)
+                log.noisy("[agent] %s", evt, extra={"event": etype})
+
+        async def play_cached_greeting(greeting: greeting_cache.Greeting):
+            """Stream the pre-rendered greeting; Twilio buffers it and plays in real time."""
+            nonlocal first_audio_seen
+            first_audio_seen = True
+            transcript.mark("first_agent_audio", cached_greeting=True, ms=greeting.ms)
+            transcript.text("assistant", greeting.text)
+            history.append({"type": "History", "role": "assistant", "content": greeting.text})
+            for i, p in enumerate(greeting.payloads):
+                await ws.send_text(twilio_out.media_b64(p))
+                if i == 0:
+                    # first-frame mark, so greeting playout is tracked like agent audio
+                    mark = playback.on_audio_sent(TWILIO_FRAME_BYTES)
+                    if mark:
+                        await ws.send_text(twilio_out.mark(mark))
+            mark = playback.on_audio_sent(len(greeting.ulaw) - TWILIO_FRAME_BYTES)
+            if mark:
+                await ws.send_text(twilio_out.mark(mark))
+            mark = playback.on_utterance_end()
+            if mark:
+                await ws.send_text(twilio_out.mark(mark))
+            if recorder:
+                recorder.agent(greeting.pcm24k())
+
+        def _remember_call(fn_id, fn_name, raw_args, content):
+            entry = {"type": "History", "function_calls": [{
+                "id": fn_id, "name": fn_name, "client_side": True,
+                "arguments": raw_args if isinstance(raw_args, str) else json.dumps(raw_args),
+                "response": content,
+            }]}
+            history.append(entry)
+            unacked[fn_id] = entry
+
+        async def twilio_to_agent_task():
+            """Drain the uplink queue into whichever agent socket is current."""
+            while True:
+                msg, frames = await uplink.get()
+                t0 = time.perf_counter()
+                try:
+                    await agent.send(msg)
+                except websockets.ConnectionClosed:
+                    uplink.lost(frames)  # agent dropped; forward task is reconnecting
+                    continue
+                except Exception as e:
+                    uplink.lost(frames)
+                    log.warning("⚠️ Agent send failed: %s", e)
+                    continue
+                uplink.sent(frames, time.perf_counter() - t0)
 
         forward_task = asyncio.create_task(agent_to_twilio_task())
+        uplink_task = asyncio.create_task(twilio_to_agent_task())
 
         try:
             async for raw in ws.iter_text():
-                try:
-                    evt = json.loads(raw)
-                except Exception:
+                etype, ulaw8k, evt = twilio_proto.parse(raw)
+                if etype is None and evt is None:
                     continue
 
-                etype = evt.get("event")
-                if etype != "media":
-                    print(f"[twilio evt] {etype}")
+                if etype not in ("media", "mark"):
+                    log.noisy("[twilio evt] %s", etype, extra={"event": etype})
 
                 if etype == "start":
                     stream_sid = evt["start"]["streamSid"]
-                    # Reset session state for new call
-                    session_state["phone_number"] = None
-                    session_state["order_number"] = None
-                    session_state["phone_confirmed"] = False
-                    session_state["received_sms_sent"] = False
-                    session_state["pending_item"] = None
+                    twilio_out = twilio_proto.MediaEncoder(stream_sid)
+                    params = evt["start"].get("customParameters") or {}
+                    tenant = tenants.get(params.get("tenant")) or tenants.DEFAULT
+                    tenants.activate(tenant)
+                    state["caller_phone"] = bl.normalize_phone(params.get("caller"))
+                    if state["caller_phone"]:
+                        # runs under this call's tenant (to_thread copies the context)
+                        prefetch = asyncio.create_task(prefetch_last_order(state["caller_phone"]))
+                    recorder = start_recording(stream_sid)
+                    greeting = greeting_cache.get(tenant) if not settings_sent else None
+                    if greeting:
+                        await play_cached_greeting(greeting)
+                    if not settings_sent:
+                        await send_agent_settings(agent, tenant, greeted=greeting is not None)
+                        settings_sent = True
+                        transcript.mark("settings_sent", tenant=tenant.id, greeted=greeting is not None)
                     twilio_to_agent_state = None
                     agent_to_twilio_state = None
-                    print(f"▶️ Stream started: {stream_sid}")
+                    log.call_id = stream_sid
+                    transcript.stream_sid = stream_sid
+                    transcript.mark("start")
+                    log.info("▶️ Stream started: %s", stream_sid)
 
                 elif etype == "media":
-                    ulaw8k = base64.b64decode(evt["media"]["payload"])
-                    lin48k, twilio_to_agent_state = ulaw8k_to_lin16_48k(ulaw8k, twilio_to_agent_state)
-                    if lin48k:
-                        await agent.send(lin48k)
+                    if not ulaw8k: continue
+                    if recorder: recorder.caller(ulaw8k)
+                    frames = vad.push(ulaw8k) if vad else (ulaw8k,)
+                    for f in frames:
+                        lin48k, twilio_to_agent_state = ulaw8k_to_lin16_48k(f, twilio_to_agent_state)
+                        if lin48k:
+                            uplink.put(lin48k)
+                    if vad and not frames and vad.keepalive_due():
+                        uplink.put(KEEPALIVE_MSG)
+
+                elif etype == "mark":
+                    played = playback.on_mark((evt.get("mark") or {}).get("name"))
+                    if played:
+                        transcript.mark("agent_audio_played", **played)
 
                 elif etype == "stop":
-                    print("⏹️ Stream stopped")
-                    await finalize_and_send_sms()
+                    log.info("⏹️ Stream stopped")
+                    transcript.mark("stop")
+                    finalize_on_hangup()
                     break
 
                 else:
-                    print("[twilio raw]", evt)
+                    log.noisy("[twilio raw] %s", evt, extra={"event": etype})
 
         except WebSocketDisconnect:
-            print("⚠️ Twilio WebSocketDisconnect")
-            await finalize_and_send_sms()
+            log.warning("⚠️ Twilio WebSocketDisconnect")
         finally:
+            closing = True
+            finalize_on_hangup()
             try: await agent.close()
             except Exception: pass
             forward_task.cancel()
+            uplink_task.cancel()
+            if prefetch:
+                prefetch.cancel()
             try: await ws.close()
             except Exception: pass
-            await finalize_and_send_sms()
-            print("🔌 Twilio WebSocket closed")
\ No newline at end of file
+            if recorder:
+                recorder.close(state.get("order_number"))
+            pb = playback.summary()
+            log.info("🔊 Playback: %s", pb, extra={"playback": pb})
+            transcript.mark("playback_summary", **pb)
+            us = uplink.finish()
+            log.info("🎙️ Uplink: %s", us, extra={"uplink": us})
+            transcript.mark("uplink_summary", **us)
+            if vad:
+                vs = vad.summary()
+                log.info("🎚️ VAD: %s", vs, extra={"vad": vs})
+                transcript.mark("vad_summary", **vs)
+            transcript.close(state.get("order_number"), state.get("phone_number"))
+            call_closed(call_id)
+            log.info("🔌 Twilio WebSocket closed")
+            if capture:
+                await capture.close(stream_sid)
\ No newline at end of file
@@ -0,0 +1,152 @@
+# tools/analytics_backfill.py
+"""
+Backfill analytics rollups (app/analytics.py) from historical orders.
+
+Orders (orders.json files, exported lists, or the daily .jsonl.gz files
+under ORDERS_ARCHIVE_DIR; .gz is fine) are first
+turned into a columnar export: one column per field, with an order table
+and a drink table, plus an exploded table for toppings and add-ons. The
+rollup is then aggregated column at a time (Counter over whole columns,
+sums over arrays) instead of replaying order events one by one.
+
+    python -m tools.analytics_backfill old/orders-*.json --export cols.json
+    python -m tools.analytics_backfill app/archive/default/*.jsonl.gz --verify
+    python -m tools.analytics_backfill --columns cols.json --merge --tenant default
+    python -m tools.analytics_backfill old/orders-*.json --verify
+
+--merge adds the result to ANALYTICS_PATH; run it while the server is
+stopped (the server rewrites the file on shutdown). --verify checks the
+column aggregation against per-event replay and exits 1 on a mismatch.
+"""
+
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+from array import array
+from collections import Counter
+from itertools import compress
+
+from app.analytics import Rollup, hour_of, prep_bin
+from app.settings import ANALYTICS_PATH
+
+def load_orders(path: str) -> list[dict]:
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        if ".jsonl" in path:   # archive partition: one order per line
+            return [json.loads(line) for line in f if line.strip()]
+        data = json.load(f)
+    return data.get("orders", []) if isinstance(data, dict) else data
+
+def to_columns(orders: list[dict]) -> dict[str, list]:
+    """Columnar export: order-, drink- and option-level tables as parallel column lists."""
+    cols = {k: [] for k in ("order_received_at", "order_drinks", "order_prep_s",
+                            "drink_hour", "drink_flavor", "drink_has_addon", "topping", "addon")}
+    for o in orders:
+        items = o.get("items") or []
+        times = o.get("status_times") or {}
+        received = times.get("received") or o.get("created_at") or 0
+        ready = times.get("ready") if o.get("status") == "ready" else None
+        cols["order_received_at"].append(received)
+        cols["order_drinks"].append(len(items))
+        cols["order_prep_s"].append(ready - received if ready and ready >= received else -1.0)
+        hour = hour_of(received)
+        for it in items:
+            cols["drink_hour"].append(hour)
+            cols["drink_flavor"].append(it.get("flavor") or "unknown")
+            cols["drink_has_addon"].append(bool(it.get("addons")))
+            cols["topping"].extend(it.get("toppings") or ())
+            cols["addon"].extend(it.get("addons") or ())
+    return cols
+
+def aggregate(cols: dict[str, list]) -> Rollup:
+    """Rollup from a columnar export, one pass per column."""
+    r = Rollup()
+    drinks = array("l", cols["order_drinks"])
+    prep = array("d", cols["order_prep_s"])
+    done = [p >= 0 for p in prep]
+    r.orders = len(drinks)
+    r.drinks = sum(drinks)
+    r.drinks_with_addons = sum(cols["drink_has_addon"])
+    r.drinks_by_hour = Counter(cols["drink_hour"])
+    r.flavors = Counter(cols["drink_flavor"])
+    r.toppings = Counter(cols["topping"])
+    r.addons = Counter(cols["addon"])
+    finished = list(compress(prep, done))
+    r.prep_hist = Counter(map(prep_bin, finished))
+    r.prep_total_s = sum(finished)
+    r.prep_samples = len(finished)
+    return r
+
+def replay(orders: list[dict]) -> Rollup:
+    """Reference: the live path, one order event at a time."""
+    r = Rollup()
+    for i, o in enumerate(orders):
+        r.on_order_added({**o, "id": f"backfill-{i}"})   # history may repeat an order's id-less key
+    r._received.clear()
+    return r
+
+def merge_into(path: str, tenant: str, rollup: Rollup):
+    data = {"tenants": {}}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    tenants = data.setdefault("tenants", {})
+    current = Rollup.from_dict(tenants.get(tenant) or {})
+    current.merge(rollup)
+    tenants[tenant] = current.to_dict()
+    data["saved_at"] = int(time.time())
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+def main():
+    ap = argparse.ArgumentParser(description="Backfill analytics rollups from historical orders")
+    ap.add_argument("orders", nargs="*", help="orders JSON files ({'orders': [...]} or a list) or archive .jsonl files; .gz ok")
+    ap.add_argument("--columns", help="aggregate this columnar export instead of order files")
+    ap.add_argument("--export", help="write the columnar export here")
+    ap.add_argument("--merge", action="store_true", help=f"add the result to ANALYTICS_PATH ({ANALYTICS_PATH})")
+    ap.add_argument("--tenant", default="default")
+    ap.add_argument("--verify", action="store_true", help="compare against per-event replay")
+    args = ap.parse_args()
+    if not args.orders and not args.columns:
+        ap.error("give order files or --columns")
+
+    orders = [o for p in args.orders for o in load_orders(p)]
+    t0 = time.perf_counter()
+    if args.columns:
+        with open(args.columns, "r", encoding="utf-8") as f:
+            cols = json.load(f)
+    else:
+        cols = to_columns(orders)
+    t1 = time.perf_counter()
+    rollup = aggregate(cols)
+    t2 = time.perf_counter()
+    print(f"📈 {rollup.orders} orders, {rollup.drinks} drinks, {rollup.prep_samples} prep samples "
+          f"(export {1000 * (t1 - t0):.1f}ms, aggregate {1000 * (t2 - t1):.1f}ms)")
+
+    if args.export:
+        with open(args.export, "w", encoding="utf-8") as f:
+            json.dump(cols, f)
+        print(f"📄 Wrote {args.export}")
+
+    if args.verify:
+        if not orders:
+            ap.error("--verify needs order files")
+        t3 = time.perf_counter()
+        ref = replay(orders)
+        t4 = time.perf_counter()
+        if ref.to_dict() != rollup.to_dict():
+            print("❌ Column aggregation differs from event replay")
+            sys.exit(1)
+        print(f"✅ Matches event replay ({1000 * (t4 - t3):.1f}ms)")
+
+    if args.merge:
+        merge_into(ANALYTICS_PATH, args.tenant, rollup)
+        print(f"💾 Merged into {ANALYTICS_PATH} (tenant {args.tenant})")
+
+if __name__ == "__main__":
+    main()
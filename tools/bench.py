@@ -0,0 +1,328 @@
+# tools/bench.py
+"""
+Micro-benchmarks for the per-frame audio path (incl. the VAD gate),
+business logic, tool argument validation and the orders store.
+
+    python -m tools.bench                                   # print only
+    python -m tools.bench --out temp/bench/baseline.json
+    python -m tools.bench --baseline temp/bench/baseline.json --threshold 0.2
+
+Results (ns per op, best of N repeats) are printed, and written as JSON
+with --out (temp/ is gitignored). With --baseline, any case slower than
+baseline * (1 + threshold) is flagged and the exit code is 1.
+"""
+
+import argparse
+import base64
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import timeit
+
+# Must be set before app.settings is imported (it refuses to load without a key)
+os.environ.setdefault("DEEPGRAM_API_KEY", "bench")
+
+from app import audio, business_logic as bl, orders_store  # noqa: E402
+
+FRAME_ULAW = bytes(random.Random(1).randrange(256) for _ in range(audio.TWILIO_FRAME_BYTES))
+
+def _lin24k(ms: int) -> bytes:
+    rnd = random.Random(2)
+    return b"".join(rnd.randrange(-8000, 8000).to_bytes(2, "little", signed=True)
+                    for _ in range(24 * ms))
+
+FRAME_LIN24K = _lin24k(20)     # one 20ms agent chunk
+SECOND_LIN24K = _lin24k(1000)  # one call-second of agent audio
+
+# ---------- Cases ----------
+# Each case returns a zero-arg callable; "ops" is how many logical ops one call does.
+CASES: dict[str, tuple] = {}
+
+def case(name: str, ops: int = 1):
+    def deco(fn):
+        CASES[name] = (fn, ops)
+        return fn
+    return deco
+
+@case("audio.ulaw8k_to_lin16_48k/frame")
+def _():
+    return lambda: audio.ulaw8k_to_lin16_48k(FRAME_ULAW, None)
+
+@case("audio.ulaw8k_to_lin16_48k/call_second")
+def _():
+    def run():
+        state = None
+        for _ in range(50):
+            _, state = audio.ulaw8k_to_lin16_48k(FRAME_ULAW, state)
+    return run
+
+@case("audio.lin16_24k_to_ulaw8k/frame")
+def _():
+    return lambda: audio.lin16_24k_to_ulaw8k(FRAME_LIN24K, None)
+
+@case("audio.lin16_24k_to_ulaw8k/call_second")
+def _():
+    def run():
+        state = None
+        for _ in range(50):
+            _, state = audio.lin16_24k_to_ulaw8k(FRAME_LIN24K, state)
+    return run
+
+@case("framing.outbound/call_second")
+def _():
+    # chunk_bytes + base64 + JSON for one second of μ-law (50 Twilio frames)
+    ulaw, _ = audio.lin16_24k_to_ulaw8k(SECOND_LIN24K, None)
+    def run():
+        for frame in audio.chunk_bytes(ulaw, audio.TWILIO_FRAME_BYTES):
+            json.dumps({
+                "event": "media",
+                "streamSid": "MZ00000000000000000000000000000000",
+                "media": {"payload": base64.b64encode(frame).decode("ascii")},
+            })
+    return run
+
+@case("framing.inbound/frame")
+def _():
+    raw = json.dumps({
+        "event": "media",
+        "streamSid": "MZ00000000000000000000000000000000",
+        "media": {"track": "inbound", "chunk": "1", "timestamp": "20",
+                  "payload": base64.b64encode(FRAME_ULAW).decode("ascii")},
+    })
+    def run():
+        evt = json.loads(raw)
+        base64.b64decode(evt["media"]["payload"])
+    return run
+
+# Same messages through app.twilio_proto (what the bridge uses)
+@case("framing.outbound.codec/call_second")
+def _():
+    from app.twilio_proto import MediaEncoder, frames
+    ulaw, _ = audio.lin16_24k_to_ulaw8k(SECOND_LIN24K, None)
+    enc = MediaEncoder("MZ00000000000000000000000000000000")
+    def run():
+        for frame in frames(ulaw, audio.TWILIO_FRAME_BYTES):
+            enc.media(frame)
+    return run
+
+@case("framing.inbound.codec/frame")
+def _():
+    from app.twilio_proto import parse
+    # Twilio's own (compact) layout
+    raw = json.dumps({
+        "event": "media",
+        "sequenceNumber": "2",
+        "media": {"track": "inbound", "chunk": "1", "timestamp": "20",
+                  "payload": base64.b64encode(FRAME_ULAW).decode("ascii")},
+        "streamSid": "MZ00000000000000000000000000000000",
+    }, separators=(",", ":"))
+    return lambda: parse(raw)
+
+@case("inbound.ungated/call_second")
+def _():
+    # today's path: every caller frame resampled for the agent
+    silence = b"\xff" * audio.TWILIO_FRAME_BYTES
+    def run():
+        state = None
+        for _ in range(50):
+            _, state = audio.ulaw8k_to_lin16_48k(silence, state)
+    return run
+
+@case("inbound.vad_gated/call_second_silence")
+def _():
+    # gate closed: energy check only, nothing resampled
+    from app.vad import VadGate
+    silence = b"\xff" * audio.TWILIO_FRAME_BYTES
+    gate = VadGate()
+    def run():
+        state = None
+        for _ in range(50):
+            for f in gate.push(silence):
+                _, state = audio.ulaw8k_to_lin16_48k(f, state)
+    return run
+
+@case("inbound.vad_gated/call_second_speech")
+def _():
+    # gate open: energy check on top of the resample
+    from app.vad import VadGate
+    gate = VadGate(min_rms=0)
+    gate.push(FRAME_ULAW)
+    def run():
+        state = None
+        for _ in range(50):
+            for f in gate.push(FRAME_ULAW):
+                _, state = audio.ulaw8k_to_lin16_48k(f, state)
+    return run
+
+@case("business_logic._match_with_aliases/exact")
+def _():
+    return lambda: bl._match_with_aliases("boba", bl.MENU["toppings"], bl.TOPPING_ALIASES)
+
+@case("business_logic._match_with_aliases/alias")
+def _():
+    return lambda: bl._match_with_aliases("vanilla cold foam", bl.MENU["toppings"], bl.TOPPING_ALIASES)
+
+@case("business_logic._match_with_aliases/miss")
+def _():
+    return lambda: bl._match_with_aliases("lychee jelly", bl.MENU["toppings"], bl.TOPPING_ALIASES)
+
+@case("tool_args.validate/add_to_cart")
+def _():
+    from app.agent_functions import TOOL_VALIDATORS
+    v = TOOL_VALIDATORS["add_to_cart"]
+    args = {"flavor": "taro milk tea", "toppings": ["boba"], "sweetness": "50%", "ice": "less ice", "addons": []}
+    return lambda: v(args)
+
+@case("tool_args.validate/add_to_cart_coerce")
+def _():
+    # string toppings split, unknown field dropped, null skipped
+    from app.agent_functions import TOOL_VALIDATORS
+    v = TOOL_VALIDATORS["add_to_cart"]
+    args = {"flavor": "taro milk tea", "toppings": "boba, vanilla cream", "size": "large", "ice": None}
+    return lambda: v(args)
+
+@case("tool_args.validate/modify_cart_item")
+def _():
+    from app.agent_functions import TOOL_VALIDATORS
+    v = TOOL_VALIDATORS["modify_cart_item"]
+    args = {"index": "1", "sweetness": "25%"}
+    return lambda: v(args)
+
+def _seed_store(n: int):
+    rnd = random.Random(n)
+    orders = []
+    for i in range(n):
+        orders.append({
+            "order_number": f"{i:05d}",
+            "phone": f"+1555555{rnd.randrange(100):04d}",
+            "items": [{"flavor": "taro milk tea", "toppings": ["boba"], "sweetness": "50%",
+                       "ice": "regular ice", "addons": []}] * rnd.randint(1, 3),
+            "total": 0.0,
+            "status": rnd.choice(["received", "received", "ready"]),
+            "created_at": 1_700_000_000 + i,
+        })
+    orders_store._write({"orders": orders})
+
+def _store_cases(n: int):
+    def add():
+        orders_store.add_order({"order_number": "99999", "phone": "+15555550000", "items": [],
+                                "total": 0.0, "status": "received", "created_at": 0})
+    def set_status():
+        orders_store.set_order_status(f"{n // 2:05d}", "received")
+    def count():
+        orders_store.count_active_drinks_for_phone("+15555550042")
+    return {
+        f"orders_store.add_order/{n}": add,
+        f"orders_store.set_order_status/{n}": set_status,
+        f"orders_store.count_active_drinks_for_phone/{n}": count,
+    }
+
+STORE_SIZES = (100, 1_000, 10_000)
+
+# ---------- Runner ----------
+def _measure(fn, repeat: int, min_time: float) -> float:
+    """Best-of-`repeat` seconds per call, with the loop count sized to ~min_time."""
+    t = timeit.Timer(fn)
+    number, _ = t.autorange()
+    number = max(1, int(number * min_time / 0.2))
+    return min(t.repeat(repeat=repeat, number=number)) / number
+
+def _measure_store(fn, setup, repeat: int, number: int = 10) -> float:
+    """Store ops mutate the file, so re-seed before every repeat to keep size fixed."""
+    best = float("inf")
+    for _ in range(repeat):
+        setup()
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        best = min(best, (time.perf_counter() - t0) / number)
+    return best
+
+def run(repeat: int, min_time: float, only: str | None) -> dict:
+    results: dict[str, dict] = {}
+
+    def record(name, fn, ops=1, setup=None):
+        if only and only not in name:
+            return
+        if setup is None:
+            sec = _measure(fn, repeat, min_time) / ops
+        else:
+            sec = _measure_store(fn, setup, repeat)
+        results[name] = {"ns_per_op": round(sec * 1e9, 1), "ops_per_sec": round(1 / sec, 1)}
+        print(f"{name:<55} {sec * 1e6:>12.2f} µs/op")
+
+    for name, (factory, ops) in CASES.items():
+        record(name, factory(), ops)
+
+    saved = orders_store.ORDERS_PATH
+    with tempfile.TemporaryDirectory() as d:
+        orders_store.ORDERS_PATH = os.path.join(d, "orders.json")
+        try:
+            for n in STORE_SIZES:
+                cases = _store_cases(n)
+                for name, fn in cases.items():
+                    record(name, fn, setup=lambda n=n: _seed_store(n))
+        finally:
+            orders_store.ORDERS_PATH = saved
+
+    return {
+        "meta": {
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "timestamp": int(time.time()),
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+
+def compare(current: dict, baseline: dict, threshold: float) -> list[str]:
+    regressions = []
+    base = baseline.get("results", {})
+    for name, r in current["results"].items():
+        b = base.get(name)
+        if not b:
+            continue
+        ratio = r["ns_per_op"] / b["ns_per_op"] if b["ns_per_op"] else 1.0
+        r["baseline_ns_per_op"] = b["ns_per_op"]
+        r["ratio"] = round(ratio, 3)
+        if ratio > 1 + threshold:
+            regressions.append(f"{name}: {b['ns_per_op']} → {r['ns_per_op']} ns/op (x{ratio:.2f})")
+    return regressions
+
+def main():
+    ap = argparse.ArgumentParser(description="Micro-benchmarks for audio, business logic and store")
+    ap.add_argument("--out", help="write results JSON here (default: print only)")
+    ap.add_argument("--baseline", help="compare against a previous results JSON")
+    ap.add_argument("--threshold", type=float, default=0.2,
+                    help="flag cases slower than baseline by more than this fraction")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--min-time", type=float, default=0.2, help="seconds per repeat (approx.)")
+    ap.add_argument("-k", dest="only", help="only run cases whose name contains this")
+    args = ap.parse_args()
+
+    current = run(args.repeat, args.min_time, args.only)
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(current, json.load(f), args.threshold)
+
+    if args.out:
+        os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(current, f, indent=2)
+        print(f"📄 Wrote {args.out}")
+
+    if regressions:
+        print(f"❌ {len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+        for line in regressions:
+            print("   " + line)
+        sys.exit(1)
+    if args.baseline:
+        print("✅ No regressions")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+# tools/fake_agent.py
+"""
+Local stand-in for the Deepgram agent WebSocket.
+
+Implements only the subset of the protocol that ws_bridge uses:
+- receives the Settings message and binary linear16@48k audio
+- answers with a greeting (linear16@24k audio) right after Settings, if
+  Settings has one (a pre-rendered greeting leaves it out)
+- after a bit of caller audio, sends UserStartedSpeaking followed by a
+  scripted sequence of FunctionCallRequest messages, one per turn
+- with drop_after=N, closes the socket (1011) right after the N-th
+  FunctionCallResponse arrives, before acknowledging it
+- with drop_before=N, closes it right after sending the N-th
+  FunctionCallRequest, so the bridge's response hits a closed socket
+- with drop_on_connect=N, closes the first N sockets right after Welcome,
+  before any Settings (an agent lost before Twilio "start")
+A Settings whose agent.context has tool calls is a resumed session that
+continues the script. Each replayed call should appear there once, with
+the handler's own result.
+
+Run standalone:
+    python -m tools.fake_agent --port 8765
+and start the app with DG_AGENT_URL=ws://127.0.0.1:8765
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import struct
+import time
+import uuid
+
+import websockets
+
+OUT_RATE = 24000
+OUT_CHUNK_MS = 20
+IN_BYTES_PER_SEC = 48000 * 2  # linear16@48k from the bridge
+
+# One order per call: stage, confirm, phone, checkout, read back
+DEFAULT_SCRIPT = [
+    ("add_to_cart", {"flavor": "taro milk tea", "toppings": ["boba"]}),
+    ("confirm_pending_to_cart", {}),
+    ("save_phone_number", {"phone": "+15555550100"}),
+    ("checkout_order", {"phone": "+15555550100"}),
+    ("get_cart", {}),
+]
+
+def tone_lin16(ms: int, rate: int = OUT_RATE, freq: float = 440.0) -> bytes:
+    n = rate * ms // 1000
+    return b"".join(
+        struct.pack("<h", int(8000 * math.sin(2 * math.pi * freq * i / rate)))
+        for i in range(n)
+    )
+
+class AgentStats:
+    """Counters shared with the load generator (same process)."""
+    def __init__(self):
+        self.sessions = 0
+        self.audio_bytes_in = 0
+        self.fn_turnaround: list[float] = []
+        self.fn_errors = 0
+        self.drops = 0
+        self.resumes = 0
+        self.replayed = 0                  # dropped-before-ack calls present in resume context
+        self.replay_dupes = 0              # call ids present more than once in a resume context
+        self.replay_errors = 0             # replayed calls whose recorded response is an error
+        self.reconnect_gap: list[float] = []  # drop → resume Settings, seconds
+        self.extra_settings = 0            # Settings after the first on one socket (should be 0)
+
+class FakeAgent:
+    def __init__(self, script=None, greeting_ms: int = 1500, reply_ms: int = 600,
+                 turn_after_s: float = 1.0, stats: AgentStats | None = None,
+                 drop_after: int = 0, drop_before: int = 0, drop_on_connect: int = 0):
+        self.script = list(script if script is not None else DEFAULT_SCRIPT)
+        self.greeting_pcm = tone_lin16(greeting_ms)
+        self.reply_pcm = tone_lin16(reply_ms, freq=660.0)
+        self.turn_after_bytes = int(turn_after_s * IN_BYTES_PER_SEC)
+        self.stats = stats or AgentStats()
+        self.drop_after = drop_after
+        self.drop_before = drop_before
+        self.drop_on_connect = drop_on_connect
+        self._dropped: dict[str, float] = {}  # unacked fn id -> drop time
+
+    async def _speak(self, ws, pcm: bytes, text: str):
+        try:
+            await ws.send(json.dumps({"type": "ConversationText", "role": "assistant", "content": text}))
+            await ws.send(json.dumps({"type": "AgentStartedSpeaking"}))
+            step = OUT_RATE * 2 * OUT_CHUNK_MS // 1000
+            for i in range(0, len(pcm), step):
+                await ws.send(pcm[i:i + step])
+                await asyncio.sleep(OUT_CHUNK_MS / 1000)
+            await ws.send(json.dumps({"type": "AgentAudioDone"}))
+        except websockets.ConnectionClosed:
+            pass
+
+    def _resume(self, settings: dict) -> int:
+        """Account for a resumed session; returns the script step to continue from."""
+        history = (settings.get("agent", {}).get("context") or {}).get("messages") or []
+        calls = [fc for m in history for fc in m.get("function_calls") or []]
+        self.stats.resumes += 1
+        ids = [fc.get("id") for fc in calls]
+        self.stats.replay_dupes += len(ids) - len(set(ids))
+        for fc in calls:
+            t_drop = self._dropped.pop(fc.get("id"), None)
+            if t_drop is not None:
+                self.stats.replayed += 1
+                self.stats.reconnect_gap.append(time.perf_counter() - t_drop)
+                try:
+                    if json.loads(fc.get("response") or "{}").get("ok") is False:
+                        self.stats.replay_errors += 1
+                except (ValueError, AttributeError):
+                    pass
+        return len(calls)
+
+    async def handler(self, ws):
+        self.stats.sessions += 1
+        await ws.send(json.dumps({"type": "Welcome", "request_id": str(uuid.uuid4())}))
+        if self.stats.sessions <= self.drop_on_connect:
+            self.stats.drops += 1
+            await ws.close(1011, "fake drop")
+            return
+
+        # First text frame must be Settings
+        async for msg in ws:
+            if isinstance(msg, str) and json.loads(msg).get("type") == "Settings":
+                settings = json.loads(msg)
+                break
+        else:
+            return
+        await ws.send(json.dumps({"type": "SettingsApplied"}))
+        history = (settings.get("agent", {}).get("context") or {}).get("messages") or []
+        resumed = any(m.get("function_calls") for m in history)
+        step = self._resume(settings) if resumed else 0
+        speaking: set[asyncio.Task] = set()   # greeting/reply audio; cancelled and awaited on close
+
+        def speak(pcm: bytes, text: str):
+            task = asyncio.create_task(self._speak(ws, pcm, text))
+            speaking.add(task)
+            task.add_done_callback(speaking.discard)
+
+        if "greeting" in settings.get("agent", {}):
+            speak(self.greeting_pcm, "greeting")
+
+        pending: dict[str, float] = {}
+        asked = 0
+        answered = 0
+        heard = 0
+        try:
+            async for msg in ws:
+                if isinstance(msg, (bytes, bytearray)):
+                    self.stats.audio_bytes_in += len(msg)
+                    heard += len(msg)
+                    if heard >= self.turn_after_bytes and not pending and step < len(self.script):
+                        heard = 0
+                        name, args = self.script[step]
+                        step += 1
+                        fn_id = str(uuid.uuid4())
+                        await ws.send(json.dumps({"type": "UserStartedSpeaking"}))
+                        await ws.send(json.dumps({"type": "ConversationText", "role": "user", "content": name}))
+                        pending[fn_id] = time.perf_counter()
+                        await ws.send(json.dumps({
+                            "type": "FunctionCallRequest",
+                            "functions": [{
+                                "id": fn_id, "name": name,
+                                "arguments": json.dumps(args), "client_side": True,
+                            }],
+                        }))
+                        asked += 1
+                        if not resumed and asked == self.drop_before:
+                            self.stats.drops += 1
+                            self._dropped[fn_id] = time.perf_counter()
+                            await ws.close(1011, "fake drop")
+                            break
+                    continue
+
+                evt = json.loads(msg)
+                if evt.get("type") == "Settings":
+                    self.stats.extra_settings += 1
+                if evt.get("type") == "FunctionCallResponse":
+                    t0 = pending.pop(evt.get("id"), None)
+                    if t0 is not None:
+                        self.stats.fn_turnaround.append(time.perf_counter() - t0)
+                    answered += 1
+                    if not resumed and answered == self.drop_after:
+                        self.stats.drops += 1
+                        self._dropped[evt.get("id")] = time.perf_counter()
+                        await ws.close(1011, "fake drop")
+                        break
+                    try:
+                        if json.loads(evt.get("content") or "{}").get("ok") is False:
+                            self.stats.fn_errors += 1
+                    except (ValueError, AttributeError):
+                        pass
+                    speak(self.reply_pcm, "reply")
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            for task in speaking:
+                task.cancel()
+            await asyncio.gather(*speaking, return_exceptions=True)
+
+async def serve(host: str, port: int, agent: FakeAgent):
+    return await websockets.serve(agent.handler, host, port,
+                                  subprotocols=["token"], max_size=2**24)
+
+def main():
+    ap = argparse.ArgumentParser(description="Fake Deepgram agent for local load tests")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    args = ap.parse_args()
+
+    async def run():
+        await serve(args.host, args.port, FakeAgent())
+        print(f"🤖 Fake agent on ws://{args.host}:{args.port}")
+        await asyncio.Future()
+
+    asyncio.run(run())
+
+if __name__ == "__main__":
+    main()
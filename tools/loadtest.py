@@ -0,0 +1,307 @@
+# tools/loadtest.py
+"""
+End-to-end load test: N fake Twilio callers → /twilio → fake Deepgram agent.
+
+The app runs in-process on its own thread and event loop so we can measure
+its event-loop lag and CPU time directly. Callers and the fake agent share
+the main thread's loop.
+
+    python -m tools.loadtest --calls 1,5,10,25 --duration 20
+
+Reports per step: time-to-greeting, function-call turnaround, event-loop
+lag and app CPU per call. Each fake call places one single-drink order, so
+the step also reports orders persisted and `mixed` orders (not exactly one
+drink): calls sharing a cart would show up there. The app writes
+orders.json, the archive, analytics and transcripts to a temp dir.
+
+    python -m tools.loadtest --calls 5 --duration 10 --drop-after 2
+
+makes the fake agent drop every call's socket after the 2nd tool call and
+reports how fast the bridge resumed (drop → new Settings) and how many
+unacknowledged calls were replayed. --drop-before 2 drops it right after
+the 2nd FunctionCallRequest instead, while the bridge is still answering.
+
+    python -m tools.loadtest --calls 5 --cached-greeting
+
+plays a pre-rendered greeting (app/greeting_cache.py) from a temp cache
+dir instead of the agent speaking it; compare greeting_ms with and without.
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+import websockets
+
+from .fake_agent import AgentStats, FakeAgent, serve as serve_agent
+
+FRAME_MS = 20
+ULAW_SILENCE = b"\xff" * 160  # 20ms @ 8k μ-law
+
+def _pct(xs, p):
+    if not xs:
+        return None
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(round(p / 100 * (len(xs) - 1))))]
+
+def _ms(x):
+    return None if x is None else round(x * 1000, 1)
+
+class AppServer:
+    """Runs app.main:app under uvicorn on a dedicated thread/loop."""
+    def __init__(self, port: int):
+        self.port = port
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self._ready = threading.Event()
+        self.server = None
+
+    def _run(self):
+        import uvicorn
+        from app.main import app
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        config = uvicorn.Config(app, host="127.0.0.1", port=self.port,
+                                log_level="warning", lifespan="on")
+        self.server = uvicorn.Server(config)
+        self.loop.call_soon(self._ready.set)
+        self.loop.run_until_complete(self.server.serve())
+
+    def start(self):
+        self.thread.start()
+        self._ready.wait()
+        while not (self.server and self.server.started):
+            time.sleep(0.05)
+
+    def cpu_seconds(self) -> float:
+        return time.clock_gettime(time.pthread_getcpuclockid(self.thread.ident))
+
+    def stop(self):
+        if self.server:
+            self.server.should_exit = True
+        self.thread.join(timeout=5)
+
+async def _lag_probe(samples: list, stop: threading.Event, interval: float = 0.05):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        t0 = loop.time()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, loop.time() - t0 - interval))
+
+async def fake_caller(url: str, duration: float, greet: list, errors: list, params: dict | None = None):
+    sid = "MZ" + uuid.uuid4().hex
+    payload = base64.b64encode(ULAW_SILENCE).decode("ascii")
+    try:
+        async with websockets.connect(url, max_size=2**24) as ws:
+            await ws.send(json.dumps({"event": "connected", "protocol": "Call", "version": "1.0.0"}))
+            t_start = time.perf_counter()
+            start = {"streamSid": sid, "customParameters": params or {}}
+            await ws.send(json.dumps({"event": "start", "start": start, "streamSid": sid}))
+            got_audio = asyncio.Event()
+
+            loop = asyncio.get_running_loop()
+            play_until = 0.0        # when buffered agent audio finishes "playing"
+            marks: list = []        # scheduled mark echoes
+
+            async def echo(name):
+                try:
+                    await ws.send(json.dumps({"event": "mark", "streamSid": sid, "mark": {"name": name}}))
+                except websockets.ConnectionClosed:
+                    pass    # hung up before this audio finished playing
+
+            async def reader():
+                # Emulates Twilio playout: marks are echoed once the audio before them played,
+                # and immediately on clear
+                nonlocal play_until
+                async for raw in ws:
+                    evt = json.loads(raw)
+                    ev = evt.get("event")
+                    if ev == "media":
+                        if not got_audio.is_set():
+                            greet.append(time.perf_counter() - t_start)
+                            got_audio.set()
+                        play_until = max(loop.time(), play_until) + FRAME_MS / 1000
+                    elif ev == "mark":
+                        name = evt["mark"]["name"]
+                        h = loop.call_at(max(loop.time(), play_until),
+                                         lambda n=name: asyncio.ensure_future(echo(n)))
+                        marks.append((h, name))
+                    elif ev == "clear":
+                        for h, name in marks:
+                            if not h.cancelled():
+                                h.cancel()
+                                await echo(name)
+                        marks.clear()
+                        play_until = loop.time()
+
+            rtask = asyncio.create_task(reader())
+            frame = json.dumps({"event": "media", "streamSid": sid, "media": {"payload": payload}})
+            # Real-time pacing against a fixed schedule (no drift)
+            next_t = time.perf_counter()
+            end_t = next_t + duration
+            while next_t < end_t:
+                await ws.send(frame)
+                next_t += FRAME_MS / 1000
+                await asyncio.sleep(max(0.0, next_t - time.perf_counter()))
+            await ws.send(json.dumps({"event": "stop", "streamSid": sid}))
+            rtask.cancel()
+            for h, _ in marks:
+                h.cancel()
+    except Exception as e:
+        errors.append(repr(e))
+
+def _orders(tenant_id: str | None) -> dict[str, dict]:
+    """Persisted orders by id (the app's scratch orders.json)."""
+    from app import orders_store, tenants
+    with tenants.using(tenants.get(tenant_id) or tenants.DEFAULT):
+        return {o["id"]: o for o in orders_store._read()["orders"]}
+
+async def _new_orders(before: dict, tenant_id: str | None, n: int, wait_s: float = 5.0) -> list[dict]:
+    """Orders added since `before`, once n have landed or wait_s passed (hangup → finalizer)."""
+    deadline = time.monotonic() + wait_s
+    while True:
+        new = [o for k, o in _orders(tenant_id).items() if k not in before]
+        if len(new) >= n or time.monotonic() > deadline:
+            return new
+        await asyncio.sleep(0.1)
+
+async def run_step(n: int, duration: float, app: AppServer, stats: AgentStats,
+                   params: dict | None = None) -> dict:
+    greet: list[float] = []
+    errors: list[str] = []
+    lag: list[float] = []
+    fn_before = len(stats.fn_turnaround)
+    tenant_id = (params or {}).get("tenant")
+    orders_before = _orders(tenant_id)
+    stop = threading.Event()
+    probe = asyncio.run_coroutine_threadsafe(_lag_probe(lag, stop), app.loop)
+
+    cpu0 = app.cpu_seconds()
+    url = f"ws://127.0.0.1:{app.port}/twilio"
+    await asyncio.gather(*(fake_caller(url, duration, greet, errors, params) for _ in range(n)))
+    cpu = app.cpu_seconds() - cpu0
+
+    stop.set()
+    await asyncio.wrap_future(probe)
+    fn = stats.fn_turnaround[fn_before:]
+    orders = await _new_orders(orders_before, tenant_id, n)
+    return {
+        "calls": n,
+        "errors": len(errors),
+        "orders": len(orders),
+        "mixed": sum(len(o.get("items") or []) != 1 for o in orders),
+        "greeting_ms_p50": _ms(_pct(greet, 50)),
+        "greeting_ms_p95": _ms(_pct(greet, 95)),
+        "fn_ms_p50": _ms(_pct(fn, 50)),
+        "fn_ms_p95": _ms(_pct(fn, 95)),
+        "fn_calls": len(fn),
+        "loop_lag_ms_p99": _ms(_pct(lag, 99)),
+        "loop_lag_ms_max": _ms(max(lag) if lag else None),
+        "cpu_ms_per_call_s": round(cpu * 1000 / (n * duration), 2),
+        "cpu_util": round(cpu / duration, 3),
+        "drops": stats.drops,
+        "resumes": stats.resumes,
+        "replayed": stats.replayed,
+        "replay_dupes": stats.replay_dupes,
+        "replay_errors": stats.replay_errors,
+        "reconnect_ms_max": _ms(max(stats.reconnect_gap) if stats.reconnect_gap else None),
+    }
+
+def _print_table(rows):
+    cols = ["calls", "errors", "orders", "mixed", "greeting_ms_p50", "greeting_ms_p95", "fn_ms_p50", "fn_ms_p95",
+            "loop_lag_ms_p99", "loop_lag_ms_max", "cpu_ms_per_call_s", "cpu_util"]
+    print("  ".join(f"{c:>17}" for c in cols))
+    for r in rows:
+        print("  ".join(f"{str(r[c]):>17}" for c in cols))
+
+def _seed_greeting_cache():
+    """Put a tone in the greeting cache for every tenant, as if TTS had rendered it."""
+    import audioop
+    from app import greeting_cache, tenants
+    from .fake_agent import tone_lin16
+    lin8k, _ = audioop.ratecv(tone_lin16(1500), 2, 1, 24000, 8000, None)
+    for t in tenants.all_tenants():
+        greeting_cache.store(t, audioop.lin2ulaw(lin8k, 2))
+
+async def main_async(args):
+    if args.cached_greeting:
+        _seed_greeting_cache()
+    stats = AgentStats()
+    agent = FakeAgent(turn_after_s=args.turn_after, stats=stats, drop_after=args.drop_after,
+                      drop_before=args.drop_before)
+    agent_srv = await serve_agent("127.0.0.1", args.agent_port, agent)
+
+    app = AppServer(args.app_port)
+    app.start()
+
+    params = {k: v for k, v in (("tenant", args.tenant), ("caller", args.caller)) if v}
+    rows = []
+    try:
+        for n in args.calls:
+            print(f"▶️ {n} concurrent call(s) for {args.duration:.0f}s ...")
+            rows.append(await run_step(n, args.duration, app, stats, params))
+            if args.errors_stop and rows[-1]["errors"]:
+                break
+    finally:
+        app.stop()
+        agent_srv.close()
+        await agent_srv.wait_closed()
+
+    _print_table(rows)
+    if args.drop_after or args.drop_before:
+        last = rows[-1]
+        print(f"🔁 drops={last['drops']} resumes={last['resumes']} replayed={last['replayed']} "
+              f"replay_dupes={last['replay_dupes']} replay_errors={last['replay_errors']} "
+              f"reconnect_ms_max={last['reconnect_ms_max']}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"duration_s": args.duration, "steps": rows}, f, indent=2)
+        print(f"📄 Wrote {args.json}")
+
+def main():
+    ap = argparse.ArgumentParser(description="Load test the Twilio ⇄ Deepgram bridge")
+    ap.add_argument("--calls", default="1,5,10,25",
+                    type=lambda s: [int(x) for x in s.split(",") if x])
+    ap.add_argument("--duration", type=float, default=20.0, help="seconds of audio per call")
+    ap.add_argument("--turn-after", type=float, default=1.0,
+                    help="seconds of caller audio between scripted function calls")
+    ap.add_argument("--app-port", type=int, default=8800)
+    ap.add_argument("--agent-port", type=int, default=8765)
+    ap.add_argument("--json", help="write results to this file")
+    ap.add_argument("--errors-stop", action="store_true", help="stop at first step with errors")
+    ap.add_argument("--tenant", help="tenant id sent as the stream's custom parameter (see TENANTS_FILE)")
+    ap.add_argument("--caller", help="caller ID sent as the stream's custom parameter (E.164)")
+    ap.add_argument("--cached-greeting", action="store_true",
+                    help="play a pre-rendered greeting on stream start instead of the agent's")
+    ap.add_argument("--drop-after", type=int, default=0,
+                    help="fake agent drops each call after this many tool calls (reconnect test)")
+    ap.add_argument("--drop-before", type=int, default=0,
+                    help="fake agent drops each call right after sending this many tool calls, before the response")
+    args = ap.parse_args()
+
+    # Must be set before app.settings is imported
+    os.environ["DG_AGENT_URL"] = f"ws://127.0.0.1:{args.agent_port}"
+    os.environ.setdefault("DEEPGRAM_API_KEY", "loadtest")
+    os.environ["VOICE_HOST"] = f"localhost:{args.app_port}"
+    # never call real TTS from a load test; --cached-greeting seeds a throwaway cache
+    os.environ["GREETING_CACHE"] = "1" if args.cached_greeting else "0"
+    if args.cached_greeting:
+        os.environ["GREETING_CACHE_DIR"] = tempfile.mkdtemp(prefix="greetings-")
+    # the app's orders, archive, rollups and snapshot go to a throwaway dir, never app/orders.json
+    scratch = tempfile.mkdtemp(prefix="loadtest-")
+    os.environ["ORDERS_PATH"] = os.path.join(scratch, "orders.json")
+    os.environ["ORDERS_ARCHIVE_DIR"] = os.path.join(scratch, "archive")
+    os.environ["ANALYTICS_PATH"] = os.path.join(scratch, "analytics.json")
+    os.environ["PENDING_SNAPSHOT_PATH"] = os.path.join(scratch, "pending_orders.snapshot.json")
+    os.environ.setdefault("TRANSCRIPTS_DIR", os.path.join(scratch, "transcripts"))
+
+    asyncio.run(main_async(args))
+
+if __name__ == "__main__":
+    main()
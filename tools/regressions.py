@@ -0,0 +1,462 @@
+# tools/regressions.py
+"""
+Regression checks for bugs fixed in the call pipeline.
+
+Each check drives the real app code against scratch files (orders.json,
+archive, analytics, pending snapshot in a temp dir) and asserts on what was persisted or
+sent; nothing talks to Deepgram or Twilio. Bridge checks run the app and
+tools/fake_agent.py in-process, as tools/loadtest.py does.
+
+    python -m tools.regressions               # all checks
+    python -m tools.regressions finalizer     # only checks whose name contains "finalizer"
+
+Exits 1 if any check fails.
+"""
+
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import traceback
+
+SCRATCH = tempfile.mkdtemp(prefix="regressions-")
+os.environ.setdefault("DEEPGRAM_API_KEY", "regressions")
+os.environ["ORDERS_PATH"] = os.path.join(SCRATCH, "orders.json")
+os.environ["ORDERS_ARCHIVE_DIR"] = os.path.join(SCRATCH, "archive")
+os.environ["ANALYTICS_PATH"] = os.path.join(SCRATCH, "analytics.json")
+os.environ["PENDING_SNAPSHOT_PATH"] = os.path.join(SCRATCH, "pending_orders.snapshot.json")
+os.environ["TRANSCRIPTS"] = "0"
+os.environ["GREETING_CACHE"] = "0"
+AGENT_PORT, APP_PORT = 8766, 8801
+os.environ["DG_AGENT_URL"] = f"ws://127.0.0.1:{AGENT_PORT}"
+
+from app import business_logic as bl, call_session, finalizer, order_archive, orders_store, tenants  # noqa: E402
+from app.order_keys import order_key  # noqa: E402
+
+CHECKS = {}
+
+def check(fn):
+    CHECKS[fn.__name__] = fn
+    return fn
+
+def _fresh_store():
+    # new archive dir per check, so nothing archived by an earlier check is counted
+    order_archive.ORDERS_ARCHIVE_DIR = tempfile.mkdtemp(prefix="archive-", dir=SCRATCH)
+    order_archive._archives.clear()
+    orders_store.init_store(reset=True)
+    bl.ORDERS.clear()
+
+@check
+async def finalizer_shared_order_number():
+    """Two calls that draw the same order number both end up in orders.json."""
+    _fresh_store()
+    real = bl.random_order_no
+    bl.random_order_no = lambda: "4242"
+    try:
+        for call_id, phone in (("shared-1", "+15550000001"), ("shared-2", "+15550000002")):
+            session = call_session.open_session(call_id)
+            with call_session.using(session):
+                assert bl.add_to_cart("taro milk tea")["ok"]
+                order = bl.checkout_order(phone)
+            assert order["ok"] and order["order_number"] == "4242", order
+            items = session.cart.copy()
+            session.cart.clear()
+            queued = finalizer.enqueue(finalizer.call_key(tenants.DEFAULT.id, call_id), order_number="4242",
+                                       phone=phone, phone_confirmed=True, items=items,
+                                       call_id=f"MZ{call_id}", tenant=tenants.DEFAULT.id, session=session)
+            assert queued, f"call {call_id} was treated as a duplicate"
+            await finalizer._queue.join()
+    finally:
+        bl.random_order_no = real
+        await finalizer.drain()
+        finalizer._queue = None   # bound to this loop; the app server runs its own
+
+    with open(orders_store.ORDERS_PATH, encoding="utf-8") as f:
+        saved = [o for o in json.load(f)["orders"] if o["order_number"] == "4242"]
+    assert sorted(o["phone"] for o in saved) == ["+15550000001", "+15550000002"], saved
+    # a call that reports its hangup twice still finalizes once
+    assert not finalizer.enqueue(finalizer.call_key(tenants.DEFAULT.id, "shared-2"), order_number="4242",
+                                 phone="+15550000002", phone_confirmed=True, items=[],
+                                 call_id="MZshared-2", tenant=tenants.DEFAULT.id)
+
+@check
+async def agent_drop_before_response():
+    """Agent drops while the bridge answers a tool call: the call is replayed once, with its result."""
+    from .fake_agent import AgentStats, FakeAgent, serve
+    from .loadtest import AppServer, fake_caller
+    stats = AgentStats()
+    srv = await serve("127.0.0.1", AGENT_PORT, FakeAgent(stats=stats, drop_before=1))
+    app = AppServer(APP_PORT)
+    app.start()
+    errors: list[str] = []
+    try:
+        await fake_caller(f"ws://127.0.0.1:{APP_PORT}/twilio", 4.0, [], errors)
+    finally:
+        await asyncio.to_thread(app.stop)   # its shutdown closes sockets served by this loop
+        srv.close()
+        await srv.wait_closed()
+    assert not errors, errors
+    assert (stats.drops, stats.resumes, stats.replayed) == (1, 1, 1), vars(stats)
+    assert stats.replay_dupes == 0 and stats.replay_errors == 0, vars(stats)
+    assert stats.fn_turnaround, "script did not continue after the resume"
+
+@check
+async def store_concurrent_writers():
+    """Adds, status changes, item flags and archive sweeps from several threads lose nothing."""
+    import threading, time
+    _fresh_store()
+    n = 200
+    deadline = time.monotonic() + 60
+    added = threading.Event()
+
+    def adder():
+        for i in range(n):
+            orders_store.add_order({"order_number": f"{i:04d}", "phone": f"+1555{i % 7:07d}",
+                                    "items": [{"flavor": "taro milk tea"}], "total": 0.0,
+                                    "status": "received", "created_at": 1_700_000_000 + i})
+        added.set()
+
+    def barista():
+        i = 0
+        while i < n and time.monotonic() < deadline:   # a lost order is never found
+            if orders_store.set_order_status(f"{i:04d}", "ready"):
+                orders_store.mark_items_done({order_key(orders_store.get_order(f"{i:04d}")): [0]})
+                i += 1
+
+    def sweeper():
+        while not added.is_set():
+            orders_store.archive_finished(now=2_000_000_000)
+            time.sleep(0.002)
+        orders_store.archive_finished(now=2_000_000_000)
+
+    threads = [threading.Thread(target=f) for f in (adder, barista, sweeper)]
+    for t in threads:
+        t.start()
+    await asyncio.to_thread(lambda: [t.join() for t in threads])
+    orders_store.archive_finished(now=2_000_000_000)
+
+    with open(orders_store.ORDERS_PATH, encoding="utf-8") as f:
+        hot = [o["order_number"] for o in json.load(f)["orders"]]
+    archive = order_archive._archive()
+    cold = [o["order_number"] for day in archive.days() for o in archive._load_part(day)]
+    assert not hot, f"{len(hot)} ready order(s) left unarchived"
+    assert len(cold) == len(set(cold)), f"{len(cold) - len(set(cold))} order(s) archived twice"
+    assert sorted(cold) == [f"{i:04d}" for i in range(n)], f"{n - len(set(cold))} order(s) lost"
+    assert all(orders_store.count_active_orders_for_phone(f"+1555{p:07d}") == 0 for p in range(7))
+
+@check
+async def finalizer_races_barista():
+    """Finalizer writes (add_order on a worker thread) and barista status changes don't drop orders."""
+    import threading
+    _fresh_store()
+    n = 100
+    stop = threading.Event()
+
+    def barista():
+        while not stop.is_set():
+            for o in orders_store.list_in_progress_orders(limit=10):
+                orders_store.set_order_status(o["order_number"], "ready")
+
+    t = threading.Thread(target=barista)
+    t.start()
+    try:
+        for i in range(n):
+            no = f"{i:04d}"
+            session = call_session.open_session(f"race-{i}")
+            session.pending_orders[no] = {"order_number": no, "items": [], "phone": "+15550000003",
+                                          "status": "received", "created_at": 1_700_000_000 + i,
+                                          "committed": False}
+            finalizer.enqueue(finalizer.call_key(tenants.DEFAULT.id, f"race-{i}"), order_number=no,
+                              phone="+15550000003", phone_confirmed=True,
+                              items=[{"flavor": "black milk tea"}], call_id=f"MZrace{i}",
+                              tenant=tenants.DEFAULT.id, session=session)
+        await finalizer._queue.join()
+    finally:
+        stop.set()
+        await asyncio.to_thread(t.join)
+        await finalizer.drain()
+        finalizer._queue = None
+
+    with open(orders_store.ORDERS_PATH, encoding="utf-8") as f:
+        saved = {o["order_number"] for o in json.load(f)["orders"]}
+    assert saved == {f"{i:04d}" for i in range(n)}, f"{n - len(saved)} order(s) lost"
+
+@check
+async def concurrent_calls_isolated():
+    """Calls in flight at once each keep their own cart: one order, one drink per call."""
+    import time
+    from .fake_agent import AgentStats, FakeAgent, serve
+    from .loadtest import AppServer, fake_caller
+    _fresh_store()
+    calls = 4
+    stats = AgentStats()
+    srv = await serve("127.0.0.1", AGENT_PORT, FakeAgent(stats=stats, turn_after_s=0.5))
+    app = AppServer(APP_PORT)
+    app.start()
+    errors: list[str] = []
+    orders: list[dict] = []
+    try:
+        url = f"ws://127.0.0.1:{APP_PORT}/twilio"
+        await asyncio.gather(*(fake_caller(url, 4.0, [], errors) for _ in range(calls)))
+        deadline = time.monotonic() + 10    # finalizer runs after hangup
+        while len(orders) < calls and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+            with open(orders_store.ORDERS_PATH, encoding="utf-8") as f:
+                orders = json.load(f)["orders"]
+    finally:
+        await asyncio.to_thread(app.stop)   # its shutdown closes sockets served by this loop
+        srv.close()
+        await srv.wait_closed()
+    assert not errors, errors
+    assert stats.fn_errors == 0, f"{stats.fn_errors} tool call(s) failed"
+    assert len(orders) == calls, f"{len(orders)} order(s) for {calls} calls"
+    assert all(len(o["items"]) == 1 for o in orders), [len(o["items"]) for o in orders]
+
+@check
+async def first_mark_after_first_frame():
+    """The first mark of an agent utterance follows its first media frame, even when a chunk holds several."""
+    import websockets
+    from . import fake_agent
+    from .fake_agent import AgentStats, FakeAgent, serve
+    from .loadtest import AppServer
+    fake_agent.OUT_CHUNK_MS, real_chunk = 100, fake_agent.OUT_CHUNK_MS   # 5 frames per agent chunk
+    srv = await serve("127.0.0.1", AGENT_PORT, FakeAgent(stats=AgentStats()))
+    app = AppServer(APP_PORT)
+    app.start()
+    media_before_mark = 0
+    try:
+        async with websockets.connect(f"ws://127.0.0.1:{APP_PORT}/twilio") as ws:
+            await ws.send(json.dumps({"event": "start", "streamSid": "MZmark", "start": {"streamSid": "MZmark"}}))
+            async for raw in ws:
+                ev = json.loads(raw).get("event")
+                if ev == "mark":
+                    break
+                media_before_mark += ev == "media"
+            await ws.send(json.dumps({"event": "stop", "streamSid": "MZmark"}))
+    finally:
+        fake_agent.OUT_CHUNK_MS = real_chunk
+        await asyncio.to_thread(app.stop)
+        srv.close()
+        await srv.wait_closed()
+    assert media_before_mark == 1, f"first mark after {media_before_mark} media frames"
+
+@check
+async def latency_from_last_voiced_frame():
+    """Response latency counts from the caller's last voiced frame, not the later transcript."""
+    import time
+    from app.playback import PlaybackTracker
+    pb = PlaybackTracker()
+    pb.on_user_turn(time.monotonic() - 0.3)     # STT endpointed 300ms after the caller stopped
+    played = pb.on_mark(pb.on_audio_sent(160))
+    assert played and played["response_latency_ms"] >= 300, played
+    pb.on_user_turn(None)                       # no VAD: the transcript is all there is
+    assert pb.summary()["latency_from"] == "mixed", pb.summary()
+
+@check
+async def analytics_repeated_order_number():
+    """Two orders that share a number both count, and the rollups are saved while running."""
+    from app import analytics
+    _fresh_store()
+    analytics._rollups.clear()
+    for i in range(2):
+        orders_store.add_order({"order_number": "7777", "phone": f"+1555000001{i}",
+                                "items": [{"flavor": "taro milk tea"}], "total": 0.0,
+                                "status": "received", "created_at": 1_700_000_000 + i})
+    assert orders_store.set_order_status("7777", "ready")
+    report = analytics.report()
+    assert report["orders"] == 2 and report["drinks"] == 2, report
+    assert report["prep_seconds"]["samples"] == 1, report["prep_seconds"]
+
+    analytics.ANALYTICS_SAVE_S, real = 0.05, analytics.ANALYTICS_SAVE_S
+    if os.path.exists(os.environ["ANALYTICS_PATH"]):
+        os.remove(os.environ["ANALYTICS_PATH"])
+    analytics.start_saver()
+    try:
+        await asyncio.sleep(0.3)
+    finally:
+        analytics.stop_saver()
+        analytics.ANALYTICS_SAVE_S = real
+    with open(os.environ["ANALYTICS_PATH"], encoding="utf-8") as f:
+        assert json.load(f)["tenants"][tenants.DEFAULT.id]["orders"] == 2
+
+@check
+async def batch_repeated_order_number():
+    """A batch holding two open orders with the same number readies both, each texted once."""
+    from fastapi.testclient import TestClient
+    from app import batching, send_sms
+    from app.main import app
+    _fresh_store()
+    batching._indexes.clear()
+    for i in range(2):
+        orders_store.add_order({"order_number": "5555", "phone": f"+1555000002{i}",
+                                "items": [{"flavor": "taro milk tea"}], "total": 0.0,
+                                "status": "received", "created_at": 1_700_000_000 + i})
+    (batch,) = batching.list_batches()
+    assert [o["order_number"] for o in batch["orders"]] == ["5555", "5555"], batch
+    texted = []
+    real, send_sms.send_ready_sms = send_sms.send_ready_sms, lambda no, phone: texted.append(phone)
+    try:
+        res = TestClient(app).post(f"/api/batches/{batch['batch_id']}/done").json()
+    finally:
+        send_sms.send_ready_sms = real
+    assert res["drinks"] == 2 and res["ready"] == ["5555", "5555"], res
+    assert sorted(texted) == ["+15550000020", "+15550000021"], texted
+    with open(orders_store.ORDERS_PATH, encoding="utf-8") as f:
+        saved = json.load(f)["orders"]
+    assert all(o["status"] == "ready" and o["items"][0].get("done") for o in saved), saved
+
+@check
+async def eta_repeated_order_number():
+    """Two open orders with the same number each stay in the ETA queue until their own ready."""
+    from app import eta
+    _fresh_store()
+    eta._estimators.clear()
+    for i in range(2):
+        orders_store.add_order({"order_number": "6666", "phone": f"+1555000003{i}",
+                                "items": [{"flavor": "taro milk tea"}] * (i + 1), "total": 0.0,
+                                "status": "received", "created_at": 1_700_000_000 + i})
+    assert eta.stats()["active_orders"] == 2, eta.stats()
+    assert eta.eta_for_order("6666")["drinks_ahead"] == 1     # the newer one, behind the first
+    assert orders_store.set_order_status("6666", "ready")      # newest first
+    assert eta.stats()["active_drinks"] == 1, eta.stats()
+    assert eta.eta_for_order("6666")["drinks_ahead"] == 0     # the older one is still queued
+
+@check
+async def transcripts_per_tenant():
+    """Transcripts are stored and looked up per shop, old days are pruned, and drain waits for flushes."""
+    import time
+    from fastapi.testclient import TestClient
+    from app import transcripts
+    from app.main import app
+    root = tempfile.mkdtemp(prefix="transcripts-", dir=SCRATCH)
+    real = transcripts.TRANSCRIPTS_DIR, transcripts.TRANSCRIPTS_ENABLED, transcripts._pruned_day
+    transcripts.TRANSCRIPTS_DIR, transcripts.TRANSCRIPTS_ENABLED, transcripts._pruned_day = root, True, None
+    uptown = tenants.Tenant("uptown", "Uptown")
+    tenants._tenants["uptown"] = uptown
+    stale = transcripts._day(time.time() - (transcripts.TRANSCRIPTS_RETENTION_DAYS + 2) * 86400)
+    os.makedirs(os.path.join(root, "default"))
+    for ext in ("jsonl", "idx.jsonl"):
+        open(os.path.join(root, "default", f"{stale}.{ext}"), "w").close()
+    try:
+        for shop, phone in ((tenants.DEFAULT, "+15550000040"), (uptown, "+15550000041")):
+            with tenants.using(shop):
+                t = transcripts.CallTranscript()
+                t.text("user", "one taro milk tea")
+                t.close("1234", phone)
+        await transcripts.drain()     # as the lifespan does at shutdown
+        assert not transcripts._pending
+        client = TestClient(app)
+        default = client.get("/api/transcripts", params={"order_number": "1234"}).json()
+        shop = client.get("/api/transcripts", params={"order_number": "1234", "tenant": "uptown"}).json()
+    finally:
+        transcripts.TRANSCRIPTS_DIR, transcripts.TRANSCRIPTS_ENABLED, transcripts._pruned_day = real
+        del tenants._tenants["uptown"]
+    assert [t["phone"] for t in default] == ["+15550000040"], default
+    assert [t["phone"] for t in shop] == ["+15550000041"], shop
+    assert not os.path.exists(os.path.join(root, "default", f"{stale}.jsonl")), "old day not pruned"
+
+@check
+async def drain_keeps_open_orders():
+    """A restart right after a drain keeps open orders on the console; other restarts reset orders.json."""
+    from app import lifecycle
+    from app.app_factory import lifespan
+    from app.settings import PENDING_SNAPSHOT_PATH
+    for path in (PENDING_SNAPSHOT_PATH, PENDING_SNAPSHOT_PATH + ".prev"):
+        if os.path.exists(path):
+            os.remove(path)
+
+    def saved():
+        with open(orders_store.ORDERS_PATH, encoding="utf-8") as f:
+            return sorted(o["order_number"] for o in json.load(f)["orders"])
+
+    _fresh_store()
+    try:
+        async with lifespan(None):
+            for no, status in (("7001", "ready"), ("7002", "making")):
+                orders_store.add_order({"order_number": no, "phone": "+15550000050",
+                                        "items": [{"flavor": "taro milk tea"}], "total": 0.0, "status": status})
+            lifecycle.start_drain("regressions")
+        assert saved() == ["7002"], saved()
+        lifecycle.state["draining"] = False
+        async with lifespan(None):      # the deploy's new process
+            assert saved() == ["7002"], saved()
+            assert [o["order_number"] for o in orders_store.list_in_progress_orders()] == ["7002"]
+            assert os.path.exists(PENDING_SNAPSHOT_PATH + ".prev") and not os.path.exists(PENDING_SNAPSHOT_PATH)
+        assert saved() == [], saved()   # shut down without a drain: reset as usual
+    finally:
+        lifecycle.state["draining"] = False
+
+@check
+async def agent_drop_before_start():
+    """Agent drops before Twilio "start": the new socket gets one Settings (from "start"), not two."""
+    import websockets
+    from .fake_agent import AgentStats, FakeAgent, serve
+    from .loadtest import AppServer
+    stats = AgentStats()
+    srv = await serve("127.0.0.1", AGENT_PORT, FakeAgent(stats=stats, drop_on_connect=1))
+    app = AppServer(APP_PORT)
+    app.start()
+    try:
+        async with websockets.connect(f"ws://127.0.0.1:{APP_PORT}/twilio") as ws:
+            await asyncio.sleep(0.5)    # drop and reconnect happen before "start"
+            await ws.send(json.dumps({"event": "start", "streamSid": "MZdrop", "start": {"streamSid": "MZdrop"}}))
+            await asyncio.sleep(0.5)
+            await ws.send(json.dumps({"event": "stop", "streamSid": "MZdrop"}))
+    finally:
+        await asyncio.to_thread(app.stop)
+        srv.close()
+        await srv.wait_closed()
+    assert (stats.sessions, stats.drops) == (2, 1), vars(stats)
+    assert stats.extra_settings == 0, f"{stats.extra_settings} extra Settings on one agent socket"
+    assert stats.resumes == 0, "resume Settings sent before the call started"
+
+@check
+async def agent_reconnect_gives_up_without_final_sleep():
+    """When every reconnect fails, the call ends after the last attempt, without one more backoff."""
+    import time
+    import websockets
+    from app.settings import AGENT_RECONNECT_ATTEMPTS
+    from .loadtest import AppServer
+
+    async def handler(ws):
+        srv.close()     # stop listening and drop this socket: every reconnect is refused
+
+    srv = await websockets.serve(handler, "127.0.0.1", AGENT_PORT, subprotocols=["token"])
+    app = AppServer(APP_PORT)
+    app.start()
+    try:
+        t0 = time.perf_counter()
+        async with websockets.connect(f"ws://127.0.0.1:{APP_PORT}/twilio") as ws:
+            await ws.wait_closed()      # the bridge hangs up once reconnecting gave up
+        took = time.perf_counter() - t0
+    finally:
+        await asyncio.to_thread(app.stop)
+        await srv.wait_closed()
+    # sleeps between attempts only; a sleep after the last one would add 0.1 * 2 ** (attempts - 1)
+    between = sum(0.1 * 2 ** (a - 1) for a in range(1, AGENT_RECONNECT_ATTEMPTS))
+    final = 0.1 * 2 ** (AGENT_RECONNECT_ATTEMPTS - 1)
+    assert took < between + final / 2, f"gave up after {took:.2f}s (backoff between attempts {between:.2f}s)"
+
+async def _run(names: list[str]) -> int:
+    failed = 0
+    for name, fn in CHECKS.items():
+        if names and not any(n in name for n in names):
+            continue
+        try:
+            await fn()
+        except Exception:
+            failed += 1
+            print(f"❌ {name}")
+            traceback.print_exc()
+        else:
+            print(f"✅ {name}")
+    return failed
+
+def main():
+    failed = asyncio.run(_run(sys.argv[1:]))
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
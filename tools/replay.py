@@ -0,0 +1,244 @@
+# tools/replay.py
+"""
+Replay a captured call (CAPTURE_CALLS=1, app/capture.py) against the
+current build, offline.
+
+The app runs in-process like the load test. A fake Twilio client sends
+the recorded Twilio messages at their recorded times. A mock agent answers
+each agent session exactly as recorded. Each recorded agent message is
+tied to the latest message the bridge had sent before it (Settings,
+FunctionCallResponse...). The mock sends it the same delay after the
+bridge sends the matching message in the replay, so tool responses and
+reconnects line up even when the new build is faster or slower.
+
+    python -m tools.replay app/captures/MZ....jsonl.gz
+    python -m tools.replay app/captures/*.jsonl.gz --speed 4 --json replay.json
+
+The replay is captured too, into a temp dir. That gives latency per
+turn, recorded vs replayed, measured at the same taps inside the bridge:
+- fn:<name>: FunctionCallRequest from the agent → FunctionCallResponse back
+- speech:    first agent audio of an utterance → first media frame to Twilio
+
+--speed N divides every recorded delay by N. The bridge work itself isn't
+scaled, so the comparison is fair at any speed, but real-time (1) is the
+closest to production.
+"""
+
+import argparse
+import asyncio
+import base64
+import gzip
+import json
+import os
+import tempfile
+import time
+
+import websockets
+
+from .loadtest import AppServer, _pct
+
+ANCHOR_TIMEOUT_S = 10.0   # give up waiting for the bridge to send an anchor (the build diverged)
+
+def load(path: str) -> tuple[dict, list[dict]]:
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        header = json.loads(f.readline())
+        events = [json.loads(line) for line in f if line.strip()]
+    return header, events
+
+def _is_anchor(e: dict) -> bool:
+    """Bridge → agent text messages the agent's replies depend on (not KeepAlive)."""
+    return e["d"] == "ag_out" and "text" in e and '"KeepAlive"' not in e["text"]
+
+def _json(e: dict) -> dict:
+    try:
+        return json.loads(e.get("text") or "{}")
+    except ValueError:
+        return {}
+
+def turn_latencies(events: list[dict]) -> list[tuple[str, float]]:
+    """Per-turn bridge latencies (ms) from a capture-format event log, in order."""
+    out = []
+    pending_fc: dict[str, tuple[float, str]] = {}
+    speaking, audio_t = False, None
+    for e in sorted(events, key=lambda e: e["t"]):
+        d = e["d"]
+        if d == "ag_in":
+            if "text" in e:
+                evt = _json(e)
+                if evt.get("type") == "FunctionCallRequest":
+                    for fc in evt.get("functions") or []:
+                        pending_fc[fc.get("id")] = (e["t"], fc.get("name"))
+                elif evt.get("type") == "AgentStartedSpeaking":
+                    speaking, audio_t = True, None
+            elif speaking and audio_t is None:
+                audio_t = e["t"]
+        elif d == "tw_out" and e.get("event") == "media" and audio_t is not None:
+            out.append(("speech", (e["t"] - audio_t) * 1000))
+            speaking, audio_t = False, None
+        elif d == "ag_out" and "text" in e:
+            evt = _json(e)
+            if evt.get("type") == "FunctionCallResponse" and evt.get("id") in pending_fc:
+                t0, name = pending_fc.pop(evt["id"])
+                out.append((f"fn:{name}", (e["t"] - t0) * 1000))
+    return out
+
+class MockAgent:
+    """Plays each recorded agent session back, paced by the bridge's anchors."""
+    def __init__(self, events: list[dict], speed: float):
+        self.speed = speed
+        self.sessions: dict[int, list[dict]] = {}
+        for e in events:
+            if e["d"] in ("ag_in", "ag_out", "ag_closed"):
+                self.sessions.setdefault(e.get("s", 0), []).append(e)
+        self._next = 0
+        self.diverged = 0
+
+    def _plan(self, session: list[dict]) -> list[tuple[int, float, dict]]:
+        """(anchor index, delay after it, message) for every agent → bridge message."""
+        plan, anchors, last_t = [], 0, session[0]["t"] if session else 0.0
+        start_t = last_t
+        for e in session:
+            if _is_anchor(e):
+                anchors += 1
+                last_t = e["t"]
+            elif e["d"] in ("ag_in", "ag_closed"):
+                plan.append((anchors, e["t"] - (last_t if anchors else start_t), e))
+        return plan
+
+    async def handler(self, ws):
+        s = self._next
+        self._next += 1
+        session = self.sessions.get(s, [])
+        plan = self._plan(session)
+        anchor_at = [time.perf_counter()]          # index 0 = connection open
+        got_anchor = asyncio.Event()
+
+        async def reader():
+            async for msg in ws:
+                if isinstance(msg, str) and _is_anchor({"d": "ag_out", "text": msg}):
+                    anchor_at.append(time.perf_counter())
+                    got_anchor.set()
+
+        rtask = asyncio.create_task(reader())
+        try:
+            for anchor, delay, e in plan:
+                while len(anchor_at) <= anchor:
+                    got_anchor.clear()
+                    try:
+                        await asyncio.wait_for(got_anchor.wait(), ANCHOR_TIMEOUT_S)
+                    except asyncio.TimeoutError:
+                        self.diverged += 1
+                        anchor_at.append(time.perf_counter())
+                due = anchor_at[anchor] + delay / self.speed
+                await asyncio.sleep(max(0.0, due - time.perf_counter()))
+                if e["d"] == "ag_closed":
+                    await ws.close(e.get("code") or 1000, "replayed drop")
+                    break
+                await ws.send(base64.b64decode(e["bin"]) if "bin" in e else e["text"])
+            await rtask
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            rtask.cancel()
+
+async def fake_twilio(url: str, events: list[dict], speed: float):
+    """Sends the recorded Twilio side at recorded times (and drains what the bridge sends)."""
+    tw_in = [e for e in events if e["d"] == "tw_in"]
+    async with websockets.connect(url, max_size=2**24) as ws:
+        async def reader():
+            async for _ in ws:
+                pass
+
+        rtask = asyncio.create_task(reader())
+        t0 = time.perf_counter() - (tw_in[0]["t"] / speed if tw_in else 0)
+        for e in tw_in:
+            await asyncio.sleep(max(0.0, t0 + e["t"] / speed - time.perf_counter()))
+            await ws.send(e["text"])
+        await asyncio.sleep(0.5)
+        rtask.cancel()
+
+async def _wait_for_capture(path: str, timeout: float = 10.0) -> list[dict]:
+    """The bridge writes its capture after hangup; wait for it."""
+    deadline = time.perf_counter() + timeout
+    while not os.path.exists(path):
+        if time.perf_counter() > deadline:
+            raise SystemExit(f"replay capture {path} never appeared")
+        await asyncio.sleep(0.05)
+    return load(path)[1]
+
+async def replay_one(path: str, args, app: AppServer) -> dict:
+    header, events = load(path)
+    agent = MockAgent(events, args.speed)
+    server = await websockets.serve(agent.handler, "127.0.0.1", args.agent_port,
+                                    subprotocols=["token"], max_size=2**24)
+    try:
+        await fake_twilio(f"ws://127.0.0.1:{app.port}/twilio", events, args.speed)
+        name = header.get("stream_sid") or "call"
+        replay_events = await _wait_for_capture(os.path.join(os.environ["CAPTURE_DIR"], f"{name}.jsonl.gz"))
+        os.remove(os.path.join(os.environ["CAPTURE_DIR"], f"{name}.jsonl.gz"))
+    finally:
+        server.close()
+        await server.wait_closed()
+    recorded = turn_latencies(events)
+    replayed = turn_latencies(replay_events)
+    return {"capture": os.path.basename(path), "stream_sid": header.get("stream_sid"),
+            "speed": args.speed, "diverged_waits": agent.diverged,
+            "turns": [{"turn": i + 1, "kind": (replayed[i] if i < len(replayed) else recorded[i])[0],
+                       "recorded_ms": round(recorded[i][1], 1) if i < len(recorded) else None,
+                       "replay_ms": round(replayed[i][1], 1) if i < len(replayed) else None}
+                      for i in range(max(len(recorded), len(replayed)))]}
+
+def _print(result: dict):
+    print(f"🎞️ {result['capture']} (speed x{result['speed']:g}"
+          + (f", {result['diverged_waits']} diverged wait(s)" if result["diverged_waits"] else "") + ")")
+    print(f"{'turn':>5}  {'kind':<28} {'recorded_ms':>12} {'replay_ms':>10}")
+    for t in result["turns"]:
+        print(f"{t['turn']:>5}  {t['kind']:<28} {str(t['recorded_ms']):>12} {str(t['replay_ms']):>10}")
+    for kind in ("fn", "speech"):
+        rec = [t["recorded_ms"] for t in result["turns"] if t["kind"].startswith(kind) and t["recorded_ms"] is not None]
+        rep = [t["replay_ms"] for t in result["turns"] if t["kind"].startswith(kind) and t["replay_ms"] is not None]
+        if rec or rep:
+            print(f"       {kind:<6} p50 {_pct(rec, 50)} → {_pct(rep, 50)}   p95 {_pct(rec, 95)} → {_pct(rep, 95)}")
+
+async def main_async(args):
+    app = AppServer(args.app_port)
+    app.start()
+    results = []
+    try:
+        for path in args.captures:
+            results.append(await replay_one(path, args, app))
+            _print(results[-1])
+    finally:
+        app.stop()
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"📄 Wrote {args.json}")
+
+def main():
+    ap = argparse.ArgumentParser(description="Replay captured calls against this build")
+    ap.add_argument("captures", nargs="+", help="capture files (app/captures/*.jsonl.gz)")
+    ap.add_argument("--speed", type=float, default=1.0, help="1 = real time, 4 = four times faster")
+    ap.add_argument("--app-port", type=int, default=8801)
+    ap.add_argument("--agent-port", type=int, default=8766)
+    ap.add_argument("--json", help="write per-turn results here")
+    args = ap.parse_args()
+
+    # Must be set before app.settings is imported
+    os.environ["DG_AGENT_URL"] = f"ws://127.0.0.1:{args.agent_port}"
+    os.environ.setdefault("DEEPGRAM_API_KEY", "replay")
+    os.environ["VOICE_HOST"] = f"localhost:{args.app_port}"
+    # the replay is captured (same taps as the recording) into a throwaway dir
+    os.environ["CAPTURE_CALLS"] = "1"
+    os.environ["CAPTURE_DIR"] = scratch = tempfile.mkdtemp(prefix="replay-")
+    os.environ["GREETING_CACHE"] = "0"     # the recorded agent speaks the recorded greeting
+    # replayed orders land in the same throwaway dir, never app/orders.json
+    os.environ["ORDERS_PATH"] = os.path.join(scratch, "orders.json")
+    os.environ["ORDERS_ARCHIVE_DIR"] = os.path.join(scratch, "archive")
+    os.environ["ANALYTICS_PATH"] = os.path.join(scratch, "analytics.json")
+    os.environ["PENDING_SNAPSHOT_PATH"] = os.path.join(scratch, "pending_orders.snapshot.json")
+    asyncio.run(main_async(args))
+
+if __name__ == "__main__":
+    main()
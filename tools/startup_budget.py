@@ -0,0 +1,137 @@
+# tools/startup_budget.py
+"""
+Cold-start budget check: how long `import app.main` takes, and (with
+--serve) how long a fresh uvicorn takes until /ready answers 200.
+
+    python -m tools.startup_budget
+    python -m tools.startup_budget --import-budget-ms 800 --serve --ready-budget-ms 2500
+
+Imports are timed with `python -X importtime` in a fresh interpreter,
+best of --runs. The slowest modules (cumulative) are listed. Exits 1 if:
+- the import of app.main is over --import-budget-ms
+- a module that should load lazily (twilio, requests, python-dotenv
+  without a .env) was imported at startup
+- with --serve, /ready took longer than --ready-budget-ms from spawn
+
+Set `DEEPGRAM_API_KEY` or a dummy is used; nothing is called.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# module → why it must not be imported at startup
+LAZY = {
+    "twilio": "SMS client is built in warmup / on first SMS (send_sms._twilio)",
+    "requests": "only used by twilio",
+    "dotenv": "only loaded when a .env exists (settings._load_dotenv)",
+}
+
+def _env(**extra) -> dict:
+    env = {**os.environ, **extra}
+    env.setdefault("DEEPGRAM_API_KEY", "startup-budget")
+    return env
+
+def import_times(runs: int) -> tuple[float, list[tuple[float, float, str]]]:
+    """Best-of-runs app.main import (ms), and that run's (self_ms, cumulative_ms, module) rows."""
+    best, best_rows = float("inf"), []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app.main"],
+                             cwd=ROOT, env=_env(), capture_output=True, text=True, check=True).stderr
+        rows = []
+        for line in out.splitlines():
+            if not line.startswith("import time:") or "|" not in line:
+                continue
+            self_us, cum_us, name = line[len("import time:"):].split("|", 2)
+            if not self_us.strip().isdigit():
+                continue   # header line
+            rows.append((int(self_us) / 1000, int(cum_us) / 1000, name.strip()))
+        total = next((cum for _, cum, name in rows if name == "app.main"), None)
+        if total is not None and total < best:
+            best, best_rows = total, rows
+    return best, best_rows
+
+def time_to_ready(port: int, timeout: float) -> tuple[float | None, float | None]:
+    """Spawn uvicorn; ms until the port accepts and until /ready is 200 (None = never)."""
+    scratch = tempfile.mkdtemp(prefix="startup-")
+    env = _env(ANALYTICS_PATH=os.path.join(scratch, "analytics.json"),
+               ORDERS_ARCHIVE_DIR=os.path.join(scratch, "archive"), TRANSCRIPTS="0",
+               ORDERS_PATH=os.path.join(scratch, "orders.json"),
+               PENDING_SNAPSHOT_PATH=os.path.join(scratch, "pending_orders.snapshot.json"))
+    t0 = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+                            cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    up_ms = ready_ms = None
+    try:
+        while time.perf_counter() - t0 < timeout and proc.poll() is None:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/ready", timeout=1) as r:
+                    if r.status == 200:
+                        ready_ms = (time.perf_counter() - t0) * 1000
+                        if up_ms is None:
+                            up_ms = ready_ms
+                        break
+            except urllib.error.HTTPError:        # 503: up, not warm yet
+                if up_ms is None:
+                    up_ms = (time.perf_counter() - t0) * 1000
+            except OSError:
+                pass
+            time.sleep(0.01)
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+    return up_ms, ready_ms
+
+def main():
+    ap = argparse.ArgumentParser(description="Check app cold-start time against a budget")
+    ap.add_argument("--import-budget-ms", type=float, default=800)
+    ap.add_argument("--runs", type=int, default=3)
+    ap.add_argument("--top", type=int, default=15, help="slowest modules to list")
+    ap.add_argument("--serve", action="store_true", help="also time a uvicorn start until /ready is 200")
+    ap.add_argument("--ready-budget-ms", type=float, default=2500)
+    ap.add_argument("--port", type=int, default=8802)
+    args = ap.parse_args()
+
+    failed = False
+    total, rows = import_times(args.runs)
+    print(f"📦 import app.main: {total:.0f}ms (best of {args.runs}, budget {args.import_budget_ms:.0f}ms)")
+    print(f"{'cumulative_ms':>14} {'self_ms':>8}  module")
+    for self_ms, cum, name in sorted(rows, key=lambda r: r[1], reverse=True)[:args.top]:
+        print(f"{cum:>14.1f} {self_ms:>8.1f}  {name}")
+    if total > args.import_budget_ms:
+        print(f"❌ Import over budget by {total - args.import_budget_ms:.0f}ms")
+        failed = True
+
+    has_env = os.path.isfile(os.path.join(ROOT, ".env"))
+    loaded = {name.split(".")[0] for _, _, name in rows}
+    for mod, why in LAZY.items():
+        if mod == "dotenv" and has_env:
+            continue
+        if mod in loaded:
+            print(f"❌ {mod} imported at startup ({why})")
+            failed = True
+
+    if args.serve:
+        up_ms, ready_ms = time_to_ready(args.port, timeout=max(30.0, args.ready_budget_ms / 1000 * 3))
+        print(f"🚀 uvicorn: listening {up_ms and round(up_ms)}ms, /ready 200 at {ready_ms and round(ready_ms)}ms "
+              f"(budget {args.ready_budget_ms:.0f}ms)")
+        if ready_ms is None or ready_ms > args.ready_budget_ms:
+            print("❌ Not ready within budget")
+            failed = True
+
+    if failed:
+        sys.exit(1)
+    print("✅ Within budget")
+
+if __name__ == "__main__":
+    main()
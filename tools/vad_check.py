@@ -0,0 +1,145 @@
+# tools/vad_check.py
+"""
+Regression check for the inbound VAD gate (app/vad.py).
+
+Runs caller audio through the inbound path twice: ungated (every frame
+resampled to linear16@48k, as sent to the agent) and gated. Then checks:
+- every speech frame (RMS above --speech-rms) is forwarded
+- the pre-roll before each speech onset is forwarded
+- the STT input around speech is byte-identical to the ungated stream
+  (the first frame of each forwarded run is skipped: it is pre-roll and
+  starts from a stale resampler state)
+
+Input is caller-leg WAVs from RECORD_CALLS=1 (linear16 8k mono), or a
+synthetic call (noise + speech-like bursts) when no file is given.
+
+    python -m tools.vad_check
+    python -m tools.vad_check app/recordings/MZ..._caller.wav --speech-rms 500
+
+Exits 1 if any check fails.
+"""
+
+import argparse
+import audioop
+import math
+import os
+import random
+import sys
+import time
+import wave
+
+# Must be set before app.settings is imported (it refuses to load without a key)
+os.environ.setdefault("DEEPGRAM_API_KEY", "vad-check")
+
+from app.audio import SAMPLE_WIDTH, TWILIO_FRAME_BYTES, ulaw8k_to_lin16_48k  # noqa: E402
+from app.vad import VadGate, FRAME_MS  # noqa: E402
+from app.settings import VAD_MIN_RMS, VAD_PREROLL_MS  # noqa: E402
+
+def synthetic_call(seed: int = 7) -> bytes:
+    """~10s of line noise with three speech-like bursts, as linear16 8k."""
+    rnd = random.Random(seed)
+    segments = [("noise", 1.0), ("speech", 1.2), ("noise", 3.0), ("speech", 0.6),
+                ("noise", 0.4), ("speech", 0.9), ("noise", 2.5)]
+    out = bytearray()
+    t = 0
+    for kind, secs in segments:
+        for _ in range(int(secs * 8000)):
+            v = rnd.gauss(0, 60)
+            if kind == "speech":
+                env = 0.5 + 0.5 * math.sin(2 * math.pi * 4 * t / 8000)   # syllable-rate envelope
+                v += 6000 * env * (math.sin(2 * math.pi * 180 * t / 8000) + 0.4 * math.sin(2 * math.pi * 720 * t / 8000))
+            out += int(max(-32768, min(32767, v))).to_bytes(2, "little", signed=True)
+            t += 1
+    return bytes(out)
+
+def load_wav(path: str) -> bytes:
+    with wave.open(path, "rb") as w:
+        if w.getframerate() != 8000 or w.getsampwidth() != SAMPLE_WIDTH or w.getnchannels() != 1:
+            raise SystemExit(f"{path}: expected 8 kHz 16-bit mono (caller leg)")
+        return w.readframes(w.getnframes())
+
+def to_frames(lin8k: bytes) -> list[bytes]:
+    ulaw = audioop.lin2ulaw(lin8k, SAMPLE_WIDTH)
+    n = len(ulaw) - len(ulaw) % TWILIO_FRAME_BYTES
+    return [ulaw[i:i + TWILIO_FRAME_BYTES] for i in range(0, n, TWILIO_FRAME_BYTES)]
+
+def check(frames: list[bytes], speech_rms: int) -> tuple[list[str], dict]:
+    # Ungated: what the agent receives today
+    t0 = time.perf_counter()
+    state, ref = None, []
+    for f in frames:
+        out, state = ulaw8k_to_lin16_48k(f, state)
+        ref.append(out)
+    ungated_s = time.perf_counter() - t0
+
+    # Gated: which frames get through, and what they resample to
+    index = {id(f): i for i, f in enumerate(frames)}
+    gate = VadGate()
+    t0 = time.perf_counter()
+    state, sent, run_starts = None, {}, set()
+    for n, f in enumerate(frames):
+        passed = gate.push(f)
+        if not passed:
+            gate.keepalive_due(now=n * FRAME_MS / 1000)
+        for g in passed:
+            i = index[id(g)]
+            if i - 1 not in sent:
+                run_starts.add(i)
+            sent[i], state = ulaw8k_to_lin16_48k(g, state)
+    gated_s = time.perf_counter() - t0
+
+    failures = []
+    speech = [i for i, f in enumerate(frames)
+              if audioop.rms(audioop.ulaw2lin(f, SAMPLE_WIDTH), SAMPLE_WIDTH) > speech_rms]
+    missed = [i for i in speech if i not in sent]
+    if missed:
+        failures.append(f"{len(missed)} speech frame(s) not forwarded, first at {missed[0] * FRAME_MS}ms")
+
+    preroll = VAD_PREROLL_MS // FRAME_MS
+    speech_set = set(speech)
+    for i in speech:
+        if i - 1 in speech_set:
+            continue
+        lost = [k for k in range(max(0, i - preroll), i) if k not in sent]
+        if lost:
+            failures.append(f"onset at {i * FRAME_MS}ms: {len(lost)} pre-roll frame(s) missing")
+
+    differ = [i for i, out in sent.items() if i not in run_starts and out != ref[i]]
+    if differ:
+        failures.append(f"{len(differ)} forwarded frame(s) differ from ungated STT input, "
+                        f"first at {differ[0] * FRAME_MS}ms")
+
+    report = {
+        **gate.summary(),
+        "speech_frames": len(speech),
+        "upstream_bytes_ungated": sum(len(x) for x in ref),
+        "upstream_bytes_gated": sum(len(x) for x in sent.values()),
+        "ungated_us_per_frame": round(ungated_s * 1e6 / max(1, len(frames)), 2),
+        "gated_us_per_frame": round(gated_s * 1e6 / max(1, len(frames)), 2),
+    }
+    return failures, report
+
+def main():
+    ap = argparse.ArgumentParser(description="Check the VAD gate leaves STT input around speech unchanged")
+    ap.add_argument("wavs", nargs="*", help="caller-leg WAVs (8 kHz linear16 mono)")
+    ap.add_argument("--speech-rms", type=int, default=VAD_MIN_RMS * 2,
+                    help="frames above this RMS count as speech that must be forwarded")
+    args = ap.parse_args()
+
+    inputs = [(p, load_wav(p)) for p in args.wavs] or [("synthetic", synthetic_call())]
+    failed = False
+    for name, lin8k in inputs:
+        failures, r = check(to_frames(lin8k), args.speech_rms)
+        saved = 1 - r["upstream_bytes_gated"] / max(1, r["upstream_bytes_ungated"])
+        print(f"🎚️ {name}: {r['frames_in']} frames, {r['speech_frames']} speech, "
+              f"{r['frames_sent']} sent ({saved:.0%} less upstream), {r['onsets']} onset(s), "
+              f"{r['keepalives']} keepalive(s); {r['ungated_us_per_frame']} → {r['gated_us_per_frame']} µs/frame")
+        for msg in failures:
+            print(f"   ❌ {msg}")
+        failed |= bool(failures)
+    if failed:
+        sys.exit(1)
+    print("✅ STT input unchanged around speech")
+
+if __name__ == "__main__":
+    main()